@@ -0,0 +1,4 @@
+""" Confiture's benchmark suite.
+
+Run it using ``python -m benchmarks``, see ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,213 @@
+""" Run the benchmarks and compare results.
+
+Usage::
+
+    python -m benchmarks run --output before.json
+    (... hack ...)
+    python -m benchmarks run --output after.json
+    python -m benchmarks compare before.json after.json
+"""
+
+import gc
+import sys
+import json
+import time
+import pickle
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+from confiture.parser import ConfitureLexer, ConfitureParser, yacc
+from confiture.tracing import count_nodes
+from confiture.writer import dumps
+
+from benchmarks.generators import GENERATORS, include_fanout
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def measure(func, repeat):
+    """ Run func repeat times and return timing statistics (in seconds).
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = timer()
+        func()
+        timings.append(timer() - start)
+    return {'best': min(timings), 'mean': sum(timings) / len(timings),
+            'repeat': repeat}
+
+
+def lex(text):
+    lexer = ConfitureLexer()
+    lexer.input(text)
+    while lexer.token() is not None:
+        pass
+
+
+def parse(text):
+    # Like Confiture: tables are not written, nor debug output logged
+    parser = ConfitureParser(text, debug=False, write_tables=False,
+                             errorlog=yacc.NullLogger())
+    return parser.parse()
+
+
+def memory(text, schema):
+    """ Measure the memory used by the tree of a configuration, and the peak
+        allocation during parsing and validation.
+    """
+    gc.collect()
+    tracemalloc.start()
+    tree = parse(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    gc.collect()  # Only keep the memory used by the tree
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    validated = schema.validate(tree)
+    validate_peak = tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    nodes = count_nodes(tree)
+    return {'nodes': nodes, 'tree_bytes': current, 'peak_bytes': peak,
+            'validate_peak_bytes': validate_peak,
+            'report_bytes': validated.memory_report()['total'],
+            'bytes_per_node': current / float(nodes)}
+
+
+def collection(text, schema, repeat):
+    """ Measure the time of a full garbage collection with the validated
+        tree of a configuration loaded, as is, frozen with
+        ConfigSection.freeze, and after gc.freeze.
+    """
+    results = {}
+    tree = schema.validate(parse(text))
+    results['gc_collect'] = measure(gc.collect, repeat)
+    tree = tree.freeze()
+    results['gc_collect_frozen'] = measure(gc.collect, repeat)
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+        try:
+            results['gc_collect_freeze'] = measure(gc.collect, repeat)
+        finally:
+            gc.unfreeze()
+    del tree
+    return results
+
+
+def import_time():
+    """ Measure the import time of confiture in a new interpreter.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import confiture'],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in output.splitlines():
+        if line.rstrip().endswith('| confiture'):
+            return {'cumulative_us': int(line.split('|')[1])}
+
+
+def run(args):
+    results = {}
+    for name, generator in sorted(GENERATORS.items()):
+        if args.filter and args.filter not in name:
+            continue
+        defaults = generator.__defaults__
+        size = max(1, int(defaults[0] * args.scale))
+        text, schema = generator(size)
+        tree = parse(text)
+        validated = schema.validate(tree)
+        results[name + '.lex'] = measure(lambda: lex(text), args.repeat)
+        results[name + '.parse'] = measure(lambda: parse(text), args.repeat)
+        results[name + '.validate'] = measure(lambda: schema.validate(tree), args.repeat)
+        results[name + '.to_dict'] = measure(validated.to_dict, args.repeat)
+        results[name + '.dump'] = measure(lambda: dumps(tree), args.repeat)
+        # Pickling (to send trees to worker processes) against parse:
+        pickled = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+        results[name + '.pickle'] = measure(
+            lambda: pickle.dumps(tree, pickle.HIGHEST_PROTOCOL), args.repeat)
+        results[name + '.pickle']['pickle_bytes'] = len(pickled)
+        results[name + '.unpickle'] = measure(lambda: pickle.loads(pickled), args.repeat)
+        results[name + '.memory'] = memory(text, schema)
+        for key, result in collection(text, schema, args.repeat).items():
+            results[name + '.' + key] = result
+        sys.stderr.write('%s done\n' % name)
+    if not args.filter or args.filter in 'include_fanout.parse':
+        directory = tempfile.mkdtemp()
+        try:
+            files = max(1, int(500 * args.scale))
+            text, schema = include_fanout(directory, files=files)
+            results['include_fanout.parse'] = measure(lambda: parse(text), args.repeat)
+        finally:
+            shutil.rmtree(directory)
+        sys.stderr.write('include_fanout done\n')
+    if not args.filter or args.filter in 'import':
+        results['import'] = import_time()
+    output = {'python': platform.python_version(),
+              'timestamp': time.time(),
+              'scale': args.scale,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as foutput:
+            json.dump(output, foutput, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+
+# Metrics compared between two runs, lower is better for all of them:
+COMPARED_METRICS = ('best', 'bytes_per_node', 'peak_bytes', 'validate_peak_bytes',
+                    'report_bytes', 'pickle_bytes', 'cumulative_us')
+
+
+def compare(args):
+    with open(args.old) as fold:
+        old = json.load(fold)['results']
+    with open(args.new) as fnew:
+        new = json.load(fnew)['results']
+    regressions = 0
+    print('%-28s %-15s %14s %14s %8s' % ('benchmark', 'metric', 'old', 'new', 'ratio'))
+    for name in sorted(set(old) & set(new)):
+        for metric in COMPARED_METRICS:
+            if metric not in old[name] or metric not in new[name]:
+                continue
+            ratio = new[name][metric] / float(old[name][metric] or 1)
+            flag = ''
+            if ratio > 1 + args.threshold:
+                flag = ' !'
+                regressions += 1
+            print('%-28s %-15s %14.6g %14.6g %7.2fx%s' % (name, metric, old[name][metric],
+                                                           new[name][metric], ratio, flag))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--scale', type=float, default=1.0,
+                            help='scale factor applied to generated configs')
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='number of runs for each benchmark')
+    run_parser.add_argument('--filter', help='only run benchmarks matching')
+    run_parser.add_argument('--output', help='file where to write results (JSON)')
+    compare_parser = subparsers.add_parser('compare', help='compare two results')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='ratio above which a result is a regression')
+    args = parser.parse_args()
+    if args.command == 'run':
+        return run(args)
+    elif args.command == 'compare':
+        return compare(args)
+    else:
+        parser.print_help()
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
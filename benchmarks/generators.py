@@ -0,0 +1,104 @@
+""" Synthetic configuration generators used by benchmarks.
+
+Each generator return the text of a configuration and the schema used to
+validate it.
+"""
+
+import os
+
+from confiture.schema.containers import Section, Value, List, many
+from confiture.schema.types import Integer, Float, String, Boolean
+
+
+def wide(keys=10000):
+    """ A single section with a lot of keys.
+    """
+    lines = []
+    schema = Section()
+    for i in range(keys):
+        kind = i % 4
+        if kind == 0:
+            lines.append('key_%d = %d' % (i, i))
+            schema.add('key_%d' % i, Value(Integer()))
+        elif kind == 1:
+            lines.append('key_%d = %d.5' % (i, i))
+            schema.add('key_%d' % i, Value(Float()))
+        elif kind == 2:
+            lines.append('key_%d = "value %d"' % (i, i))
+            schema.add('key_%d' % i, Value(String()))
+        else:
+            lines.append('key_%d = yes' % i)
+            schema.add('key_%d' % i, Value(Boolean()))
+    return '\n'.join(lines) + '\n', schema
+
+
+def deep(depth=200):
+    """ Sections nested at a deep level.
+    """
+    lines = []
+    schema = top = Section()
+    for i in range(depth):
+        lines.append('    ' * i + 'level {')
+        lines.append('    ' * (i + 1) + 'value = %d' % i)
+        child = Section()
+        child.add('value', Value(Integer()))
+        schema.add('level', child)
+        schema = child
+    for i in range(depth - 1, -1, -1):
+        lines.append('    ' * i + '}')
+    return '\n'.join(lines) + '\n', top
+
+
+def long_list(items=100000):
+    """ A list with a lot of items.
+    """
+    values = ',\n    '.join(str(i) for i in range(items))
+    schema = Section()
+    schema.add('values', List(Integer()))
+    return 'values = %s\n' % values, schema
+
+
+class _BackendSection(Section):
+
+    host = Value(String())
+    port = Value(Integer())
+    weight = Value(Float(), default=1.0)
+    tags = List(String(), default=[])
+    _meta = {'args': Value(String()), 'repeat': many, 'unique': True}
+
+
+class _RepeatedSchema(Section):
+
+    backend = _BackendSection()
+
+
+def repeated(sections=5000):
+    """ A lot of repeated sections with arguments.
+    """
+    lines = []
+    for i in range(sections):
+        lines.append('backend "backend-%d" {' % i)
+        lines.append('    host = "10.0.%d.%d"' % (i // 256 % 256, i % 256))
+        lines.append('    port = %d' % (1024 + i % 60000))
+        lines.append('    weight = %d.5' % (i % 10))
+        lines.append('    tags = "a", "b", "c"')
+        lines.append('}')
+    return '\n'.join(lines) + '\n', _RepeatedSchema()
+
+
+def include_fanout(directory, files=500, sections=10):
+    """ A configuration including a lot of files (written in directory).
+    """
+    for i in range(files):
+        text, _ = repeated(sections)
+        text = text.replace('"backend-', '"backend-%d-' % i)
+        with open(os.path.join(directory, 'part-%04d.conf' % i), 'w') as fpart:
+            fpart.write(text)
+    locator = os.path.join(directory, 'part-*.conf')
+    return 'include "%s"\n' % locator, _RepeatedSchema()
+
+
+GENERATORS = {'wide': wide,
+              'deep': deep,
+              'long_list': long_list,
+              'repeated': repeated}
@@ -2,30 +2,121 @@
 """
 
 
-from confiture.parser import ConfitureParser, yacc
+import sys
+import time
+
+from confiture.schema import ValidationContext
+
+
+__all__ = ['Confiture', 'ConfitureParser', 'yacc']
+
+# Names of the parser module available from this module:
+_PARSER_NAMES = ('ConfitureParser', 'yacc')
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ is not supported, the parser is imported eagerly:
+    from confiture.parser import ConfitureParser, yacc
+
+timer = getattr(time, 'perf_counter', time.time)
 
 
 class Confiture(object):
 
-    def __init__(self, config, schema=None, input_name='<unknown>'):
+    """ Configuration loader.
+
+    :param config: the configuration text
+    :param schema: the schema used to validate the configuration
+    :param input_name: name of the configuration used in error positions
+    :param argparse_args: argparse namespace of overriding values
+    :param tracer: a :class:`confiture.tracing.Tracer` receiving statistics
+        about each phase of the load
+    :param profiler: a :class:`confiture.schema.profiler.ValidationProfiler`
+        recording the time spent to validate each key and type
+    :param freeze: return an immutable :class:`confiture.tree.FrozenSection`
+        mostly made of objects untracked by the garbage collector
+    :param interpolate: replace ``${path.to.key}`` references in values by
+        the referenced values before the validation (see
+        :mod:`confiture.interpolation`)
+    :param external_opener: the opener used for included files (see
+        :class:`confiture.parser.ExternalOpener`)
+    :param limits: the :class:`confiture.parser.Limits` of the resources
+        used to parse the configuration
+    """
+
+    def __init__(self, config, schema=None, input_name='<unknown>',
+                 argparse_args=None, tracer=None, profiler=None, freeze=False,
+                 interpolate=False, external_opener=None, limits=None):
         self._config = config
         self._schema = schema
         self._input_name = input_name
+        self._argparse_args = argparse_args
+        self._tracer = tracer
+        self._profiler = profiler
+        self._freeze = freeze
+        self._interpolate = interpolate
+        self._external_opener = external_opener
+        self._limits = limits
 
     @classmethod
     def from_filename(cls, filename, **kwargs):
-        fconf = open(filename, 'Ur')
+        start = timer()
+        with open(filename, 'rU' if sys.version_info[0] < 3 else 'r') as fconf:
+            config = fconf.read()
+        if kwargs.get('tracer') is not None:
+            kwargs['tracer'].phase('read', timer() - start)
         kwargs['input_name'] = filename
-        return cls(fconf.read(), **kwargs)
+        return cls(config, **kwargs)
 
     def _parse(self):
+        # The parser is imported on first use since the ply import is slow:
+        from confiture.parser import ConfitureParser, yacc
+        kwargs = {}
+        if self._external_opener is not None:
+            kwargs['external_opener'] = self._external_opener
+        if self._limits is not None:
+            kwargs['limits'] = self._limits
         parser = ConfitureParser(self._config, debug=False, write_tables=False,
-                               errorlog=yacc.NullLogger(), input_name=self._input_name)
+                               errorlog=yacc.NullLogger(), input_name=self._input_name,
+                               tracer=self._tracer, **kwargs)
 
         return parser.parse()
 
+    def _validate(self, config):
+        context = ValidationContext(argparse_args=self._argparse_args,
+                                    profiler=self._profiler)
+        if self._tracer is None:
+            return self._schema.validate(config, context)
+        start = timer()
+        with context:  # Count the cache lookups of this validation only
+            config = self._schema.validate(config, context)
+        self._tracer.phase('validate', timer() - start)
+        self._tracer.count('cache_hits', context.cache_hits)
+        self._tracer.count('cache_misses', context.cache_misses)
+        return config
+
     def parse(self):
         config = self._parse()
+        if self._interpolate:
+            from confiture.interpolation import interpolate
+            interpolate(config)
+        if self._tracer is not None:
+            from confiture.tracing import count_nodes
+            self._tracer.count('nodes', count_nodes(config))
         if self._schema is not None:
-            config = self._schema.validate(config)
+            config = self._validate(config)
+        if self._freeze:
+            config = config.freeze()
         return config
+
+
+def __getattr__(name):
+    # Keep the parser names available from this module, without importing
+    # the parser with it (Python 3.7 and later):
+    if name in _PARSER_NAMES:
+        import confiture.parser
+        return getattr(confiture.parser, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_PARSER_NAMES))
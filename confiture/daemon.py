@@ -0,0 +1,480 @@
+""" A daemon serving a configuration to local processes over a Unix socket.
+
+The daemon loads and validates the configuration once, watches its files for
+changes, and answers path queries. Clients cache the answers and revalidate
+them using the version of the configuration, incremented on each reload.
+
+Protocol: each message is a frame made of its size (unsigned 32 bits integer,
+little-endian) followed by the payload. Requests payloads are an operation
+code (one byte), the version known by the client (32 bits, 0 if unknown) and
+the queried path (UTF-8). Responses payloads are a status (one byte), the
+current version (32 bits) and the data of the response:
+
+- ``G`` operation (get): the response status is ``V`` (found) with a safe
+  snapshot (see :mod:`confiture.snapshot`) of a section containing the
+  queried child (values which are not strings, numbers, booleans or lists are
+  sent as strings, nothing is pickled),
+  ``N`` (not modified) if the version of the client is the current version,
+  ``M`` (missing) if the path does not exist, or ``E`` (error) with the
+  error message
+- ``S`` operation (status): the response status is ``V`` without data
+
+Paths are dot separated names of subsections, and of a value or section as
+last component. A section with arguments can be selected using
+``name[arg]`` (arguments are joined by commas).
+
+Usage::
+
+    python -m confiture.daemon serve --socket /run/app.sock --schema app.schema:AppSchema /etc/app.conf
+    python -m confiture.daemon get --socket /run/app.sock database.host
+"""
+
+import os
+import sys
+import stat
+import time
+import errno
+import signal
+import socket
+import struct
+import logging
+import threading
+
+from confiture.tree import ConfigSection, _parse_path_segment, _format_path_args
+from confiture.handle import ConfigHandle
+from confiture.snapshot import Snapshot, dumps
+
+
+logger = logging.getLogger('confiture.daemon')
+
+_SIZE = struct.Struct('<I')
+_HEADER = struct.Struct('<cI')
+
+GET = b'G'
+STATUS = b'S'
+FOUND = b'V'
+NOT_MODIFIED = b'N'
+MISSING = b'M'
+ERROR = b'E'
+
+timer = getattr(time, 'monotonic', time.time)
+
+
+class QueryError(Exception):
+    """ Exception raised when a query can't be answered by the daemon.
+    """
+
+
+class PathNotFoundError(QueryError):
+    """ Exception raised when the queried path does not exist.
+    """
+
+
+def _recv_frame(sock):
+    header = _recv_exactly(sock, _SIZE.size)
+    if header is None:
+        return None
+    size = _SIZE.unpack(header)[0]
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        raise QueryError('connection closed in the middle of a message')
+    return payload
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send_frame(sock, payload):
+    sock.sendall(_SIZE.pack(len(payload)) + payload)
+
+
+def resolve(config, path):
+    """ Resolve a path in a configuration.
+
+    Return a section containing the child designated by the path (a value, a
+    section or all the sections with this name), and the name of the child.
+    """
+    segments = path.split('.')
+    section = config
+    for index, segment in enumerate(segments):
+        parsed = _parse_path_segment(segment)
+        if parsed is None:
+            raise QueryError('bad path component %r' % segment)
+        name, args = parsed
+        last = index == len(segments) - 1
+        value = section.get(name, raw=False)
+        if args is None and last and value is not None:
+            output = ConfigSection('__top__')
+            output.register(value, name=name)
+            return output, name
+        subsections = list(section.subsections(name))
+        if args is not None:
+            subsections = [s for s in subsections if _format_path_args(s.args) == args]
+        if not subsections:
+            raise PathNotFoundError('%s not found' % '.'.join(segments[:index + 1]))
+        if last:
+            output = ConfigSection('__top__')
+            for subsection in subsections:
+                output.register(subsection, name=name)
+            return output, name
+        elif len(subsections) > 1:
+            raise QueryError('%s matches several sections' % '.'.join(segments[:index + 1]))
+        section = subsections[0]
+
+
+class _Watcher(threading.Thread):
+
+    """ Reload the configuration when one of the watched files is modified.
+    """
+
+    def __init__(self, server, filenames, interval):
+        super(_Watcher, self).__init__(name='confiture-watcher')
+        self.daemon = True
+        self.server = server
+        self.filenames = filenames
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.mtimes = self.stat()
+
+    def stat(self):
+        mtimes = {}
+        for filename in self.filenames:
+            try:
+                mtimes[filename] = os.stat(filename).st_mtime
+            except OSError:
+                mtimes[filename] = None
+        return mtimes
+
+    def check(self):
+        mtimes = self.stat()
+        if mtimes != self.mtimes:
+            self.mtimes = mtimes
+            self.server.reload()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+
+class ConfigServer(object):
+
+    """ Serve a configuration over a Unix socket.
+
+    :param socket_path: the path of the Unix socket
+    :param loader: callable returning the validated configuration
+    :param watch: files to watch, the configuration is reloaded when one of
+        them is modified
+    :param interval: interval (in seconds) between two checks of the files
+    """
+
+    def __init__(self, socket_path, loader, watch=(), interval=1.0):
+        self.socket_path = socket_path
+        self._loader = loader
+        # The handle stores the configuration with its version, so both are
+        # read atomically (version 0 means unknown for clients):
+        self._handle = ConfigHandle((1, loader()))
+        self._reload_lock = threading.Lock()
+        self._responses = {}  # Encoded responses of the current version
+        self._responses_lock = threading.Lock()
+        self._watcher = _Watcher(self, list(watch), interval) if watch else None
+        self._socket = None
+        self._threads = []
+        self._stopped = threading.Event()
+
+    @property
+    def version(self):
+        return self._handle.current[0]
+
+    def reload(self):
+        """ Reload the configuration, keep the current one on errors.
+        """
+        with self._reload_lock:
+            try:
+                config = self._loader()
+            except Exception as err:
+                logger.error('Unable to reload the configuration: %s', err)
+                return
+            version = self.version + 1
+            self._handle.swap((version, config))
+        with self._responses_lock:
+            self._responses = {}
+        logger.info('Configuration reloaded (version %d)', version)
+
+    def respond(self, request):
+        """ Compute the response to a request payload.
+        """
+        try:
+            op, client_version = _HEADER.unpack_from(request)
+        except struct.error:
+            return _HEADER.pack(ERROR, 0) + b'bad request'
+        with self._handle.read() as (version, config):
+            if op == STATUS:
+                return _HEADER.pack(FOUND, version)
+            elif op != GET:
+                return _HEADER.pack(ERROR, version) + b'unknown operation'
+            elif client_version == version:
+                return _HEADER.pack(NOT_MODIFIED, version)
+            try:
+                path = request[_HEADER.size:].decode('utf-8')
+            except UnicodeDecodeError:
+                return _HEADER.pack(ERROR, version) + b'bad request'
+            key = (version, path)
+            response = self._responses.get(key)
+            if response is None:
+                try:
+                    output, _ = resolve(config, path)
+                except PathNotFoundError as err:
+                    return _HEADER.pack(MISSING, version) + str(err).encode('utf-8')
+                except QueryError as err:
+                    return _HEADER.pack(ERROR, version) + str(err).encode('utf-8')
+                response = _HEADER.pack(FOUND, version) + dumps(output, safe=True)
+                with self._responses_lock:
+                    if version == self.version:  # Not reloaded meanwhile
+                        self._responses[key] = response
+            return response
+
+    def _serve_connection(self, connection):
+        try:
+            while not self._stopped.is_set():
+                request = _recv_frame(connection)
+                if request is None:
+                    break
+                _send_frame(connection, self.respond(request))
+        except (socket.error, QueryError) as err:
+            logger.debug('Connection error: %s', err)
+        finally:
+            connection.close()
+
+    def start(self):
+        """ Bind the socket and start serving in background threads.
+        """
+        try:
+            mode = os.lstat(self.socket_path).st_mode
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        else:
+            # Only remove the socket left by a previous server:
+            if not stat.S_ISSOCK(mode):
+                raise OSError(errno.EEXIST, 'File exists and is not a socket',
+                              self.socket_path)
+            os.unlink(self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.socket_path)
+        self._socket.listen(128)
+        thread = threading.Thread(target=self._accept, name='confiture-server')
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+        if self._watcher is not None:
+            self._watcher.start()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                connection, _ = self._socket.accept()
+            except socket.error:
+                break
+            thread = threading.Thread(target=self._serve_connection, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def serve_forever(self):
+        """ Start serving and block until the server is stopped.
+        """
+        self.start()
+        while not self._stopped.wait(3600):
+            pass
+
+    def stop(self):
+        """ Stop serving and remove the socket.
+        """
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.stopped.set()
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self._socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        for thread in self._threads:
+            thread.join()
+
+
+class ConfigClient(object):
+
+    """ Query a configuration served by a :class:`ConfigServer`.
+
+    Responses are cached. Cached responses younger than max_age are used as
+    is, older ones are revalidated by sending the cached version to the
+    server, which only answers the full response if the configuration was
+    reloaded meanwhile.
+
+    :param socket_path: the path of the Unix socket of the server
+    :param max_age: time (in seconds) during which cached responses are
+        used without asking the server
+    :param pool_size: maximum number of idle connections kept open
+    :param timeout: timeout (in seconds) of the socket operations
+
+    Usage example::
+
+        >>> client = ConfigClient('/run/app.sock')
+        >>> client.get('database.host')
+        'localhost'
+        >>> [b.args for b in client.get('backend')]
+        [['foo'], ['bar']]
+    """
+
+    def __init__(self, socket_path, max_age=1.0, pool_size=4, timeout=5.0):
+        self.socket_path = socket_path
+        self.max_age = max_age
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._cache = {}  # path -> (version, timestamp, result)
+
+    def _connect(self):
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _release(self, sock):
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(sock)
+                return
+        sock.close()
+
+    def _request(self, op, version=0, path=''):
+        request = _HEADER.pack(op, version) + path.encode('utf-8')
+        for attempt in (0, 1):
+            sock = self._connect()
+            try:
+                _send_frame(sock, request)
+                response = _recv_frame(sock)
+                if response is None:
+                    raise QueryError('connection closed by the server')
+            except (socket.error, QueryError):
+                sock.close()
+                if attempt:  # Pooled connections may have been closed, retry once
+                    raise
+                continue
+            if len(response) < _HEADER.size:
+                sock.close()
+                raise QueryError('truncated response from the server')
+            self._release(sock)
+            status, version = _HEADER.unpack_from(response)
+            return status, version, response[_HEADER.size:]
+
+    def close(self):
+        """ Close the pooled connections.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for sock in pool:
+            sock.close()
+
+    def version(self):
+        """ Get the current version of the configuration.
+        """
+        return self._request(STATUS)[1]
+
+    def get(self, path, default=None):
+        """ Get the value or sections designated by path (or default if the
+            path does not exist).
+
+        Values are returned as is, sections as a list of (read-only) sections,
+        or a single section if the path selects it with arguments.
+        """
+        cached = self._cache.get(path)
+        now = timer()
+        if cached is not None and now - cached[1] < self.max_age:
+            return cached[2]
+        status, version, data = self._request(GET, cached[0] if cached else 0, path)
+        if status == NOT_MODIFIED:
+            result = cached[2]
+        elif status == FOUND:
+            root = Snapshot(data, safe=True).root
+            name, args = _parse_path_segment(path.rsplit('.', 1)[-1])
+            value = root.get(name, raw=False)
+            if value is not None:
+                result = value.value
+            else:
+                result = list(root.subsections(name))
+                if args is not None and len(result) == 1:
+                    result = result[0]
+        elif status == MISSING:
+            self._cache.pop(path, None)
+            return default
+        else:
+            raise QueryError(data.decode('utf-8'))
+        self._cache[path] = (version, now, result)
+        return result
+
+
+def _load_schema(spec):
+    module_name, _, attribute = spec.partition(':')
+    __import__(module_name)
+    schema = getattr(sys.modules[module_name], attribute)
+    return schema() if isinstance(schema, type) else schema
+
+
+def main(argv=None):
+    import argparse
+    from confiture import Confiture
+    parser = argparse.ArgumentParser(prog='python -m confiture.daemon')
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help='serve a configuration')
+    serve_parser.add_argument('--socket', required=True, help='path of the socket')
+    serve_parser.add_argument('--schema', help='schema used to validate the '
+                              'configuration (module:attribute)')
+    serve_parser.add_argument('--interval', type=float, default=1.0,
+                              help='interval between two checks of the file')
+    serve_parser.add_argument('filename')
+    get_parser = subparsers.add_parser('get', help='query a served configuration')
+    get_parser.add_argument('--socket', required=True, help='path of the socket')
+    get_parser.add_argument('path')
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO)
+        schema = _load_schema(args.schema) if args.schema else None
+        loader = lambda: Confiture.from_filename(args.filename, schema=schema).parse()
+        server = ConfigServer(args.socket, loader, watch=[args.filename],
+                              interval=args.interval)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
+        return 0
+    elif args.command == 'get':
+        result = ConfigClient(args.socket).get(args.path, default=None)
+        if isinstance(result, list):
+            result = [section.to_dict() for section in result]
+        elif isinstance(result, ConfigSection):
+            result = result.to_dict()
+        print(result)
+        return 0 if result is not None else 1
+    else:
+        parser.print_help()
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
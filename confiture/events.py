@@ -0,0 +1,274 @@
+""" Event based parsing of configurations, without building a tree.
+
+Events are yielded while the configuration is read, so scanning a
+configuration uses a memory bounded by its nesting depth. The syntax (and
+the errors raised on invalid configurations) are the same than with the
+:class:`~confiture.parser.ConfitureParser`.
+"""
+
+from collections import namedtuple
+
+from confiture.parser import (ConfitureLexer, ParsingError, ExternalOpener,
+                              default_external_opener)
+from confiture.tree import ConfigSection, Position
+
+
+Event = namedtuple('Event', ('kind', 'name', 'value', 'position'))
+Event.__doc__ = """ An event of the parsing of a configuration.
+
+The kind of the event is one of:
+
+- ``section_start``: the value is the list of arguments of the section
+  (or None), the position is the one of the section name
+- ``value``: the position is the one of the value
+- ``section_end``: the value is None, the position is the one of the
+  closing brace (None in included files returned as trees by the external
+  opener, where the closing braces are unknown)
+- ``include``: the name is the locator of the included files, the events of
+  the included files follow this event
+"""
+
+_VALUES = frozenset(('TEXT', 'YES', 'NO', 'NUMBER'))
+_STATEMENT_FOLLOWS = frozenset(('NAME', 'INCLUDE', 'RBRACE', None))
+
+
+def _kind(token):
+    return None if token is None else token.type
+
+
+class _EventParser(object):
+
+    """ Recursive descent parser of the Confiture syntax, yielding events.
+    """
+
+    def __init__(self, input, input_name, external_opener, encoding, lexer=None):
+        self._input_name = input_name
+        self._external_opener = external_opener
+        self._encoding = encoding
+        if lexer is None:
+            lexer = ConfitureLexer(encoding=encoding, input_name=input_name)
+        self._lexer = lexer
+        self._lexer.input(input)
+        self._lexer.seek(0, 1)
+        self._old_line = 0
+        self._token = None
+        self.args_position = None  # Position of the args of the last opened section
+        self.closed = None  # Tokens of the last closed section: (name, left
+                            # brace, right brace) and the line of the previous
+                            # statement when it was opened
+
+    def seek(self, lexpos, lineno, old_line):
+        """ Start the parsing at lexpos, which is on line lineno, old_line
+            being the line of the statement preceding lexpos.
+        """
+        self._lexer.seek(lexpos, lineno)
+        self._old_line = old_line
+
+    def _position(self, token):
+        return Position(self._input_name, token.lineno, self._lexer.column(token.lexpos))
+
+    def _next(self):
+        self._token = self._lexer.token()
+        return self._token
+
+    def _error(self, token):
+        if token is None:
+            raise ParsingError('Unexpected end of file')
+        raise ParsingError('Syntax error near of "%s"' % token.value, self._position(token))
+
+    def _check_follow(self):
+        """ Check the token following a statement.
+        """
+        if _kind(self._token) not in _STATEMENT_FOLLOWS:
+            self._error(self._token)
+
+    def _check_line(self, token, name):
+        """ Check a statement is not on the same line than the previous one
+            (the next token has already been read).
+        """
+        self._check_follow()
+        current = self._lexer.lineno
+        if self._old_line == current:
+            raise ParsingError('Syntax error near of "%s", newline missing?' % name,
+                               self._position(token))
+        self._old_line = current
+
+    def _value(self):
+        """ Read a value starting at the current token, and the next token.
+        """
+        token = self._token
+        if _kind(token) not in _VALUES:
+            self._error(token)
+        value = token.value
+        if self._next() is not None and token.type == 'NUMBER' and self._token.type == 'UNIT':
+            value *= self._token.value
+            self._next()
+        return value
+
+    def _arg(self):
+        """ Read a section argument (the position of the arguments is the
+            one of the last argument).
+        """
+        if self._token is not None:
+            self.args_position = self._position(self._token)
+        return self._value()
+
+    def _values(self):
+        """ Read a value or a list starting at the current token.
+        """
+        value = self._value()
+        if _kind(self._token) != 'LIST_SEP':
+            return value
+        values = [value]
+        while _kind(self._next()) in _VALUES:
+            values.append(self._value())
+            if _kind(self._token) != 'LIST_SEP':
+                break
+        return values
+
+    def _include(self, locator, position):
+        yield Event('include', locator, None, position)
+        if isinstance(self._external_opener, ExternalOpener):
+            for name, data in self._external_opener.open(locator):
+                parser = _EventParser(data, name, self._external_opener, self._encoding)
+                for event in parser.events():
+                    yield event
+        else:
+            for external in self._external_opener(locator):
+                for event in _tree_events(external):
+                    yield event
+
+    def events(self, single=False):
+        """ Yield the events, or only the events of the first statement if
+            single is True.
+        """
+        names = []  # Stack of the opened sections: (name, name token, left
+                    # brace token, line of the previous statement)
+        self._next()
+        while True:
+            token = self._token
+            kind = _kind(token)
+            if kind is None:
+                if names:
+                    self._error(None)
+                return
+            elif kind == 'RBRACE':
+                if not names:
+                    self._error(token)
+                name, name_token, lbrace_token, old_line = names.pop()
+                self._next()
+                self._check_follow()
+                self.closed = (name_token, lbrace_token, token, old_line)
+                yield Event('section_end', name, None, self._position(token))
+                self._check_line(name_token, name)
+            elif kind == 'INCLUDE':
+                if _kind(self._next()) != 'TEXT':
+                    self._error(self._token)
+                locator = self._token.value
+                self._next()
+                for event in self._include(locator, self._position(token)):
+                    yield event
+            elif kind == 'NAME':
+                next_kind = _kind(self._next())
+                if next_kind == 'ASSIGN':
+                    if _kind(self._next()) not in _VALUES:
+                        self._error(self._token)
+                    position = self._position(self._token)
+                    value = self._values()
+                    self._check_line(token, token.value)
+                    yield Event('value', token.value, value, position)
+                else:
+                    args = None
+                    if next_kind in _VALUES:
+                        args = [self._arg()]
+                        while _kind(self._token) == 'LIST_SEP':
+                            self._next()
+                            args.append(self._arg())
+                    if _kind(self._token) != 'LBRACE':
+                        self._error(self._token)
+                    names.append((token.value, token, self._token, self._old_line))
+                    self._next()
+                    yield Event('section_start', token.value, args, self._position(token))
+                    continue
+            else:
+                self._error(token)
+            if single and not names:
+                return
+
+
+def _tree_events(section):
+    """ Yield the events of the children of a parsed section (trees don't
+        store the position of closing braces, section_end events have none).
+    """
+    stack = [(None, iter(section.iteritems(expand_sections=True)))]
+    while stack:
+        for name, child in stack[-1][1]:
+            if isinstance(child, ConfigSection):
+                yield Event('section_start', name, child.args, child.position)
+                stack.append((name, iter(child.iteritems(expand_sections=True))))
+                break
+            else:
+                yield Event('value', name, child.value, child.position)
+        else:
+            name = stack.pop()[0]
+            if stack:
+                yield Event('section_end', name, None, None)
+
+
+def iterparse(input, input_name='<unknown>', external_opener=default_external_opener,
+              encoding='utf-8'):
+    """ Parse a configuration and iterate over its events (see :class:`Event`).
+
+    Included files are opened by the external opener and their events are
+    yielded after the ``include`` event (external openers which are not
+    subclasses of :class:`~confiture.parser.ExternalOpener` return parsed
+    trees, which are then walked to yield their events, the ``section_end``
+    events of these trees have no position).
+
+    A ParsingError is raised when an error is found, after the events of the
+    configuration preceding the error.
+
+    Usage example::
+
+        >>> for event in iterparse(open('/etc/app.conf').read()):
+        ...     if event.kind == 'value' and event.name == 'listen':
+        ...         print(event.value, event.position)
+    """
+    parser = _EventParser(input, input_name, external_opener, encoding)
+    return parser.events()
+
+
+class EventHandler(object):
+
+    """ Base class for the handlers of :func:`parse_events`, subclasses
+        override the methods of the events they handle.
+    """
+
+    def section_start(self, name, args, position):
+        pass
+
+    def value(self, name, value, position):
+        pass
+
+    def section_end(self, name, position):
+        pass
+
+    def include(self, locator, position):
+        pass
+
+
+def parse_events(input, handler, **kwargs):
+    """ Parse a configuration and call the methods of handler (an
+        :class:`EventHandler`) for each event.
+
+    Keyword arguments are given to :func:`iterparse`.
+    """
+    for kind, name, value, position in iterparse(input, **kwargs):
+        if kind == 'value':
+            handler.value(name, value, position)
+        elif kind == 'section_start':
+            handler.section_start(name, value, position)
+        elif kind == 'section_end':
+            handler.section_end(name, position)
+        else:
+            handler.include(name, position)
@@ -0,0 +1,175 @@
+""" Atomic replacement of a configuration shared between threads.
+"""
+
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('confiture.handle')
+
+
+class _ReaderRecord(object):
+
+    """ The configuration read by a thread, and its version (or None).
+    """
+
+    __slots__ = ('version', 'config', 'depth', '__weakref__')
+
+    def __init__(self):
+        self.version = None
+        self.config = None
+        self.depth = 0
+
+
+class ConfigHandle(object):
+
+    """ Hold the current configuration, and replace it atomically on reload.
+
+    Readers never take a lock: the configuration and its version are stored
+    in a single tuple, replaced in one assignment by writers. Each reading
+    thread announces the version it reads in a record of its own, so the
+    handle knows when all readers have moved to a new version (read-copy-
+    update style) and can then call the hooks registered for the swap.
+
+    :param config: the initial configuration
+    :param loader: callable returning a new configuration, used by
+        :meth:`reload` (and to load the initial configuration if config is
+        not provided)
+
+    Usage example::
+
+        >>> handle = ConfigHandle(loader=lambda: Confiture.from_filename(
+        ...     '/etc/app.conf', schema=AppSchema()).parse())
+        >>> with handle.read() as config:  # In the request threads
+        ...     handle_request(config)
+        >>> handle.reload(hook=lambda old: log('old configuration released'))
+    """
+
+    def __init__(self, config=None, loader=None):
+        self._loader = loader
+        if config is None and loader is not None:
+            config = loader()
+        self._state = (0, config)
+        self._local = threading.local()
+        self._readers = weakref.WeakSet()  # Records of each reading thread
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = []  # Hooks waiting for readers: (version, hook, old)
+        self._pending_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<ConfigHandle version=%d>' % self._state[0]
+
+    def _record(self):
+        record = getattr(self._local, 'record', None)
+        if record is None:
+            record = self._local.record = _ReaderRecord()
+            with self._readers_lock:
+                self._readers.add(record)
+        return record
+
+    @property
+    def version(self):
+        """ The version of the current configuration (incremented by each
+            swap).
+        """
+        return self._state[0]
+
+    @property
+    def current(self):
+        """ The current configuration.
+
+        Use this property for one-shot lookups: the returned configuration is
+        consistent, but the handle does not know it is used and hooks may be
+        called while you still use it. Use :meth:`read` to read several
+        values or to keep the configuration during a whole request.
+        """
+        return self._state[1]
+
+    @contextmanager
+    def read(self):
+        """ Get the current configuration for the duration of the block.
+
+        The configuration given to the block never changes, even if the
+        handle is swapped meanwhile. Blocks can be nested in a thread, nested
+        blocks get the configuration of the outer block.
+        """
+        record = self._record()
+        if record.depth:
+            record.depth += 1
+            try:
+                yield record.config
+            finally:
+                record.depth -= 1
+            return
+        while True:
+            state = self._state
+            record.version = state[0]
+            # A swap may have happened between the read of the state and the
+            # announce of its version, in which case the writer may already
+            # have checked our record: retry with the new state.
+            if self._state is state:
+                break
+        record.depth = 1
+        record.config = state[1]
+        try:
+            yield state[1]
+        finally:
+            record.depth = 0
+            record.config = None
+            record.version = None
+            if self._pending:
+                self._call_hooks()
+
+    def swap(self, config, hook=None):
+        """ Replace the configuration, return the new version.
+
+        :param hook: a callable called with the old configuration once no
+            reader uses it anymore (either from this call or from the reader
+            leaving the last :meth:`read` block using the old configuration),
+            its exceptions are logged
+        """
+        with self._write_lock:
+            old_version, old = self._state
+            version = old_version + 1
+            self._state = (version, config)
+            if hook is not None:
+                with self._pending_lock:
+                    self._pending.append((version, hook, old))
+        if hook is not None:
+            self._call_hooks()
+        return version
+
+    def reload(self, loader=None, hook=None):
+        """ Load a new configuration using loader (or the loader given to the
+            handle) and swap it, return the new version.
+
+        If the loader raises an exception, the current configuration is kept.
+        """
+        if loader is None:
+            loader = self._loader
+        if loader is None:
+            raise ValueError('no loader to reload the configuration')
+        return self.swap(loader(), hook=hook)
+
+    def _oldest_read_version(self):
+        with self._readers_lock:
+            versions = [r.version for r in self._readers if r.version is not None]
+        return min(versions) if versions else None
+
+    def _call_hooks(self):
+        """ Call the hooks of the versions which are no longer read.
+        """
+        with self._pending_lock:
+            oldest = self._oldest_read_version()
+            ready = []
+            while self._pending and (oldest is None or self._pending[0][0] <= oldest):
+                ready.append(self._pending.pop(0))
+        for version, hook, old in ready:
+            # A failing hook must not prevent the other hooks from running:
+            try:
+                hook(old)
+            except Exception:
+                logger.exception('Hook of the swap to version %d failed', version)
@@ -0,0 +1,295 @@
+""" Incremental parsing of configurations edited in place (by editors).
+
+The parser keeps the offsets of the sections of the parsed text. When the
+text is edited, only the smallest section enclosing the edit is lexed and
+parsed again (from the section name to the token following its closing
+brace), and its tree replaces the previous one. The positions of the
+following nodes are then shifted, so the tree (and the raised parsing
+errors) are always the same than with a full parse of the text.
+"""
+
+from confiture.parser import ConfitureLexer, ParsingError, default_external_opener
+from confiture.events import _EventParser
+from confiture.tree import ConfigSection, ConfigValue
+
+
+class _Span(object):
+
+    """ Offsets of a section in the text.
+    """
+
+    __slots__ = ('section', 'start', 'lbrace', 'rbrace', 'lineno', 'old_line', 'parent')
+
+    def __init__(self, section, start, lbrace, rbrace, lineno, old_line):
+        self.section = section
+        self.start = start  # Offset of the section name
+        self.lbrace = lbrace
+        self.rbrace = rbrace
+        self.lineno = lineno  # Line of the section name
+        self.old_line = old_line  # Line of the previous statement
+        self.parent = None  # Span of the enclosing section
+
+
+class _TreeParser(_EventParser):
+
+    """ Build the tree (like the ConfitureParser) and the spans of sections
+        from the events.
+    """
+
+    def _include(self, locator, position):
+        children = []
+        for external in self._external_opener(locator):
+            children += list(external.iterflatchildren())
+        yield ('include', children)
+
+    def build(self, single=False):
+        """ Build the children (or the first statement if single is True),
+            return them with the spans of the sections, in text order.
+        """
+        stack = [[]]  # Children of the opened sections
+        spans_stack = [[]]  # Spans of the sections in the opened sections
+        spans = []
+        for event in self.events(single=single):
+            kind = event[0]
+            if kind == 'value':
+                stack[-1].append(ConfigValue(event.name, event.value, position=event.position))
+            elif kind == 'section_start':
+                args = event.value
+                if args is not None:
+                    args = ConfigValue('<args>', args, position=self.args_position)
+                stack.append([ConfigSection(event.name, args=args, position=event.position)])
+                spans_stack.append([])
+            elif kind == 'section_end':
+                children = stack.pop()
+                section = children.pop(0)
+                for child in children:
+                    if isinstance(child, ConfigSection):
+                        child.parent = section
+                    section.register(child)
+                name_token, lbrace_token, rbrace_token, old_line = self.closed
+                span = _Span(section, name_token.lexpos, lbrace_token.lexpos,
+                             rbrace_token.lexpos, name_token.lineno, old_line)
+                for child_span in spans_stack.pop():
+                    child_span.parent = span
+                spans_stack[-1].append(span)
+                spans.append(span)
+                stack[-1].append(section)
+            else:
+                stack[-1] += event[1]
+        spans.sort(key=lambda x: x.start)
+        return stack[0], spans
+
+
+class IncrementalParser(object):
+
+    """ Parse a configuration, and parse it again incrementally on edits.
+
+    :param input: the text of the configuration
+    :param input_name: the name of the configuration used in positions
+    :param external_opener: the opener of included files
+
+    Usage example::
+
+        >>> parser = IncrementalParser(text, input_name='app.conf')
+        >>> parser.tree.to_dict()
+        >>> parser.edit(120, 2, '42')  # Replace 2 characters at offset 120
+        >>> parser.tree.to_dict()
+
+    The tree is updated in place: the sections which are not parsed again are
+    kept (with their positions updated).
+    """
+
+    def __init__(self, input, input_name='<unknown>', external_opener=default_external_opener,
+                 encoding='utf-8'):
+        if isinstance(input, bytes):
+            input = input.decode(encoding)
+        self._text = input
+        self._input_name = input_name
+        self._external_opener = external_opener
+        self._encoding = encoding
+        self._lexer = ConfitureLexer(encoding=encoding, input_name=input_name)
+        self.tree = None  # The tree of the text, None if the text is invalid
+        self._spans = None  # Spans of the sections (None if unknown)
+        self._dirty = None  # Span of the section which must be parsed again
+        self._parse()
+
+    @property
+    def text(self):
+        return self._text
+
+    def _parser(self):
+        return _TreeParser(self._text, self._input_name, self._external_opener,
+                           self._encoding, lexer=self._lexer)
+
+    def _parse(self):
+        """ Parse the whole text.
+        """
+        self.tree = None
+        self._spans = None
+        self._dirty = None
+        children, spans = self._parser().build()
+        tree = ConfigSection('__top__')
+        for child in children:
+            if isinstance(child, ConfigSection):
+                child.parent = tree
+            tree.register(child)
+        self.tree = tree
+        self._spans = spans
+        return tree
+
+    def _find(self, offset, end):
+        """ Find the smallest span whose content contains [offset, end).
+        """
+        spans = self._spans
+        low, high = 0, len(spans)
+        while low < high:  # Last span starting before offset
+            middle = (low + high) // 2
+            if spans[middle].start < offset:
+                low = middle + 1
+            else:
+                high = middle
+        span = spans[low - 1] if low else None
+        while span is not None and not (span.lbrace < offset and end <= span.rbrace):
+            span = span.parent
+        return span
+
+    def _index(self, span):
+        spans = self._spans
+        low, high = 0, len(spans)
+        while low < high:
+            middle = (low + high) // 2
+            if spans[middle].start < span.start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def parse(self):
+        """ Parse the whole text again and return the tree.
+        """
+        return self._parse()
+
+    def edit(self, offset, removed, inserted):
+        """ Replace removed characters at offset by the inserted text, and
+            return the updated tree.
+
+        A ParsingError is raised if the edited text is invalid (tree is then
+        None until an edit fixes the text).
+        """
+        if offset < 0 or removed < 0 or offset + removed > len(self._text):
+            raise ValueError('edit out of the text')
+        old_text = self._text
+        self._text = old_text[:offset] + inserted + old_text[offset + removed:]
+        if self._spans is None:
+            return self._parse()
+        span = self._find(offset, offset + removed)
+        if self._dirty is not None:
+            # The dirty section must be parsed again too:
+            while span is not None and not (span.start <= self._dirty.start and
+                                            self._dirty.rbrace <= span.rbrace):
+                span = span.parent
+        if span is None:
+            return self._parse()
+        try:
+            return self._reparse(span, old_text, offset, removed, inserted)
+        except ParsingError:
+            raise
+        except Exception:
+            # Errors raised while building the tree (like KeyError on
+            # duplicated keys), the spans are then unknown:
+            self.tree = self._spans = self._dirty = None
+            raise
+
+    def _reparse(self, span, old_text, offset, removed, inserted):
+        delta = len(inserted) - removed
+        spans = self._spans
+        first = self._index(span)
+        last = first + 1  # Index following the spans of the section
+        while last < len(spans) and spans[last].start < span.rbrace:
+            last += 1
+        parser = self._parser()
+        parser.seek(span.start, span.lineno, span.old_line)
+        try:
+            children, new_spans = parser.build(single=True)
+        except ParsingError:
+            closed = parser.closed
+            if (closed is not None and closed[0].lexpos == span.start
+                    and closed[2].lexpos != span.rbrace + delta):
+                # The edit changed the end of the section, the context of
+                # the error is unknown:
+                return self._parse()
+            # The error is in the section (or just after its end), a full
+            # parse would raise the same error. The section is marked to be
+            # parsed again on next edit:
+            self._shift(span, spans[last:], old_text, offset, removed, inserted)
+            spans[first + 1:last] = []
+            span.rbrace += delta
+            self._dirty = span
+            self.tree = None
+            raise
+        new_span = new_spans[0] if new_spans else None
+        if new_span is None or new_span.rbrace != span.rbrace + delta:
+            return self._parse()  # The edit changed the end of the section
+        self._shift(span, spans[last:], old_text, offset, removed, inserted)
+        # Replace the section in the tree and its spans:
+        parent = span.section.parent
+        parent.replace(span.section, new_span.section)
+        new_span.parent = span.parent
+        spans[first:last] = new_spans
+        if self.tree is None:
+            while parent.parent is not None:
+                parent = parent.parent
+            self.tree = parent
+        self._dirty = None
+        return self.tree
+
+    def _shift(self, span, following, old_text, offset, removed, inserted):
+        """ Shift the offsets and positions of the nodes following the
+            section of span.
+        """
+        delta = len(inserted) - removed
+        line_delta = inserted.count('\n') - old_text.count('\n', offset, offset + removed)
+        for other in following:
+            other.start += delta
+            other.lbrace += delta
+            other.rbrace += delta
+            other.lineno += line_delta
+            other.old_line += line_delta
+        ancestor = span.parent
+        while ancestor is not None:
+            ancestor.rbrace += delta
+            ancestor = ancestor.parent
+        # Positions of the nodes following the edit on the same line (whose
+        # column change) and on the following lines:
+        end_line = span.lineno + old_text.count('\n', span.start, offset + removed)
+        old_start = max(old_text.rfind('\n', 0, offset + removed), 0)
+        new_start = max(self._text.rfind('\n', 0, offset + len(inserted)), 0)
+        column_delta = delta + old_start - new_start
+        if not line_delta and (not column_delta or
+                               old_text.count('\n', offset + removed, span.rbrace)):
+            return  # No node follows the edit on its line
+        start = (span.lineno, span.section.position.pos)
+
+        def shift(position):
+            if position.file != self._input_name:
+                return
+            if position.lineno == end_line:
+                position.pos += column_delta
+            if position.lineno >= end_line:
+                position.lineno += line_delta
+
+        section = span.section.parent
+        while section is not None:
+            for value in section.iterchildren():
+                if (isinstance(value, ConfigValue) and
+                        (value.position.lineno, value.position.pos) > start):
+                    shift(value.position)
+            section = section.parent
+        for other in following:
+            section = other.section
+            shift(section.position)
+            if section.args_raw is not None:
+                shift(section.args_raw.position)
+            for value in section.iterchildren():
+                if isinstance(value, ConfigValue):
+                    shift(value.position)
@@ -0,0 +1,258 @@
+""" Interpolation of references to other values of the configuration.
+
+A reference ``${path.to.key}`` in a string value is replaced by the value of
+the key designated by the path, from the top section. Sections with arguments
+are selected using ``name[arg]`` (arguments are joined by commas). A value
+made of a single reference takes the value of the referenced key as is
+(keeping its type), and references in lists splice the referenced lists.
+``$${`` is written as a literal ``${``.
+
+References are resolved once each, by a depth first walk of the dependency
+graph of the values, which detects the reference cycles.
+"""
+
+import re
+
+from confiture.parser import ParsingError
+from confiture.tree import ConfigSection, _parse_path_segment, _format_path_args
+
+
+_REFERENCE = re.compile(r'\$(\$?)\{([^}]*)\}')
+
+_PENDING, _RESOLVING, _RESOLVED = range(3)  # States of nodes
+
+try:
+    _STRING_TYPES = (str, unicode)
+except NameError:
+    _STRING_TYPES = (str,)
+
+
+class _Reference(object):
+
+    __slots__ = ('path', )
+
+    def __init__(self, path):
+        self.path = path
+
+
+def _split(text):
+    """ Split a string in literal strings and references, or return None if
+        the string does not contain any reference.
+    """
+    if '${' not in text:
+        return None
+    pieces = []
+    last = 0
+    for match in _REFERENCE.finditer(text):
+        if match.start() > last:
+            pieces.append(text[last:match.start()])
+        if match.group(1):
+            pieces.append(match.group(0)[1:])  # Escaped reference
+        else:
+            pieces.append(_Reference(match.group(2).strip()))
+        last = match.end()
+    if last < len(text):
+        pieces.append(text[last:])
+    return pieces
+
+
+def _to_text(value, path, position):
+    if value is True:
+        return 'yes'
+    elif value is False:
+        return 'no'
+    elif isinstance(value, (list, tuple)):
+        raise ParsingError('reference to the list %s can not be interpolated '
+                           'in a string' % path, position)
+    else:
+        return '%s' % value
+
+
+class _Node(object):
+
+    """ A value (or section arguments) containing references.
+    """
+
+    __slots__ = ('value', 'templates', 'is_list', 'targets', 'state')
+
+    def __init__(self, value, templates, is_list):
+        self.value = value
+        self.templates = templates  # Pieces of the value (or of each item)
+        self.is_list = is_list
+        self.targets = None  # Referenced values, by path
+        self.state = _PENDING
+
+
+class _Interpolator(object):
+
+    def __init__(self, top):
+        self.top = top
+        self.nodes = {}  # Nodes by id of their ConfigValue
+        self.lookups = {}  # Referenced ConfigValue by path
+        self.by_args = {}  # Sub-sections by formatted arguments, by id of
+                           # their parent section and name
+
+    def collect(self, section):
+        """ Find the values containing references.
+        """
+        sections = [section]
+        while sections:
+            section = sections.pop()
+            if section.args_raw is not None:
+                self.add(section.args_raw)
+            for child in section.iterflatchildren():
+                if isinstance(child, ConfigSection):
+                    sections.append(child)
+                else:
+                    self.add(child)
+
+    def add(self, value):
+        raw = value.value
+        if isinstance(raw, _STRING_TYPES):
+            templates = _split(raw)
+            if templates is not None:
+                self.nodes[id(value)] = _Node(value, templates, False)
+        elif isinstance(raw, list):
+            templates = [_split(x) if isinstance(x, _STRING_TYPES) else None for x in raw]
+            if any(x is not None for x in templates):
+                self.nodes[id(value)] = _Node(value, templates, True)
+
+    def lookup(self, path, position):
+        try:
+            return self.lookups[path]
+        except KeyError:
+            pass
+        section = self.top
+        segments = path.split('.')
+        for index, segment in enumerate(segments):
+            parsed = _parse_path_segment(segment)
+            if parsed is None:
+                raise ParsingError('bad reference %s' % path, position)
+            name, args = parsed
+            if index == len(segments) - 1 and args is None:
+                value = section.get(name, raw=False)
+                if value is None:
+                    raise ParsingError('reference %s not found' % path, position)
+                self.lookups[path] = value
+                return value
+            if args is None:
+                subsections = list(section.subsections(name))
+            else:
+                subsections = self.subsections_by_args(section, name).get(args, [])
+            if len(subsections) != 1:
+                raise ParsingError('reference %s matches %d sections'
+                                   % (path, len(subsections)), position)
+            section = subsections[0]
+        raise ParsingError('reference %s is a section' % path, position)
+
+    def subsections_by_args(self, section, name):
+        """ Return the sub-sections of a section with the provided name,
+            grouped by formatted arguments (built once per section and name).
+        """
+        key = (id(section), name)
+        try:
+            return self.by_args[key]
+        except KeyError:
+            pass
+        by_args = {}
+        for subsection in section.subsections(name):
+            # Arguments are compared once their references are resolved:
+            self.resolve_args(subsection)
+            by_args.setdefault(_format_path_args(subsection.args), []).append(subsection)
+        self.by_args[key] = by_args
+        return by_args
+
+    def resolve_args(self, section):
+        """ Resolve the references of the arguments of a section, if any.
+        """
+        if section.args_raw is None:
+            return
+        node = self.nodes.get(id(section.args_raw))
+        if node is None or node.state == _RESOLVED:
+            return
+        elif node.state == _RESOLVING:
+            raise ParsingError('reference cycle (arguments of section %s)' % section.name,
+                               node.value.position)
+        self.resolve(node)
+
+    def targets(self, node):
+        if node.targets is None:
+            targets = {}
+            templates = node.templates if node.is_list else [node.templates]
+            for pieces in templates:
+                for piece in pieces or ():
+                    if isinstance(piece, _Reference) and piece.path not in targets:
+                        targets[piece.path] = self.lookup(piece.path, node.value.position)
+            node.targets = targets
+        return node.targets
+
+    def resolve(self, root):
+        """ Resolve a node after the nodes it depends on (iteratively, to
+            support long chains of references).
+        """
+        root.state = _RESOLVING
+        stack = [(root, iter(self.targets(root).values()))]
+        while stack:
+            node, dependencies = stack[-1]
+            for target in dependencies:
+                dependency = self.nodes.get(id(target))
+                if dependency is None or dependency.state == _RESOLVED:
+                    continue
+                elif dependency.state == _RESOLVING:
+                    cycle = [n.value.name for n, _ in stack] + [dependency.value.name]
+                    raise ParsingError('reference cycle (%s)' % ' -> '.join(cycle),
+                                       dependency.value.position)
+                dependency.state = _RESOLVING
+                stack.append((dependency, iter(self.targets(dependency).values())))
+                break
+            else:
+                stack.pop()
+                self.render(node)
+                node.state = _RESOLVED
+
+    def render_pieces(self, node, pieces):
+        position = node.value.position
+        if len(pieces) == 1 and isinstance(pieces[0], _Reference):
+            value = node.targets[pieces[0].path].value
+            return list(value) if isinstance(value, list) else value
+        output = []
+        for piece in pieces:
+            if isinstance(piece, _Reference):
+                output.append(_to_text(node.targets[piece.path].value, piece.path, position))
+            else:
+                output.append(piece)
+        return ''.join(output)
+
+    def render(self, node):
+        if not node.is_list:
+            node.value.value = self.render_pieces(node, node.templates)
+            return
+        output = []
+        for item, pieces in zip(node.value.value, node.templates):
+            if pieces is None:
+                output.append(item)
+                continue
+            item = self.render_pieces(node, pieces)
+            if isinstance(item, list):
+                output.extend(item)
+            else:
+                output.append(item)
+        node.value.value = output
+
+    def run(self):
+        self.collect(self.top)
+        for node in self.nodes.values():
+            if node.state == _PENDING:
+                self.resolve(node)
+
+
+def interpolate(section):
+    """ Replace the references of a configuration tree by the referenced
+        values, in place, and return the tree.
+
+    References are resolved from section, which should be the top section.
+    A ParsingError is raised with the position of the referencing value on
+    unknown references and reference cycles.
+    """
+    _Interpolator(section).run()
+    return section
@@ -2,7 +2,10 @@
 """
 
 import sys
+import time
+import posixpath
 from glob import glob
+from fnmatch import fnmatchcase
 
 import ply.lex as lex
 import ply.yacc as yacc
@@ -38,21 +41,187 @@ class ParsingError(Exception):
         self.position = position
 
 
-def default_external_opener(locator):
-    """ The default locator used to open included external files.
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Limits(object):
+
+    """ Limits of the resources used to parse a configuration (None means
+        no limit), a ParsingError is raised as soon as a limit is exceeded.
+
+    :param max_size: the maximum size of the parsed configurations (in
+        characters, summed over the included files)
+    :param max_depth: the maximum nesting level of sections (the sections of
+        included files are nested in the including section)
+    :param max_list_length: the maximum number of values of a list or of
+        section arguments
+    :param max_includes: the maximum number of included files
+    :param max_include_depth: the maximum nesting level of includes
+
+    Usage example::
+
+        >>> limits = Limits(max_size=2 ** 20, max_depth=16, max_list_length=1000,
+        ...                 max_includes=100, max_include_depth=4)
+        >>> config = Confiture(uploaded, schema=TenantSchema(), limits=limits).parse()
+    """
+
+    def __init__(self, max_size=None, max_depth=None, max_list_length=None,
+                 max_includes=None, max_include_depth=None):
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.max_list_length = max_list_length
+        self.max_includes = max_includes
+        self.max_include_depth = max_include_depth
+
+
+class ExternalOpener(object):
+
+    """ Base class for external openers.
+
+    An external opener is a callable taking the locator of an include
+    statement and returning the list of parsed configurations. Subclasses of
+    this class only have to implement the :meth:`open` method, included files
+    are then parsed using the settings of the including parser (like its
+    tracer).
+    """
+
+    def open(self, locator):
+        """ Iterate over (name, data) couples of the files matching locator.
+        """
+        raise NotImplementedError()
+
+    def __call__(self, locator, parser=None):
+        tracer = None if parser is None else parser.tracer
+        parsed_externals = []
+        externals = iter(self.open(locator))
+        while True:
+            start = timer()
+            try:
+                name, data = next(externals)
+            except StopIteration:
+                break
+            read_time = timer() - start
+            if parser is None:
+                external_parser = ConfitureParser(data, debug=False, write_tables=False,
+                                                  errorlog=yacc.NullLogger(),
+                                                  input_name=name, external_opener=self)
+            else:
+                external_parser = parser.subparser(data, input_name=name)
+            start = timer()
+            parsed_externals.append(external_parser.parse())
+            if tracer is not None:
+                tracer.phase('read', read_time)
+                tracer.file(name, read_time, timer() - start)
+        return parsed_externals
+
+
+class FileOpener(ExternalOpener):
+
+    """ Open included files from the filesystem, the locator can be a glob
+        pattern.
     """
-    parsed_externals = []
-    for external in glob(locator):
+
+    def open(self, locator):
+        for external in glob(locator):
+            try:
+                with open(external) as fexternal:
+                    external_data = fexternal.read()
+            except IOError as err:
+                raise ParsingError('Unable to open %s (%s)' % (external, err))
+            yield external, external_data
+
+
+class ArchiveOpener(ExternalOpener):
+
+    """ Open included files from a zip or tar archive (optionally compressed).
+
+    The archive is read at once in memory and indexed by member name, so
+    included files (and glob patterns) are then served without any system
+    call. Locators are relative to the root of the archive.
+
+    :param archive: filename or file object of the archive
+    :param encoding: the encoding of the files of the archive
+
+    Usage example::
+
+        >>> opener = ArchiveOpener('/srv/app/config-bundle.tar.gz')
+        >>> config = Confiture(opener.read('app.conf'), external_opener=opener,
+        ...                    input_name=opener.name('app.conf')).parse()
+    """
+
+    def __init__(self, archive, encoding='utf-8'):
+        if hasattr(archive, 'read'):
+            data = archive.read()
+            self._archive_name = getattr(archive, 'name', '<archive>')
+        else:
+            with open(archive, 'rb') as farchive:
+                data = farchive.read()
+            self._archive_name = archive
+        self._encoding = encoding
+        self._zip = None
+        self._members = {}  # Members by normalized name (ZipInfo for zip
+                            # archives, data for tar archives)
+        import io
+        import zipfile
+        import tarfile
+        buffer = io.BytesIO(data)
+        if zipfile.is_zipfile(buffer):
+            self._zip = zipfile.ZipFile(buffer)
+            for info in self._zip.infolist():
+                if not info.filename.endswith('/'):
+                    self._members[self._normalize(info.filename)] = info
+        else:
+            buffer.seek(0)
+            try:
+                tar = tarfile.open(fileobj=buffer, mode='r:*')
+            except tarfile.TarError as err:
+                raise ParsingError('Unable to open archive %s (%s)' % (self._archive_name, err))
+            with tar:
+                # Members are read sequentially, compressed tar archives can't
+                # be read efficiently in random order:
+                for info in tar:
+                    if info.isfile():
+                        self._members[self._normalize(info.name)] = tar.extractfile(info).read()
+        self._names = sorted(self._members)
+
+    @staticmethod
+    def _normalize(name):
+        name = posixpath.normpath(name.replace('\\', '/')).lstrip('/')
+        return '' if name == '.' else name
+
+    def name(self, member):
+        """ Get the name of a member used in positions.
+        """
+        return '%s:%s' % (self._archive_name, self._normalize(member))
+
+    def read(self, member):
+        """ Get the content of a member of the archive.
+        """
+        normalized = self._normalize(member)
         try:
-            with open(external) as fexternal:
-                external_data = fexternal.read()
-        except IOError as err:
-            raise ParsingError('Unable to open %s (%s)' % (external, err))
-        parser = ConfitureParser(external_data, debug=False, write_tables=False,
-                               errorlog=yacc.NullLogger(), input_name=external,
-                               external_opener=default_external_opener)
-        parsed_externals.append(parser.parse())
-    return parsed_externals
+            data = self._members[normalized]
+        except KeyError:
+            raise ParsingError('Unable to open %s (no such member)' % self.name(member))
+        if self._zip is not None:
+            data = self._zip.read(data)
+        return data.decode(self._encoding)
+
+    def open(self, locator):
+        pattern = self._normalize(locator)
+        if not any(c in pattern for c in '*?['):
+            if pattern in self._members:
+                yield self.name(pattern), self.read(pattern)
+            return
+        parts = pattern.split('/')
+        for member in self._names:
+            member_parts = member.split('/')
+            if len(member_parts) == len(parts) and all(fnmatchcase(m, p) for m, p
+                                                       in zip(member_parts, parts)):
+                yield self.name(member), self.read(member)
+
+
+default_external_opener = FileOpener()  # The default opener used to open
+                                        # included external files.
 
 
 #
@@ -162,6 +331,13 @@ class ConfitureLexer(object):
         self._current_input = input
         return self._lexer.input(input)
 
+    def seek(self, lexpos, lineno):
+        """ Continue the lexing of the current input at lexpos, which is on
+            line lineno.
+        """
+        self._lexer.lexpos = lexpos
+        self._lexer.lineno = lineno
+
     def __getattr__(self, name):
         attr = getattr(self._lexer, name)
         if attr is None:
@@ -170,6 +346,77 @@ class ConfitureLexer(object):
             return attr
 
 
+class TracingLexer(object):
+
+    """ Wrap a lexer to count tokens and the time spent to produce them.
+    """
+
+    def __init__(self, lexer):
+        self._lexer = lexer
+        self.tokens = 0
+        self.elapsed = 0
+
+    def token(self):
+        start = timer()
+        token = self._lexer.token()
+        self.elapsed += timer() - start
+        if token is not None:
+            self.tokens += 1
+        return token
+
+    def __getattr__(self, name):
+        return getattr(self._lexer, name)
+
+
+class LimitingLexer(object):
+
+    """ Wrap a lexer to enforce the nesting depth and list length limits.
+
+    :param depth: the nesting level of the parsed configuration (for
+        included files)
+    """
+
+    _VALUES = frozenset(('TEXT', 'NUMBER', 'YES', 'NO'))
+
+    def __init__(self, lexer, limits, input_name, depth=0):
+        self._lexer = lexer
+        self._limits = limits
+        self._input_name = input_name
+        self.depth = depth
+        self.last_depth = depth  # Depth before the last token
+        self._items = 0  # Values of the current list
+
+    def _error(self, msg, token):
+        position = Position(self._input_name, token.lineno,
+                            self._lexer.column(token.lexpos))
+        raise ParsingError(msg, position)
+
+    def token(self):
+        token = self._lexer.token()
+        if token is None:
+            return token
+        limits = self._limits
+        self.last_depth = self.depth
+        if token.type in self._VALUES:
+            self._items += 1
+            if limits.max_list_length is not None and self._items > limits.max_list_length:
+                self._error('List too long (more than %d values)'
+                            % limits.max_list_length, token)
+        elif token.type not in ('LIST_SEP', 'UNIT'):
+            self._items = 0
+            if token.type == 'LBRACE':
+                self.depth += 1
+                if limits.max_depth is not None and self.depth > limits.max_depth:
+                    self._error('Sections nested too deeply (more than %d levels)'
+                                % limits.max_depth, token)
+            elif token.type == 'RBRACE':
+                self.depth -= 1
+        return token
+
+    def __getattr__(self, name):
+        return getattr(self._lexer, name)
+
+
 #
 # Parser
 #
@@ -186,9 +433,62 @@ class ConfitureParser(object):
         self._input_name = kwargs.pop('input_name', '<unknown>')
         self._external_opener = kwargs.pop('external_opener',
                                            default_external_opener)
+        self.tracer = kwargs.pop('tracer', None)
+        self.limits = kwargs.pop('limits', None)
         self._lexer = kwargs.pop('lexer', ConfitureLexer(input_name=self._input_name))
         self._parser = yacc.yacc(module=self, **kwargs)
         self._old_line = 0
+        self._include_time = 0  # Time spent in external openers (when traced)
+        # State of the limits, shared with the parsers of included files:
+        self._usage = {'size': 0, 'includes': 0}
+        self._depth = 0  # Nesting level of the parsed configuration
+        self._include_depth = 0
+        self._include_position = None
+        self._limiting_lexer = None
+
+    def subparser(self, input, input_name='<unknown>'):
+        """ Create a parser for an included file, with the same settings.
+        """
+        parser = ConfitureParser(input, debug=False, write_tables=False,
+                                 errorlog=yacc.NullLogger(), input_name=input_name,
+                                 external_opener=self._external_opener,
+                                 tracer=self.tracer, limits=self.limits)
+        if self.limits is not None:
+            self._count_includes(1)
+            parser._usage = self._usage
+            # The include may be reduced after the read of a closing brace:
+            parser._depth = self._limiting_lexer.last_depth
+            parser._include_depth = self._include_depth + 1
+        return parser
+
+    def _count_includes(self, count):
+        self._usage['includes'] += count
+        max_includes = self.limits.max_includes
+        if max_includes is not None and self._usage['includes'] > max_includes:
+            raise ParsingError('Too many included files (more than %d)' % max_includes,
+                               self._include_position)
+
+    def _open_external(self, locator):
+        if isinstance(self._external_opener, ExternalOpener):
+            return self._external_opener(locator, parser=self)
+        externals = self._external_opener(locator)
+        if self.limits is not None:
+            # The limits can't be applied to the parsing of these files:
+            self._count_includes(len(externals))
+        return externals
+
+    def _check_size(self):
+        max_size = self.limits.max_size
+        self._usage['size'] += len(self._input)
+        if max_size is None or self._usage['size'] <= max_size:
+            return
+        offset = max(max_size - self._usage['size'] + len(self._input), 0)
+        newline = b'\n' if isinstance(self._input, bytes) else '\n'
+        last_cr = max(self._input.rfind(newline, 0, offset), 0)
+        position = Position(self._input_name, self._input.count(newline, 0, offset) + 1,
+                            offset - last_cr)
+        raise ParsingError('Configuration too large (more than %d characters)' % max_size,
+                           position)
 
     def _check_line(self, current, lineno, pos, token):
         if self._old_line == current:
@@ -278,7 +578,20 @@ class ConfitureParser(object):
 
     def p_section_content_include(self, p):
         """section_content : section_content INCLUDE TEXT"""
-        for external in self._external_opener(p[3]):
+        if self.limits is not None:
+            self._include_position = Position(self._input_name, p.lineno(2),
+                                              self._lexer.column(p.lexpos(2)))
+            max_include_depth = self.limits.max_include_depth
+            if max_include_depth is not None and self._include_depth >= max_include_depth:
+                raise ParsingError('Includes nested too deeply (more than %d levels)'
+                                   % max_include_depth, self._include_position)
+        if self.tracer is None:
+            externals = self._open_external(p[3])
+        else:
+            start = timer()
+            externals = self._open_external(p[3])
+            self._include_time += timer() - start
+        for external in externals:
             p[1] += list(external.iterflatchildren())
         p[0] = p[1]
 
@@ -329,7 +642,31 @@ class ConfitureParser(object):
     #
 
     def parse(self):
-        return self._parser.parse(self._input, self._lexer, tracking=True)
+        try:
+            return self._parse()
+        finally:
+            # The yacc parser keeps its stacks (which reference the parsed
+            # tree) until the next parse, and ply keeps the last built parser
+            # in a global, drop them to not keep the tree alive:
+            self._parser.symstack = self._parser.statestack = None
+
+    def _parse(self):
+        lexer = self._lexer
+        if self.limits is not None:
+            self._check_size()
+            lexer = self._limiting_lexer = LimitingLexer(lexer, self.limits, self._input_name,
+                                                         depth=self._depth)
+        if self.tracer is None:
+            return self._parser.parse(self._input, lexer, tracking=True)
+        lexer = TracingLexer(lexer)
+        self._include_time = 0
+        start = timer()
+        tree = self._parser.parse(self._input, lexer, tracking=True)
+        elapsed = timer() - start
+        self.tracer.count('tokens', lexer.tokens)
+        self.tracer.phase('lex', lexer.elapsed)
+        self.tracer.phase('parse', elapsed - lexer.elapsed - self._include_time)
+        return tree
 
     def __getattr__(self, name):
         attr = getattr(self._parser, name)
@@ -1,6 +1,13 @@
 """ Confiture schema validator.
 """
 
+import warnings
+import functools
+import threading
+from collections import OrderedDict
+
+from confiture.tree import ConfigValue
+
 
 class ValidationError(Exception):
 
@@ -12,6 +19,181 @@ class ValidationError(Exception):
         self.position = position
 
 
+class ValidationCache(object):
+
+    """ A bounded LRU mapping used to memoise validation results.
+
+    :param size: maximum number of entries kept in the cache, 0 disable
+        the cache
+
+    The ``hits`` and ``misses`` attributes count the lookups done on the
+    cache since its creation (or the last call to :meth:`clear`).
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<ValidationCache size=%d hits=%d misses=%d>' % (len(self), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """ Get the entry stored for key, or default if there is not.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value  # Move the entry to the end
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """ Store an entry in the cache, evicting the least recently used
+            entry if the cache is full.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def resize(self, size):
+        """ Change the maximum number of entries, evicting the least recently
+            used entries if the cache is too large.
+        """
+        with self._lock:
+            self.size = size
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Remove all entries and reset counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_missing = object()
+_active = threading.local()  # Active validation context of each thread
+
+
+def memoize(validate=None, copy_result=False):
+    """ Decorator memoising the result of a :meth:`Type.validate` method.
+
+    The results are stored in the :attr:`Type.cache` of the type instance,
+    so this decorator must only be used on validate methods only depending
+    on the value to validate. Validation errors are not memoised.
+
+    :param copy_result: if True, the memoised results are deep copied
+        before being returned, use it for types returning mutable objects
+
+    Usage example::
+
+        class Hostname(String):
+
+            @memoize
+            def validate(self, value):
+                ...
+    """
+
+    if copy_result:
+        from copy import deepcopy
+
+    def decorator(validate):
+        @functools.wraps(validate)
+        def wrapper(self, value):
+            cache = self.cache
+            if not cache.size:
+                return validate(self, value)
+            # The type is part of the key to avoid 1 and True to be
+            # considered as the same value:
+            key = (validate, type(value), value)
+            try:
+                result = cache.get(key, _missing)
+            except TypeError:  # Unhashable value, can't be memoised
+                return validate(self, value)
+            context = getattr(_active, 'context', None)
+            if result is _missing:
+                if context is not None:
+                    context.cache_misses += 1
+                result = validate(self, value)
+                cache.set(key, deepcopy(result) if copy_result else result)
+            else:
+                if context is not None:
+                    context.cache_hits += 1
+                if copy_result:
+                    result = deepcopy(result)
+            return result
+        return wrapper
+
+    if validate is None:
+        return decorator
+    else:
+        return decorator(validate)
+
+
+ARGPARSE_OVERRIDES = '_confiture_overrides'  # Attribute of the argparse
+                                              # namespace where overriding
+                                              # values are stored.
+
+
+class ValidationContext(object):
+
+    """ The state of a validation run.
+
+    Containers don't store any state, so a schema can be reused or shared
+    between threads. Everything specific to a validation run is stored in
+    the context given to the :meth:`Container.validate` method.
+
+    :param argparse_args: the namespace returned by an argparse parser
+        populated using :meth:`Container.populate_argparse`, the values
+        given in command line override the values of the configuration
+    :param profiler: a :class:`confiture.schema.profiler.ValidationProfiler`
+        recording the time spent to validate each key and type
+
+    Without argparse namespace, containers fall back on the values of the
+    last command line they parsed (as in previous versions, which stored
+    them in the containers), with a DeprecationWarning.
+
+    The ``cache_hits`` and ``cache_misses`` attributes count the lookups done
+    on the caches of memoised types by the validations run in the thread
+    while the context is active (using it as a context manager)::
+
+        with context:
+            schema.validate(config, context)
+    """
+
+    def __init__(self, argparse_args=None, profiler=None):
+        self.argparse_args = argparse_args
+        self.overrides = {}
+        if argparse_args is not None:
+            self.overrides.update(getattr(argparse_args, ARGPARSE_OVERRIDES, {}))
+        self.profiler = profiler
+        self.path = []  # Path of the key being validated (when profiling)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._previous = None  # Context active before this one
+
+    def __enter__(self):
+        self._previous = getattr(_active, 'context', None)
+        _active.context = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.context, self._previous = self._previous, None
+
+
 class Container(object):
 
     """ Base class for all containers.
@@ -20,7 +202,12 @@ class Container(object):
     def populate_argparse(self, parser, name=None):
         pass
 
-    def validate(self, value):
+    def iter_types(self):
+        """ Iterate over the types used by this container (and children).
+        """
+        return iter(())
+
+    def validate(self, value, context=None):
         raise NotImplementedError()
 
 
@@ -33,11 +220,41 @@ class ArgparseContainer(Container):
                  argparse_help=None, argparse_names_invert=None,
                  argparse_help_invert=None):
         self._argparse_names = argparse_names
-        self._argparse_value = None  # Where to store the overriding value
         self._argparse_metavar = argparse_metavar
         self._argparse_help = argparse_help
         self._argparse_names_invert = argparse_names_invert
         self._argparse_help_invert = argparse_help_invert
+        self._argparse_value = None  # Last overriding value (deprecated)
+
+    def _set_override(self, namespace, value):
+        """ Store the overriding value in the argparse namespace.
+        """
+        overrides = getattr(namespace, ARGPARSE_OVERRIDES, None)
+        if overrides is None:
+            overrides = {}
+            setattr(namespace, ARGPARSE_OVERRIDES, overrides)
+        overrides[self] = value
+        # Also kept for the validations run without the namespace:
+        self._argparse_value = value
+
+    def _argparse_override(self, name, values, const):
+        """ Build the overriding value from the argparse values.
+        """
+        if const is not None:
+            return ConfigValue(name, const)
+        else:
+            return ConfigValue(name, values)
+
+    def _get_override(self, context):
+        """ Get the overriding value from the validation context, if any.
+        """
+        if context is not None and context.argparse_args is not None:
+            return context.overrides.get(self)
+        elif self._argparse_value is not None:
+            warnings.warn('command line overrides used without their argparse '
+                          'namespace, give it to Confiture (argparse_args) or '
+                          'to the ValidationContext', DeprecationWarning)
+            return self._argparse_value
 
 
 class Type(object):
@@ -48,8 +265,47 @@ class Type(object):
     is_argparse_flag = False  # If True, this type will be defined as a
                               # boolean "flag" by argument parser.
 
+    accepts_list = False  # If True, lists are given as is to the validate
+                          # method instead of being rejected by containers.
+
+    cache_size = 1024  # Maximum number of results memoised by validate
+                       # methods decorated with memoize, 0 to disable.
+
+    array_typecode = None  # The array module typecode used to store values
+                           # of this type, None if they can't be stored in
+                           # an array.
+
+    @property
+    def cache(self):
+        """ The :class:`ValidationCache` used by memoised validate methods.
+
+        The cache is resized when the :attr:`cache_size` of the type changes.
+        """
+        cache = self.__dict__.get('_cache')
+        if cache is None:
+            cache = self.__dict__.setdefault('_cache', ValidationCache(self.cache_size))
+        elif cache.size != self.cache_size:
+            cache.resize(self.cache_size)
+        return cache
+
     def validate(self, value):
         raise NotImplementedError()
 
+    def validate_array(self, values):
+        """ Validate a list of values and return them in an
+            :class:`array.array` using the :attr:`array_typecode` of the type.
+        """
+        import array
+        validated = []
+        for i, item in enumerate(values):
+            try:
+                validated.append(self.validate(item))
+            except ValidationError as err:
+                raise ValidationError('item #%d, %s' % (i, err))
+        try:
+            return array.array(self.array_typecode, validated)
+        except OverflowError as err:
+            raise ValidationError(str(err))
+
     def cast(self, value):
         return value
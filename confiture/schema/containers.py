@@ -2,16 +2,13 @@
 """
 
 import sys
-try:
-    import argparse
-except ImportError:
-    argparse = None
 
 if sys.version_info[0] < 3:
     from itertools import izip as zip
 
-from confiture.tree import ConfigSection, ConfigValue
+from confiture.tree import ConfigSection, ConfigValue, Columns, _args_key
 from confiture.schema import Container, ArgparseContainer, ValidationError
+from confiture.schema.profiler import validate_type, validate_child
 
 
 required = object()
@@ -19,6 +16,34 @@ many = (1, None)
 once = (1, 1)
 
 
+_override_action_class = None
+
+
+def _override_action():
+    """ Get the argparse action used to store overriding values.
+
+    The class is defined on first use to avoid importing argparse with
+    this module.
+    """
+    global _override_action_class
+    if _override_action_class is None:
+        import argparse
+
+        class OverrideAction(argparse.Action):
+
+            def __init__(self, target=None, key=None, **kwargs):
+                super(OverrideAction, self).__init__(**kwargs)
+                self.target = target
+                self.key = key
+
+            def __call__(self, parser, namespace, values, option_string=None):
+                value = self.target._argparse_override(self.key, values, self.const)
+                self.target._set_override(namespace, value)
+
+        _override_action_class = OverrideAction
+    return _override_action_class
+
+
 class Value(ArgparseContainer):
 
     """ A value container used to store a scalar value of specified type.
@@ -32,56 +57,60 @@ class Value(ArgparseContainer):
         self._type = value_type
         self._default = default
 
-    def populate_argparse(self, parser, name):
-        value = self
-
-        class Action(argparse.Action):
+    def iter_types(self):
+        yield self._type
 
-            def __init__(self, **kwargs):
-                super(Action, self).__init__(**kwargs)
-                self._const = kwargs.get('const', None)
-
-            def __call__(self, parser, namespace, values, option_string=None):
-                if self._const is not None:
-                    value._argparse_value = ConfigValue(name, self._const)
-                else:
-                    value._argparse_value = ConfigValue(name, values[0])
+    def _argparse_override(self, name, values, const):
+        if const is not None:
+            return ConfigValue(name, const)
+        elif self._type.accepts_list:
+            return ConfigValue(name, values)
+        else:
+            return ConfigValue(name, values[0])
 
+    def populate_argparse(self, parser, name):
         if self._argparse_names:
             if self._type.is_argparse_flag:
                 nargs = 0
                 const = True
+            elif self._type.accepts_list:
+                nargs = '*'
+                const = None
             else:
                 nargs = 1
                 const = None
-            nargs = 0 if self._type.is_argparse_flag else 1
-            parser.add_argument(*self._argparse_names, action=Action,
+            parser.add_argument(*self._argparse_names, action=_override_action(),
+                                target=self, key=name,
                                 type=self._type.cast, nargs=nargs,
                                 metavar=self._argparse_metavar,
                                 help=self._argparse_help, const=const)
             if self._type.is_argparse_flag and self._argparse_names_invert:
                 parser.add_argument(*self._argparse_names_invert,
-                                    action=Action, type=self._type.cast,
-                                    nargs=0, help=self._argparse_help_invert,
+                                    action=_override_action(),
+                                    target=self, key=name,
+                                    type=self._type.cast, nargs=0,
+                                    help=self._argparse_help_invert,
                                     const=False)
 
-    def validate(self, value):
-        if self._argparse_value is not None:
-            value = self._argparse_value
+    def validate(self, value, context=None):
+        override = self._get_override(context)
+        if override is not None:
+            value = override
         if value is None:
             if self._default is required:
                 raise ValidationError('this value is required')
             else:
                 return ConfigValue(None, self._default)
         else:
-            if isinstance(value.value, list):
-                if len(value.value) == 1:
-                    value.value = value.value[0]
+            raw_value = value.value
+            if isinstance(raw_value, list) and not self._type.accepts_list:
+                if len(raw_value) == 1:
+                    raw_value = raw_value[0]
                 else:
-                    raise ValidationError('%r is a list' % value.value,
+                    raise ValidationError('%r is a list' % raw_value,
                                           position=value.position)
             try:
-                validated_value = self._type.validate(value.value)
+                validated_value = validate_type(self._type, raw_value, context)
             except ValidationError as err:
                 raise ValidationError(str(err), position=value.position)
             return ConfigValue(value.name, validated_value, position=value.position)
@@ -105,80 +134,94 @@ class Choice(ArgparseContainer):
         self._default = default
 
     def populate_argparse(self, parser, name):
-        choice = self
-
-        class Action(argparse.Action):
-
-            def __init__(self, **kwargs):
-                super(Action, self).__init__(**kwargs)
-                self._const = kwargs.get('const', None)
-
-            def __call__(self, parser, namespace, values, option_string=None):
-                if self._const is not None:
-                    choice._argparse_value = ConfigValue(name, self._const)
-                else:
-                    choice._argparse_value = ConfigValue(name, values)
-
         if self._argparse_names:
-            parser.add_argument(*self._argparse_names, action=Action,
+            parser.add_argument(*self._argparse_names, action=_override_action(),
+                                target=self, key=name,
                                 choices=list(self._choices.keys()),
                                 metavar=self._argparse_metavar,
                                 help=self._argparse_help)
 
-    def validate(self, value):
-        if self._argparse_value is not None:
-            value = self._argparse_value
+    def validate(self, value, context=None):
+        override = self._get_override(context)
+        if override is not None:
+            value = override
         if value is None:
             if self._default is required:
                 raise ValidationError('this value is required')
             else:
                 return ConfigValue(None, self._default)
         else:
-            if isinstance(value.value, list):
-                if len(value.value) == 1:
-                    value.value = value.value[0]
+            raw_value = value.value
+            if isinstance(raw_value, list):
+                if len(raw_value) == 1:
+                    raw_value = raw_value[0]
                 else:
-                    raise ValidationError('%r is a list' % value.value,
+                    raise ValidationError('%r is a list' % raw_value,
                                           position=value.position)
-            if value.value in self._choices:
-                return ConfigValue(value.name, self._choices[value.value],
+            if raw_value in self._choices:
+                return ConfigValue(value.name, self._choices[raw_value],
                                    position=value.position)
             else:
                 choices = ', '.join(repr(x) for x in self._choices)
                 raise ValidationError('bad choice (must be one of %s)' % choices)
 
 
+_numpy = None  # NumPy module, imported on first use (False if unavailable)
+
+
+def _to_numpy(values):
+    """ Convert an array.array to a NumPy array (without copy) if NumPy is
+        available, else return the array as is.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    if _numpy is False:
+        return values
+    return _numpy.frombuffer(values, dtype=values.typecode)
+
+
 class List(ArgparseContainer):
 
     """ A list container used to store a list of scalar value of specified type.
 
     :param values_type: type of values
     :param default: the default value of the container
+    :param as_array: store the validated values in an :class:`array.array`
+        (or a NumPy array if NumPy is available) instead of a list, values
+        are then validated in bulk. Only usable with types which can be
+        stored in an array (like :class:`Integer` and :class:`Float`)
     """
 
-    def __init__(self, values_type, default=required, **kwargs):
+    def __init__(self, values_type, default=required, as_array=False, **kwargs):
         super(List, self).__init__(**kwargs)
+        if as_array and values_type.array_typecode is None:
+            raise TypeError('%s values can\'t be stored in an array'
+                            % values_type.__class__.__name__)
         self._type = values_type
         self._default = default
+        self._as_array = as_array
 
-    def populate_argparse(self, parser, name):
-        value = self
-
-        class Action(argparse.Action):
-
-            def __call__(self, parser, namespace, values, option_string=None):
-                value._argparse_value = ConfigValue(name, values)
+    def iter_types(self):
+        yield self._type
 
+    def populate_argparse(self, parser, name):
         if self._argparse_names:
             nargs = '*'
-            parser.add_argument(*self._argparse_names, action=Action,
+            parser.add_argument(*self._argparse_names, action=_override_action(),
+                                target=self, key=name,
                                 type=self._type.cast, nargs=nargs,
                                 metavar=self._argparse_metavar,
                                 help=self._argparse_help)
 
-    def validate(self, value):
-        if self._argparse_value is not None:
-            value = self._argparse_value
+    def validate(self, value, context=None):
+        override = self._get_override(context)
+        if override is not None:
+            value = override
         if value is None:
             if self._default is required:
                 raise ValidationError('this value is required')
@@ -188,10 +231,18 @@ class List(ArgparseContainer):
             values = value.value
             if not isinstance(values, list):
                 values = [values]
+            if self._as_array:
+                try:
+                    validated_array = validate_type(self._type, values, context,
+                                                    method='validate_array')
+                except ValidationError as err:
+                    raise ValidationError(str(err), position=value.position)
+                return ConfigValue(value.name, _to_numpy(validated_array),
+                                   position=value.position)
             validated_list = []
             for i, item in enumerate(values):
                 try:
-                    item = self._type.validate(item)
+                    item = validate_type(self._type, item, context)
                 except ValidationError as err:
                     raise ValidationError('item #%d, %s' % (i, err),
                                           position=value.position)
@@ -214,21 +265,15 @@ class Array(List):
         self._size = size
 
     def populate_argparse(self, parser, name):
-        value = self
-
-        class Action(argparse.Action):
-
-            def __call__(self, parser, namespace, values, option_string=None):
-                value._argparse_value = ConfigValue(name, values)
-
         if self._argparse_names:
-            parser.add_argument(*self._argparse_names, action=Action,
+            parser.add_argument(*self._argparse_names, action=_override_action(),
+                                target=self, key=name,
                                 type=self._type.cast, nargs=self._size,
                                 metavar=self._argparse_metavar,
                                 help=self._argparse_help)
 
-    def validate(self, value):
-        value = super(Array, self).validate(value)
+    def validate(self, value, context=None):
+        value = super(Array, self).validate(value, context)
         if len(value.value) != self._size:
             raise ValidationError('bad array size (should be %d, found %d items)'
                                   % (self._size, len(value.value)))
@@ -249,24 +294,22 @@ class TypedArray(ArgparseContainer):
         self._types = values_types
         self._default = default
 
-    def populate_argparse(self, parser, name):
-        value = self
-
-        class Action(argparse.Action):
-
-            def __call__(self, parser, namespace, values, option_string=None):
-                value._argparse_value = ConfigValue(name, values)
+    def iter_types(self):
+        return iter(self._types)
 
+    def populate_argparse(self, parser, name):
         if self._argparse_names:
             nargs = '*'
-            parser.add_argument(*self._argparse_names, action=Action,
+            parser.add_argument(*self._argparse_names, action=_override_action(),
+                                target=self, key=name,
                                 type=str, nargs=nargs,
                                 metavar=self._argparse_metavar,
                                 help=self._argparse_help)
 
-    def validate(self, value):
-        if self._argparse_value is not None:
-            value = self._argparse_value
+    def validate(self, value, context=None):
+        override = self._get_override(context)
+        if override is not None:
+            value = override
         if value is None:
             if self._default is required:
                 raise ValidationError('this value is required')
@@ -283,7 +326,7 @@ class TypedArray(ArgparseContainer):
 
             for i, (item, item_type) in enumerate(zip(values, self._types)):
                 try:
-                    item = item_type.validate(item)
+                    item = validate_type(item_type, item, context)
                 except ValidationError as err:
                     raise ValidationError('item #%d, %s' % (i, err),
                                           position=value.position)
@@ -304,7 +347,8 @@ class Section(Container):
     _meta = {'args': None,
              'unique': False,
              'repeat': once,
-             'allow_unknown': False}
+             'allow_unknown': False,
+             'columnar': False}
 
     def __init__(self, **kwargs):
         self.meta = {}
@@ -337,7 +381,27 @@ class Section(Container):
         for name, container in self.keys.items():
             container.populate_argparse(parser, name=name)
 
-    def validate(self, section):
+    def iter_types(self):
+        if self.meta['args'] is not None:
+            for type_ in self.meta['args'].iter_types():
+                yield type_
+        for container in self.keys.values():
+            for type_ in container.iter_types():
+                yield type_
+
+    def _new_columns(self, name):
+        """ Create the columns storing the sections validated by this schema.
+        """
+        if self.meta['allow_unknown'] or any(isinstance(c, Section) for c in self.keys.values()):
+            raise ValidationError('section %s, columnar sections can not have '
+                                  'subsections or unknown keys' % name)
+        typecodes = {}
+        for key, container in self.keys.items():
+            if isinstance(container, Value) and container._type.array_typecode is not None:
+                typecodes[key] = container._type.array_typecode
+        return Columns(name, self.keys, typecodes)
+
+    def validate(self, section, context=None):
         if not isinstance(section, ConfigSection):
             raise ValidationError('Not a section')
 
@@ -351,7 +415,8 @@ class Section(Container):
                                   position=section.position)
         elif self.meta['args'] is not None:
             try:
-                validated_args = self.meta['args'].validate(section.args_raw)
+                validated_args = validate_child(self.meta['args'], '<args>',
+                                                section.args_raw, context)
             except ValidationError as err:
                 msg = 'section %s, arguments, %s' % (section.name, err)
                 raise ValidationError(msg, position=err.position)
@@ -374,22 +439,32 @@ class Section(Container):
                                           ' at max %d times' % (name, rmax))
                 # Do the children validation:
                 args = set()  # Store the already seen args
+                index = {}  # Validated subsections by args, kept for unique sections
+                if container.meta['columnar']:
+                    columns = container._new_columns(name)
+                    validated_section.register(columns, name=name)
                 for subsection in subsections:
                     # Check for unique option:
                     if container.meta['unique']:
-                        args_value = None if subsection.args is None else tuple(subsection.args)
+                        args_value = _args_key(subsection.args)
                         if args_value in args:
                             msg = 'section %s, section must be unique' % name
                             raise ValidationError(msg, position=subsection.position)
                         else:
                             args.add(args_value)
                     # Container validation:
-                    validated_subsection = container.validate(subsection)
+                    validated_subsection = validate_child(container, name, subsection, context)
                     validated_section.register(validated_subsection, name=name)
+                    if container.meta['unique'] and not container.meta['columnar']:
+                        index[_args_key(validated_subsection.args)] = validated_subsection
+                if index and len(index) == len(subsections):
+                    validated_section.index_args(name, index)
             elif isinstance(container, Container):
                 # Validate all other types of containers:
                 try:
-                    validated_value = container.validate(section.get(name, raw=False))
+                    validated_value = validate_child(container, name,
+                                                     section.get(name, raw=False),
+                                                     context)
                 except ValidationError as err:
                     raise ValidationError('section %s, key %s, %s' % (section.name, name, err),
                                           position=err.position)
@@ -0,0 +1,95 @@
+""" Profiling of the schema validation.
+"""
+
+import time
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class ValidationProfiler(object):
+
+    """ Record the time spent to validate each key of a schema, and each
+        type.
+
+    Times are cumulative: the time of a section includes the time of its
+    children. Repeated sections are recorded under the same path.
+
+    Usage example::
+
+        >>> profiler = ValidationProfiler()
+        >>> config = Confiture(conf, schema=schema, profiler=profiler).parse()
+        >>> print(profiler.report(limit=10))
+    """
+
+    def __init__(self):
+        self.paths = {}  # path -> [calls, cumulative time]
+        self.types = {}  # type class name -> [calls, cumulative time]
+
+    def record_path(self, path, elapsed):
+        stats = self.paths.setdefault(path, [0, 0])
+        stats[0] += 1
+        stats[1] += elapsed
+
+    def record_type(self, type_, elapsed):
+        stats = self.types.setdefault(type_.__class__.__name__, [0, 0])
+        stats[0] += 1
+        stats[1] += elapsed
+
+    def sorted_paths(self):
+        """ Get (path, calls, cumulative time) tuples, slowest first.
+        """
+        return sorted(((p, c, t) for p, (c, t) in self.paths.items()),
+                      key=lambda x: x[2], reverse=True)
+
+    def sorted_types(self):
+        """ Get (type name, calls, cumulative time) tuples, slowest first.
+        """
+        return sorted(((n, c, t) for n, (c, t) in self.types.items()),
+                      key=lambda x: x[2], reverse=True)
+
+    def report(self, limit=None):
+        """ Format a report of the slowest paths and types.
+
+        :param limit: maximum number of lines in each table
+        """
+        lines = []
+        for title, stats in (('path', self.sorted_paths()),
+                             ('type', self.sorted_types())):
+            lines.append('%-50s %10s %12s %12s' % (title, 'calls', 'cumul (ms)', 'per call (us)'))
+            for name, calls, elapsed in stats[:limit]:
+                lines.append('%-50s %10d %12.3f %12.3f' % (name, calls, elapsed * 1e3,
+                                                           elapsed * 1e6 / calls))
+            lines.append('')
+        return '\n'.join(lines)
+
+
+def validate_type(type_, value, context, method='validate'):
+    """ Validate value using the method of type_, recording the time spent
+        if the context has a profiler.
+    """
+    validate = getattr(type_, method)
+    profiler = None if context is None else context.profiler
+    if profiler is None:
+        return validate(value)
+    start = timer()
+    try:
+        return validate(value)
+    finally:
+        profiler.record_type(type_, timer() - start)
+
+
+def validate_child(container, name, value, context):
+    """ Validate the child name of a section using container, recording the
+        time spent if the context has a profiler.
+    """
+    profiler = None if context is None else context.profiler
+    if profiler is None:
+        return container.validate(value, context)
+    context.path.append(name)
+    start = timer()
+    try:
+        return container.validate(value, context)
+    finally:
+        profiler.record_path('.'.join(context.path), timer() - start)
+        context.path.pop()
@@ -0,0 +1,142 @@
+""" Conversion of validated configuration trees to attribute-access records.
+"""
+
+import keyword
+import threading
+
+from confiture.schema.containers import Section
+
+
+_VALUE = 'value'
+_SECTION = 'section'
+_SECTIONS = 'sections'
+
+_classes = {}  # Generated record classes, by schema shape
+_classes_lock = threading.Lock()
+
+
+class Record(object):
+
+    """ Base class of the record classes generated by :func:`record_class`.
+
+    Each key of the schema is available as an attribute (dashes in key names
+    are replaced by underscores, and an underscore is appended to keys which
+    are Python keywords). Sections which can be repeated are stored as tuples
+    of records, other sections as a record (or None if the section is
+    optional and missing). The section argument is available in the
+    ``_args`` attribute if the schema takes arguments.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _converters = ()
+    _has_args = False
+
+    def __init__(self, *values):
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % (name, getattr(self, name)) for name in self._fields)
+        return '%s(%s)' % (self.__class__.__name__, fields)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in self._fields)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def _asdict(self):
+        """ Return the record as a dict mapping attribute names to values.
+        """
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    @classmethod
+    def _from_section(cls, section):
+        """ Build a record from a validated section.
+        """
+        values = []
+        for key, kind, child in cls._converters:
+            if kind is _VALUE:
+                values.append(section.get(key))
+            elif kind is _SECTIONS:
+                values.append(tuple(child._from_section(x) for x in section.subsections(key)))
+            else:
+                subsection = section.subsection(key)
+                values.append(None if subsection is None else child._from_section(subsection))
+        if cls._has_args:
+            values.append(section.args)
+        return cls(*values)
+
+
+def _attribute_name(key):
+    name = key.replace('-', '_')
+    if keyword.iskeyword(name):
+        name += '_'
+    return name
+
+
+def _shape(schema):
+    """ Compute a hashable representation of the structure of a schema.
+    """
+    children = []
+    for key, container in sorted(schema.keys.items()):
+        if isinstance(container, Section):
+            rmax = container.meta['repeat'][1]
+            kind = _SECTIONS if rmax is None or rmax > 1 else _SECTION
+            children.append((key, kind, _shape(container)))
+        else:
+            children.append((key, _VALUE, None))
+    return (schema.__class__, schema.meta['args'] is not None, tuple(children))
+
+
+def _build_class(schema, shape):
+    converters = []
+    fields = []
+    for key, kind, _ in shape[2]:
+        name = _attribute_name(key)
+        if name in fields:
+            raise ValueError('keys of %s conflict on the %r attribute'
+                             % (schema.__class__.__name__, name))
+        fields.append(name)
+        child = record_class(schema.keys[key]) if kind is not _VALUE else None
+        converters.append((key, kind, child))
+    if shape[1]:
+        fields.append('_args')
+    attrs = {'__slots__': tuple(fields),
+             '_fields': tuple(fields),
+             '_converters': tuple(converters),
+             '_has_args': shape[1]}
+    return type(schema.__class__.__name__ + 'Record', (Record,), attrs)
+
+
+def record_class(schema):
+    """ Get the record class generated for the provided section schema.
+
+    Classes are generated once, and cached by schema class and structure.
+    """
+    shape = _shape(schema)
+    cls = _classes.get(shape)
+    if cls is None:
+        cls = _build_class(schema, shape)
+        with _classes_lock:
+            cls = _classes.setdefault(shape, cls)
+    return cls
+
+
+def to_record(schema, section):
+    """ Convert a section validated by schema to a record.
+
+    Usage example::
+
+        >>> config = Confiture(conf, schema=MySchema()).parse()
+        >>> record = to_record(MySchema(), config)
+        >>> record.database.host
+        'localhost'
+    """
+    return record_class(schema)._from_section(section)
@@ -3,23 +3,76 @@
 
 import re
 import sys
+import bisect
 import numbers
-import socket
 import os.path
 
-if sys.version_info[0] >= 3:
-    import urllib.parse as urlparse
-else:
-    import urlparse
+from confiture.schema import Type, ValidationError, memoize
 
-try:
-    import ipaddr
-except ImportError:
-    IPADDR_ENABLED = False
-else:
-    IPADDR_ENABLED = True
 
-from confiture.schema import Type, ValidationError
+# Optional and network related modules (ipaddr, ipaddress, socket, urlparse)
+# are imported on first use to keep the import of this module fast.
+
+_IMPORTABLE = {}  # Cache of _importable results by module name
+
+# Availability flags of optional modules, by name of the flag:
+_FLAGS = {'IPADDR_ENABLED': 'ipaddr', 'IPADDRESS_ENABLED': 'ipaddress'}
+
+
+def _importable(name):
+    try:
+        return _IMPORTABLE[name]
+    except KeyError:
+        pass
+    try:
+        __import__(name)
+    except ImportError:
+        importable = False
+    else:
+        importable = True
+    _IMPORTABLE[name] = importable
+    return importable
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ is not supported, the flags are computed eagerly:
+    IPADDR_ENABLED = _importable('ipaddr')
+    IPADDRESS_ENABLED = _importable('ipaddress')
+
+
+_urlparse = None  # urlparse function, imported on first use
+_socket = None  # socket module, imported on first use
+
+
+def _get_urlparse():
+    global _urlparse
+    if _urlparse is None:
+        try:
+            from urllib.parse import urlparse
+        except ImportError:  # Python 2
+            from urlparse import urlparse
+        _urlparse = urlparse
+    return _urlparse
+
+
+def _get_socket():
+    global _socket
+    if _socket is None:
+        import socket
+        _socket = socket
+    return _socket
+
+
+def __getattr__(name):
+    # Availability flags of optional modules are computed on first access
+    # (Python 3.7 and later):
+    if name in _FLAGS:
+        return _importable(_FLAGS[name])
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_FLAGS))
 
 
 class Number(Type):
@@ -33,6 +86,19 @@ class Number(Type):
         else:
             return value
 
+    def validate_array(self, values):
+        # Let the array module check the whole list at C level, and fallback
+        # on the item by item validation to handle special cases (like
+        # integer floats) and to report the bad item. Subclasses overriding
+        # validate are always validated item by item:
+        if type(self).validate not in _BULK_VALIDATES:
+            return super(Number, self).validate_array(values)
+        import array
+        try:
+            return array.array(self.array_typecode, values)
+        except (TypeError, OverflowError):
+            return super(Number, self).validate_array(values)
+
     def cast(self, value):
         return float(value)
 
@@ -50,6 +116,8 @@ class Integer(Number):
         my_integer = 42.0  # Will also match this type
     """
 
+    array_typecode = 'q' if sys.version_info >= (3, 3) else 'l'
+
     def __init__(self, min=None, max=None):
         super(Integer, self).__init__()
         self._min = min
@@ -69,6 +137,20 @@ class Integer(Number):
         else:
             raise ValidationError('%r is not an integer value' % value)
 
+    def validate_array(self, values):
+        values = super(Integer, self).validate_array(values)
+        if not values:
+            return values
+        if self._min is not None and min(values) < self._min:
+            i, value = next((i, x) for i, x in enumerate(values) if x < self._min)
+            raise ValidationError('item #%d, %r is lower than the minimum (%d)'
+                                  % (i, value, self._min))
+        if self._max is not None and max(values) > self._max:
+            i, value = next((i, x) for i, x in enumerate(values) if x > self._max)
+            raise ValidationError('item #%d, %r is greater than the maximum (%d)'
+                                  % (i, value, self._max))
+        return values
+
     def cast(self, value):
         return int(value)
 
@@ -84,6 +166,8 @@ class Float(Number):
                        # for the Float type
     """
 
+    array_typecode = 'd'
+
     def __init__(self):
         super(Float, self).__init__()
 
@@ -92,6 +176,10 @@ class Float(Number):
         return float(value)
 
 
+# Validate methods whose checks are done by the array module:
+_BULK_VALIDATES = (Integer.validate, Float.validate)
+
+
 class Boolean(Type):
 
     """ A type representing a boolean value in the configuration.
@@ -191,6 +279,7 @@ class RegexPattern(String):
         super(RegexPattern, self).__init__(**kwargs)
         self.flags = flags
 
+    @memoize
     def validate(self, value):
         value = super(RegexPattern, self).validate(value)
         # Try to compile regex object:
@@ -217,12 +306,14 @@ class IPAddress(String):
     """
 
     def __init__(self, version=None, **kwargs):
-        if not IPADDR_ENABLED:
+        if not _importable('ipaddr'):
             raise RuntimeError('You must install the ipaddr package to use this type')
         super(IPAddress, self).__init__(**kwargs)
         self._version = version
 
+    @memoize
     def validate(self, value):
+        import ipaddr
         try:
             return ipaddr.IPAddress(value, version=self._version)
         except (ValueError, ipaddr.AddressValueError) as err:
@@ -244,7 +335,9 @@ class IPNetwork(IPAddress):
         allow = "10.0.0.0/8"
     """
 
+    @memoize
     def validate(self, value):
+        import ipaddr
         try:
             return ipaddr.IPNetwork(value, version=self._version)
         except ipaddr.AddressValueError:
@@ -254,6 +347,101 @@ class IPNetwork(IPAddress):
             raise ValidationError(str(err))
 
 
+class IPNetworkSet(Type):
+
+    """ A list of ipv4 or ipv6 networks, validated into a set optimized for
+        membership tests.
+
+    This type require the "ipaddress" module (standard since Python 3.3) to
+    work and will return an :class:`IPNetworkSet.Set` object. Overlapping and
+    adjacent networks are merged, and membership tests (``addr in acl``) are
+    done using a binary search on the sorted ranges, in O(log n) which is
+    bounded by the prefix length of the addresses.
+
+    :param version: type or ip address to validate, can be 4 (ipv4 addresses
+        only), 6 (ipv6 addresses only), or None (both).
+
+    Example in configuration::
+
+        allow = "10.0.0.0/8", "192.168.0.0/16", "::1/128"
+    """
+
+    accepts_list = True
+
+    def __init__(self, version=None):
+        if not _importable('ipaddress'):
+            raise RuntimeError('You must install the ipaddress package to use this type')
+        super(IPNetworkSet, self).__init__()
+        self._version = version
+
+    def validate(self, value):
+        import ipaddress
+        if not isinstance(value, list):
+            value = [value]
+        networks = []
+        for item in value:
+            try:
+                network = ipaddress.ip_network(item, strict=False)
+            except (TypeError, ValueError) as err:
+                raise ValidationError(str(err))
+            if self._version is not None and network.version != self._version:
+                raise ValidationError('%r does not appear to be an IPv%s network'
+                                      % (item, self._version))
+            networks.append(network)
+        return self.Set(networks)
+
+    def cast(self, value):
+        return value
+
+    class Set(object):
+
+        def __init__(self, networks):
+            import ipaddress
+            self._networks = []
+            self._ranges = {4: ([], []), 6: ([], [])}
+            for version in (4, 6):
+                collapsed = list(ipaddress.collapse_addresses(
+                    n for n in networks if n.version == version))
+                self._networks.extend(collapsed)
+                starts, ends = self._ranges[version]
+                for network in collapsed:
+                    first = int(network.network_address)
+                    last = int(network.broadcast_address)
+                    if ends and first <= ends[-1] + 1:
+                        ends[-1] = max(ends[-1], last)
+                    else:
+                        starts.append(first)
+                        ends.append(last)
+
+        def __repr__(self):
+            return 'IPNetworkSet.Set(%s)' % ', '.join(str(n) for n in self._networks)
+
+        def __len__(self):
+            return len(self._networks)
+
+        def __iter__(self):
+            return iter(self._networks)
+
+        def __contains__(self, item):
+            if not hasattr(item, 'version'):
+                import ipaddress
+                try:
+                    if '/' in item:
+                        item = ipaddress.ip_network(item, strict=False)
+                    else:
+                        item = ipaddress.ip_address(item)
+                except (TypeError, ValueError):
+                    return False
+            if hasattr(item, 'network_address'):
+                first = int(item.network_address)
+                last = int(item.broadcast_address)
+            else:
+                first = last = int(item)
+            starts, ends = self._ranges[item.version]
+            index = bisect.bisect_right(starts, first) - 1
+            return index >= 0 and last <= ends[index]
+
+
 class Url(String):
 
     """ A string based type representing an URL.
@@ -265,9 +453,10 @@ class Url(String):
         proxy = "http://proxy:3128"
     """
 
+    @memoize
     def validate(self, value):
         try:
-            return urlparse.urlparse(value)
+            return _get_urlparse()(value)
         except ValueError as err:
             raise ValidationError(str(err))
 
@@ -284,7 +473,7 @@ class IPSocketAddress(String):
     """
 
     def __init__(self, default_addr='127.0.0.1', default_port=None, version=None, **kwargs):
-        if not IPADDR_ENABLED:
+        if not _importable('ipaddr'):
             raise RuntimeError('You must install the ipaddr package to use this type')
         self._default_addr = default_addr
         self._default_port = default_port
@@ -301,6 +490,7 @@ class IPSocketAddress(String):
             else:
                 raw_port = self._default_port
 
+        import ipaddr
         try:
             addr = ipaddr.IPAddress(raw_addr, version=self._version)
         except (ValueError, ipaddr.AddressValueError) as err:
@@ -328,6 +518,7 @@ class IPSocketAddress(String):
             return (str(self.addr), self.port)
 
         def _create_socket(self, type):
+            socket = _get_socket()
             if self.addr.version == 4:
                 family = socket.AF_INET
             else:
@@ -345,16 +536,16 @@ class IPSocketAddress(String):
             return sock
 
         def to_listening_tcp_socket(self):
-            return self.to_listening_socket(socket.SOCK_STREAM)
+            return self.to_listening_socket(_get_socket().SOCK_STREAM)
 
         def to_listening_udp_socket(self):
-            return self.to_listening_socket(socket.SOCK_DGRAM)
+            return self.to_listening_socket(_get_socket().SOCK_DGRAM)
 
         def to_tcp_socket(self):
-            return self.to_socket(socket.SOCK_STREAM)
+            return self.to_socket(_get_socket().SOCK_STREAM)
 
         def to_udp_socket(self):
-            return self.to_socket(socket.SOCK_DGRAM)
+            return self.to_socket(_get_socket().SOCK_DGRAM)
 
 
 class Eval(String):
@@ -381,10 +572,14 @@ class Eval(String):
         else:
             self._globals = globals
 
+    @memoize
+    def _compile(self, value):
+        return compile(value, '<string>', 'eval')
+
     def validate(self, value):
         value = super(Eval, self).validate(value)
         try:
-            return eval(value, self._globals, self._locals)
+            return eval(self._compile(value), self._globals, self._locals)
         except Exception as err:
             raise ValidationError('Bad expression: %s' % err)
 
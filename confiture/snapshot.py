@@ -0,0 +1,554 @@
+""" Flat read-only snapshots of configuration trees.
+
+A snapshot serialises a (validated) configuration tree into a single flat
+buffer which can be stored in a file mapped in memory, or in a shared memory
+segment. The tree is then read directly from the buffer, without building
+the Python objects of the whole tree: processes of a pre-fork worker pool
+attaching the same snapshot share a single physical copy of the
+configuration.
+
+Snapshot format (all integers are little-endian)::
+
+    header      magic (4s), version (H), flags (H), strings offset (I),
+                root section offset (I)
+    strings     count (I), count + 1 offsets (I), UTF-8 data; strings are
+                sorted so names can be looked up using a binary search
+    values      tag (c) followed by the payload of the value
+    sections    name (I), args value offset (I, 0 if none), position (3I),
+                args position (3I), values count (I), groups count (I),
+                values entries (name, value offset, position: 5I) sorted by
+                name, sections groups (name, count, offsets array: 3I)
+                sorted by name; positions are file name, line and column
+                (the file name is 0xFFFFFFFF for missing positions)
+
+Values which can't be natively represented (numbers which do not fit in 64
+bits, objects returned by schema types...) are pickled. Safe snapshots, made
+to be read from untrusted buffers, store them as strings instead, and their
+readers refuse pickled values.
+"""
+
+import os
+import struct
+import pickle
+
+from confiture.tree import (ConfigSection, ConfigValue, Position,
+                            MultipleSectionsWithThisNameError)
+
+
+MAGIC = b'CFSN'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHII')
+_UINT = struct.Struct('<I')
+_INT64 = struct.Struct('<q')
+_DOUBLE = struct.Struct('<d')
+_SECTION = struct.Struct('<IIIIIIIIII')
+_VALUE_ENTRY = struct.Struct('<IIIII')
+_GROUP_ENTRY = struct.Struct('<III')
+
+_NO_POSITION = (0xFFFFFFFF, 0, 0)  # Position written for missing positions
+
+_created_segments = set()  # Names of the shared memory segments created by
+                           # this process (or its parent before forking)
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+try:
+    _TEXT = unicode
+except NameError:
+    _TEXT = str
+
+
+class SnapshotError(Exception):
+    """ Exception raised when a buffer is not a valid snapshot.
+    """
+
+
+#
+# Writing
+#
+
+def _is_native(value):
+    """ Check if a value can be stored without pickling it.
+    """
+    value_type = type(value)
+    if value_type is int:
+        return _INT64_MIN <= value <= _INT64_MAX
+    return value is None or value_type in (bool, float, _TEXT, list)
+
+
+class _Writer(object):
+
+    def __init__(self, safe=False):
+        self.safe = safe  # Store non native values as strings
+        self.strings = set()
+        self.string_index = {}
+        self.buffer = bytearray(_HEADER.size)
+
+    def collect(self, section):
+        """ Collect the strings used by a tree.
+        """
+        sections = [section]
+        while sections:
+            section = sections.pop()
+            self.strings.add(section.name)
+            if section.args_raw is not None:
+                self.collect_value(section.args_raw.value)
+                self.collect_position(section.args_raw.position)
+            self.collect_position(section.position)
+            for name, child in section.iteritems(expand_sections=True):
+                self.strings.add(name)
+                if isinstance(child, ConfigSection):
+                    sections.append(child)
+                else:
+                    self.collect_position(child.position)
+                    self.collect_value(child.value)
+
+    def collect_position(self, position):
+        if position is not None:
+            self.strings.add(position.file)
+
+    def collect_value(self, value):
+        if type(value) is _TEXT:
+            self.strings.add(value)
+        elif type(value) is list:
+            for item in value:
+                self.collect_value(item)
+        elif self.safe and not _is_native(value):
+            self.strings.add(_TEXT(value))
+
+    def write_strings(self):
+        strings = sorted(self.strings, key=lambda x: x.encode('utf-8'))
+        self.string_index = dict((s, i) for i, s in enumerate(strings))
+        encoded = [s.encode('utf-8') for s in strings]
+        offset = len(self.buffer)
+        self.buffer += _UINT.pack(len(encoded))
+        position = 0
+        for data in encoded:
+            self.buffer += _UINT.pack(position)
+            position += len(data)
+        self.buffer += _UINT.pack(position)
+        for data in encoded:
+            self.buffer += data
+        return offset
+
+    def write_value(self, value):
+        offset = len(self.buffer)
+        buf = self.buffer
+        if value is None:
+            buf += b'N'
+        elif value is True:
+            buf += b'T'
+        elif value is False:
+            buf += b'F'
+        elif type(value) is int and _INT64_MIN <= value <= _INT64_MAX:
+            buf += b'i' + _INT64.pack(value)
+        elif type(value) is float:
+            buf += b'd' + _DOUBLE.pack(value)
+        elif type(value) is _TEXT:
+            buf += b's' + _UINT.pack(self.string_index[value])
+        elif type(value) is list:
+            buf += b'l' + _UINT.pack(len(value))
+            for item in value:
+                self.write_value(item)
+        elif self.safe:
+            buf += b's' + _UINT.pack(self.string_index[_TEXT(value)])
+        else:
+            data = pickle.dumps(value, protocol=2)
+            buf += b'p' + _UINT.pack(len(data)) + data
+        return offset
+
+    def position(self, position):
+        if position is None:
+            return _NO_POSITION
+        return (self.string_index[position.file], position.lineno, position.pos)
+
+    def write_section(self, section):
+        """ Write a tree, return the offset of its top section.
+
+        Sections are written after their sub-sections (whose offsets they
+        store), walking the tree with a stack of iterators instead of
+        recursively.
+        """
+        # Stack of (name, section, children iterator, values, groups):
+        stack = [(None, section, iter(section.iteritems(expand_sections=True)), [], {})]
+        while True:
+            _, section, children, values, groups = stack[-1]
+            for name, child in children:
+                if isinstance(child, ConfigSection):
+                    stack.append((name, child, iter(child.iteritems(expand_sections=True)),
+                                  [], {}))
+                    break
+                else:
+                    values.append((self.string_index[name], self.write_value(child.value))
+                                  + self.position(child.position))
+            else:
+                name = stack.pop()[0]
+                offset = self.write_section_entry(section, values, groups)
+                if not stack:
+                    return offset
+                stack[-1][4].setdefault(name, []).append(offset)
+
+    def write_section_entry(self, section, values, groups):
+        if section.args_raw is not None:
+            args = self.write_value(section.args_raw.value)
+            args_position = self.position(section.args_raw.position)
+        else:
+            args = 0
+            args_position = (0, 0, 0)
+        arrays = []
+        for name, offsets in groups.items():
+            arrays.append((self.string_index[name], len(offsets), len(self.buffer)))
+            for child_offset in offsets:
+                self.buffer += _UINT.pack(child_offset)
+        offset = len(self.buffer)
+        self.buffer += _SECTION.pack(self.string_index[section.name], args,
+                                     *(self.position(section.position) + args_position
+                                       + (len(values), len(arrays))))
+        for entry in sorted(values):
+            self.buffer += _VALUE_ENTRY.pack(*entry)
+        for entry in sorted(arrays):
+            self.buffer += _GROUP_ENTRY.pack(*entry)
+        return offset
+
+
+def dumps(section, safe=False):
+    """ Serialise a configuration tree to a snapshot (as bytes).
+
+    If safe is True, values which can't be natively represented are stored
+    as strings instead of being pickled, so the snapshot can be read by
+    a :class:`Snapshot` opened in safe mode.
+    """
+    writer = _Writer(safe=safe)
+    writer.collect(section)
+    strings = writer.write_strings()
+    root = writer.write_section(section)
+    _HEADER.pack_into(writer.buffer, 0, MAGIC, VERSION, 0, strings, root)
+    return bytes(writer.buffer)
+
+
+def dump(section, fileobj, safe=False):
+    """ Serialise a configuration tree to a snapshot in a file object (see
+        :func:`dumps` for the safe argument).
+    """
+    fileobj.write(dumps(section, safe=safe))
+
+
+def to_shared_memory(section, name=None):
+    """ Serialise a configuration tree to a new shared memory segment.
+
+    Return the :class:`multiprocessing.shared_memory.SharedMemory` object,
+    which must be kept (and unlinked when the segment is no longer needed)
+    by the creator. Worker processes attach the segment using
+    :meth:`Snapshot.from_shared_memory` with the name of the segment.
+    """
+    from multiprocessing import shared_memory
+    data = dumps(section)
+    segment = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    segment.buf[:len(data)] = data
+    _created_segments.add(segment.name)
+    return segment
+
+
+#
+# Reading
+#
+
+class Snapshot(object):
+
+    """ A read-only view of a snapshot stored in a buffer.
+
+    :param buffer: any object supporting the buffer protocol (bytes, mmap,
+        shared memory buffer...)
+    :param safe: refuse pickled values (raising a :class:`SnapshotError`),
+        for buffers which can't be trusted (see the safe argument of
+        :func:`dumps`)
+
+    Usage example::
+
+        >>> # In the master process, before forking:
+        >>> segment = to_shared_memory(config, name='app-config')
+        >>> # In workers:
+        >>> snapshot = Snapshot.from_shared_memory('app-config')
+        >>> snapshot.root.subsection('database').get('host')
+        'localhost'
+    """
+
+    def __init__(self, buffer, owner=None, safe=False):
+        self._view = memoryview(buffer)
+        self._owner = owner
+        self._safe = safe
+        if len(self._view) < _HEADER.size:
+            raise SnapshotError('buffer is too small to be a snapshot')
+        magic, version, _, strings, root = _HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise SnapshotError('bad snapshot magic %r' % magic)
+        if version != VERSION:
+            raise SnapshotError('unsupported snapshot version %d' % version)
+        self._count = _UINT.unpack_from(self._view, strings)[0]
+        self._offsets = strings + _UINT.size
+        self._data = self._offsets + (self._count + 1) * _UINT.size
+        self._lookups = {}  # Cache of looked up names
+        self._root = root
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def from_file(cls, filename):
+        """ Map a snapshot file in memory.
+        """
+        import mmap
+        with open(filename, 'rb') as fsnapshot:
+            mapping = mmap.mmap(fsnapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapping, owner=mapping)
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """ Attach a snapshot stored in a shared memory segment.
+
+        The segment is owned by its creator: it is not registered to the
+        resource tracker of the attaching process, which would unlink it
+        when the process exits.
+        """
+        from multiprocessing import shared_memory
+        try:
+            segment = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13, always tracked
+            segment = shared_memory.SharedMemory(name=name)
+            # The processes forked from the creator share its tracker, where
+            # the segment is already registered (and must stay registered):
+            if os.name == 'posix' and segment.name not in _created_segments:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(segment._name, 'shared_memory')
+        return cls(segment.buf, owner=segment)
+
+    def close(self):
+        """ Release the buffer (and close the mapping or segment if the
+            snapshot was created using :meth:`from_file` or
+            :meth:`from_shared_memory`).
+        """
+        self._view.release()
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+    @property
+    def root(self):
+        """ The top section of the snapshot.
+        """
+        return SnapshotSection(self, self._root)
+
+    def string(self, index):
+        start, end = struct.unpack_from('<II', self._view, self._offsets + index * _UINT.size)
+        return self._view[self._data + start:self._data + end].tobytes().decode('utf-8')
+
+    def lookup(self, name):
+        """ Get the index of a string in the strings table, or None.
+        """
+        try:
+            return self._lookups[name]
+        except KeyError:
+            pass
+        encoded = name.encode('utf-8')
+        view = self._view
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            start, end = struct.unpack_from('<II', view, self._offsets + middle * _UINT.size)
+            if view[self._data + start:self._data + end].tobytes() < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        index = None
+        if low < self._count and self.string(low) == name:
+            index = low
+        self._lookups[name] = index
+        return index
+
+    def position(self, file_, lineno, pos):
+        if file_ == _NO_POSITION[0]:
+            return None
+        return Position(self.string(file_), lineno, pos)
+
+    def value(self, offset):
+        """ Decode the value at offset, return the value and the offset of the
+            next value.
+        """
+        tag = self._view[offset:offset + 1].tobytes()
+        offset += 1
+        if tag == b'N':
+            return None, offset
+        elif tag == b'T':
+            return True, offset
+        elif tag == b'F':
+            return False, offset
+        elif tag == b'i':
+            return _INT64.unpack_from(self._view, offset)[0], offset + _INT64.size
+        elif tag == b'd':
+            return _DOUBLE.unpack_from(self._view, offset)[0], offset + _DOUBLE.size
+        elif tag == b's':
+            index = _UINT.unpack_from(self._view, offset)[0]
+            return self.string(index), offset + _UINT.size
+        elif tag == b'l':
+            count = _UINT.unpack_from(self._view, offset)[0]
+            offset += _UINT.size
+            items = []
+            for _ in range(count):
+                item, offset = self.value(offset)
+                items.append(item)
+            return items, offset
+        elif tag == b'p':
+            if self._safe:
+                raise SnapshotError('pickled values are not allowed in safe snapshots')
+            size = _UINT.unpack_from(self._view, offset)[0]
+            offset += _UINT.size
+            return pickle.loads(self._view[offset:offset + size].tobytes()), offset + size
+        else:
+            raise SnapshotError('bad value tag %r' % tag)
+
+
+class SnapshotSection(ConfigSection):
+
+    """ A section read from a snapshot, exposing the ConfigSection API.
+
+    Children are decoded from the snapshot buffer on each access, nothing is
+    cached. Snapshot sections are read-only.
+    """
+
+    def __init__(self, snapshot, offset, parent=None):
+        fields = _SECTION.unpack_from(snapshot._view, offset)
+        name, args = fields[0:2]
+        if args:
+            args = ConfigValue('<args>', snapshot.value(args)[0],
+                               position=snapshot.position(*fields[5:8]))
+        else:
+            args = None
+        super(SnapshotSection, self).__init__(snapshot.string(name), parent=parent,
+                                              args=args,
+                                              position=snapshot.position(*fields[2:5]))
+        self._snapshot = snapshot
+        self._values_offset = offset + _SECTION.size
+        self._values_count, self._groups_count = fields[8:10]
+        self._groups_offset = self._values_offset + self._values_count * _VALUE_ENTRY.size
+
+    def __repr__(self):
+        return "<SnapshotSection '%s'>" % self.name
+
+    def __contains__(self, name):
+        return self._find_value(name) is not None or self._find_group(name) is not None
+
+    def _entries(self, offset, count, struct_):
+        view = self._snapshot._view
+        return [struct_.unpack_from(view, offset + i * struct_.size) for i in range(count)]
+
+    def _find(self, name, offset, count, struct_):
+        index = self._snapshot.lookup(name)
+        if index is None:
+            return None
+        view = self._snapshot._view
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if _UINT.unpack_from(view, offset + middle * struct_.size)[0] < index:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count:
+            entry = struct_.unpack_from(view, offset + low * struct_.size)
+            if entry[0] == index:
+                return entry
+        return None
+
+    def _find_value(self, name):
+        return self._find(name, self._values_offset, self._values_count, _VALUE_ENTRY)
+
+    def _find_group(self, name):
+        return self._find(name, self._groups_offset, self._groups_count, _GROUP_ENTRY)
+
+    def _make_value(self, entry):
+        snapshot = self._snapshot
+        return ConfigValue(snapshot.string(entry[0]), snapshot.value(entry[1])[0],
+                           position=snapshot.position(*entry[2:5]))
+
+    def _make_sections(self, entry):
+        view = self._snapshot._view
+        _, count, offset = entry
+        return [SnapshotSection(self._snapshot, _UINT.unpack_from(view, offset + i * _UINT.size)[0],
+                                parent=self) for i in range(count)]
+
+    #
+    # Public API -- Tree construction methods
+    #
+
+    def register(self, child, name=None):
+        raise TypeError('snapshot sections are read-only')
+
+    def iterchildren(self):
+        return (child for _, child in self.iteritems())
+
+    def iterflatchildren(self):
+        return (child for _, child in self.iteritems(expand_sections=True))
+
+    def iteritems(self, expand_sections=False):
+        snapshot = self._snapshot
+        for entry in self._entries(self._values_offset, self._values_count, _VALUE_ENTRY):
+            yield snapshot.string(entry[0]), self._make_value(entry)
+        for entry in self._entries(self._groups_offset, self._groups_count, _GROUP_ENTRY):
+            name = snapshot.string(entry[0])
+            if expand_sections:
+                for section in self._make_sections(entry):
+                    yield name, section
+            else:
+                yield name, self._make_sections(entry)
+
+    #
+    # Public API -- User methods
+    #
+
+    def subsections(self, name):
+        entry = self._find_group(name)
+        return iter(() if entry is None else self._make_sections(entry))
+
+    def subsection(self, name, default=None):
+        entry = self._find_group(name)
+        if entry is None:
+            return default
+        elif entry[1] > 1:
+            msg = '%s.subsection can\'t return multiple sections' % self.__class__.__name__
+            raise MultipleSectionsWithThisNameError(msg)
+        else:
+            return self._make_sections(entry)[0]
+
+    def get(self, name, default=None, raw=True):
+        entry = self._find_value(name)
+        if entry is None:
+            return default
+        elif raw:
+            return self._snapshot.value(entry[1])[0]
+        else:
+            return self._make_value(entry)
+
+    def to_dict(self):
+        output = {}
+        for name, child in self.iteritems():
+            if isinstance(child, list):
+                output[name] = [section.to_dict() for section in child]
+            else:
+                output[name] = child.value
+        return output
+
+    def to_section(self):
+        """ Materialise the snapshot section as a standalone ConfigSection.
+        """
+        section = ConfigSection(self.name, args=self.args_raw, position=self.position)
+        for name, child in self.iteritems(expand_sections=True):
+            if isinstance(child, ConfigSection):
+                child = child.to_section()
+                child.parent = section
+            section.register(child, name=name)
+        return section
@@ -0,0 +1,67 @@
+""" Confiture's archive opener tests.
+"""
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from confiture import Confiture
+from confiture.parser import ArchiveOpener, ParsingError
+
+
+FILES = {
+    'app.conf': 'name = "app"\ninclude "conf.d/*.conf"\ninclude "extra.conf"\n',
+    'conf.d/a.conf': 'backend "a" {}\n',
+    'conf.d/b.conf': 'backend "b" {}\ninclude "conf.d/sub/*.conf"\n',
+    'conf.d/sub/c.conf': 'backend "c" {}\n',
+    'extra.conf': u'comment = "\xe9t\xe9"\n',
+}
+
+
+def _zip(path):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in FILES.items():
+            archive.writestr(name, data.encode('utf-8'))
+
+
+def _tar(path):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, data in FILES.items():
+            data = data.encode('utf-8')
+            info = tarfile.TarInfo('./' + name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture(params=[_zip, _tar])
+def opener(request, tmpdir):
+    path = str(tmpdir.join('bundle'))
+    request.param(path)
+    return ArchiveOpener(path)
+
+
+def test_archive(opener):
+    config = Confiture(opener.read('app.conf'), external_opener=opener,
+                       input_name=opener.name('app.conf')).parse()
+    assert [s.args for s in config.subsections('backend')] == [['a'], ['b'], ['c']]
+    assert config.get('comment') == u'\xe9t\xe9'
+    backend = next(config.subsections('backend'))
+    assert backend.position.file.endswith('bundle:conf.d/a.conf')
+
+
+def test_open(opener):
+    assert [name.split(':')[-1] for name, _ in opener.open('conf.d/*.conf')] == \
+        ['conf.d/a.conf', 'conf.d/b.conf']
+    assert list(opener.open('./conf.d/sub/?.conf'))[0][1] == 'backend "c" {}\n'
+    assert list(opener.open('unknown.conf')) == []
+    with pytest.raises(ParsingError):
+        opener.read('unknown.conf')
+
+
+def test_bad_archive(tmpdir):
+    path = tmpdir.join('bad')
+    path.write('not an archive')
+    with pytest.raises(ParsingError):
+        ArchiveOpener(str(path))
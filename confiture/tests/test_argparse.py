@@ -0,0 +1,72 @@
+""" Confiture's argparse integration tests.
+"""
+
+import argparse
+
+import pytest
+
+from confiture import Confiture
+from confiture.parser import ConfitureParser
+from confiture.schema import ValidationContext
+from confiture.schema.containers import Section, Value, List
+from confiture.schema.types import Boolean, String
+
+
+def _schema_class():
+    class Schema(Section):
+
+        debug = Value(Boolean(), argparse_names=['-d', '--debug'],
+                      argparse_names_invert=['-q', '--quiet'])
+        paths = List(String(), argparse_names=['--paths'])
+
+    return Schema
+
+
+Schema = _schema_class()
+
+
+CONFIG = '''
+debug = no
+paths = '/bin', '/usr/bin'
+'''
+
+
+def _parse_args(schema, argv):
+    parser = argparse.ArgumentParser()
+    schema.populate_argparse(parser)
+    return parser.parse_args(argv)
+
+
+def test_override():
+    schema = Schema()
+    args = _parse_args(schema, ['-d', '--paths', '/sbin'])
+    config = Confiture(CONFIG, schema=schema, argparse_args=args).parse()
+    assert config.get('debug') is True
+    assert config.get('paths') == ['/sbin']
+
+
+def test_no_override():
+    schema = _schema_class()()  # Containers keep the last parsed command line
+    _parse_args(schema, [])
+    config = Confiture(CONFIG, schema=schema).parse()
+    assert config.get('debug') is False
+    assert config.get('paths') == ['/bin', '/usr/bin']
+
+
+def test_override_without_namespace():
+    schema = _schema_class()()
+    _parse_args(schema, ['-d'])
+    with pytest.warns(DeprecationWarning):
+        config = Confiture(CONFIG, schema=schema).parse()
+    assert config.get('debug') is True
+    assert config.get('paths') == ['/bin', '/usr/bin']
+
+
+def test_schema_reuse():
+    schema = Schema()
+    args_debug = _parse_args(schema, ['-d'])
+    args_quiet = _parse_args(schema, ['-q'])
+    tree = ConfitureParser(CONFIG).parse()
+    assert schema.validate(tree, ValidationContext(args_debug)).get('debug') is True
+    assert schema.validate(tree, ValidationContext(args_quiet)).get('debug') is False
+    assert schema.validate(tree, ValidationContext(args_debug)).get('debug') is True
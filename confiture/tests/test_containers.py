@@ -0,0 +1,179 @@
+""" Confiture's schema containers tests.
+"""
+
+import array
+
+import pytest
+
+from confiture.tree import ConfigValue
+from confiture.schema import ValidationError
+from confiture.schema.containers import List, Array
+from confiture.schema.types import Integer, Float, String
+
+
+def test_list_as_array():
+    container = List(Integer(), as_array=True)
+    validated = container.validate(ConfigValue('test', [1, 2.0, True]))
+    assert isinstance(validated.value, array.array) or hasattr(validated.value, 'dtype')
+    assert list(validated.value) == [1, 2, 1]
+
+
+def test_list_as_array_float():
+    container = List(Float(), as_array=True)
+    validated = container.validate(ConfigValue('test', [1, 2.5]))
+    assert list(validated.value) == [1.0, 2.5]
+
+
+def test_list_as_array_errors():
+    container = List(Integer(min=0, max=10), as_array=True)
+    with pytest.raises(ValidationError) as excinfo:
+        container.validate(ConfigValue('test', [1, 'foo']))
+    assert str(excinfo.value).startswith('item #1,')
+    with pytest.raises(ValidationError) as excinfo:
+        container.validate(ConfigValue('test', [1, 2.5]))
+    assert str(excinfo.value).startswith('item #1,')
+    with pytest.raises(ValidationError) as excinfo:
+        container.validate(ConfigValue('test', [1, 2, -1]))
+    assert str(excinfo.value).startswith('item #2,')
+    with pytest.raises(ValidationError) as excinfo:
+        container.validate(ConfigValue('test', [11]))
+    assert str(excinfo.value).startswith('item #0,')
+
+
+def test_list_as_array_subclass():
+    class EvenInteger(Integer):
+        def validate(self, value):
+            value = super(EvenInteger, self).validate(value)
+            if value % 2:
+                raise ValidationError('%r is odd' % value)
+            return value // 2
+
+    container = List(EvenInteger(), as_array=True)
+    assert list(container.validate(ConfigValue('test', [2, 4])).value) == [1, 2]
+    with pytest.raises(ValidationError) as excinfo:
+        container.validate(ConfigValue('test', [2, 3]))
+    assert str(excinfo.value).startswith('item #1,')
+
+
+def test_list_as_array_bad_type():
+    with pytest.raises(TypeError):
+        List(String(), as_array=True)
+
+
+def test_array_as_array():
+    container = Array(2, Float(), as_array=True)
+    assert list(container.validate(ConfigValue('test', [1, 2])).value) == [1.0, 2.0]
+    with pytest.raises(ValidationError):
+        container.validate(ConfigValue('test', [1, 2, 3]))
+
+
+def _columnar_schema():
+    from confiture.schema.containers import Section, Value, many
+
+    class BackendSection(Section):
+        host = Value(String())
+        port = Value(Integer())
+        weight = Value(Float(), default=1.0)
+        backup = Value(Integer(), default=None)
+        _meta = {'args': Value(String()), 'repeat': many, 'columnar': True}
+
+    class MainSection(Section):
+        backend = BackendSection()
+
+    return MainSection()
+
+
+COLUMNAR = '''backend "a" {
+    host = "10.0.0.1"
+    port = 80
+}
+backend "b" {
+    host = "10.0.0.2"
+    port = 8080
+    weight = 0.5
+    backup = 1
+}
+backend "c" {
+    host = "10.0.0.3"
+    port = 443
+}
+'''
+
+
+def test_columnar():
+    from confiture import Confiture
+    from confiture.tree import ConfigSection
+    config = Confiture(COLUMNAR, schema=_columnar_schema()).parse()
+    backends = list(config.subsections('backend'))
+    assert all(isinstance(b, ConfigSection) for b in backends)
+    assert [b.args for b in backends] == ['a', 'b', 'c']
+    assert backends[1].get('weight') == 0.5
+    assert backends[1].get('port', raw=False).position.lineno == 5
+    assert backends[2].get('backup', 42) is None
+    assert backends[0].parent is config
+    assert config.to_dict()['backend'][0] == {'host': '10.0.0.1', 'port': 80,
+                                              'weight': 1.0, 'backup': None}
+    with pytest.raises(TypeError):
+        backends[0].register(ConfigValue('key', 1))
+    family = config.columns('backend')
+    assert len(family) == 3
+    assert family.column('port') == array.array(Integer.array_typecode, [80, 8080, 443])
+    assert family.column('backup') == [None, 1, None]
+    assert sum(family.column('weight')) == 2.5
+
+
+def test_columnar_pickle():
+    import pickle
+    from confiture import Confiture
+    config = Confiture(COLUMNAR, schema=_columnar_schema()).parse()
+    loaded = pickle.loads(pickle.dumps(config))
+    assert loaded.to_dict() == config.to_dict()
+    backends = list(loaded.subsections('backend'))
+    assert backends[0].parent is loaded
+    assert backends[1].get('port', raw=False).position.lineno == 5
+    assert loaded.columns('backend').column('port') == config.columns('backend').column('port')
+
+
+def test_columnar_without_positions():
+    from confiture.tree import ConfigSection, Columns, Position
+    family = Columns('backend', ['port'])
+    for position in (None, Position('app.conf', None, None), Position(None, 3, 7)):
+        section = ConfigSection('backend', position=position)
+        section.register(ConfigValue('port', 80, position=position))
+        family.append(section)
+    positions = [row.position for row in family]
+    assert positions[0] is None
+    assert (positions[1].file, positions[1].lineno, positions[1].pos) == ('app.conf', None, None)
+    assert (positions[2].file, positions[2].lineno, positions[2].pos) == (None, 3, 7)
+    assert family.select([True, False, False])[0].position is None
+
+
+def test_columnar_select():
+    from confiture import Confiture
+    config = Confiture(COLUMNAR, schema=_columnar_schema()).parse()
+    family = config.columns('backend')
+    selected = family.select([port > 100 for port in family.column('port')])
+    assert selected.args == ['b', 'c']
+    assert list(selected.column('port')) == [8080, 443]
+    assert [r.get('host') for r in family.select(lambda r: r.args == 'a')] == ['10.0.0.1']
+    assert family[-1].args == 'c'
+    with pytest.raises(ValueError):
+        family.select([True])
+
+
+def test_columnar_subsections():
+    from confiture.schema.containers import Section, Value, many
+
+    class Sub(Section):
+        pass
+
+    class BackendSection(Section):
+        sub = Sub()
+        _meta = {'repeat': many, 'columnar': True}
+
+    class MainSection(Section):
+        backend = BackendSection()
+
+    from confiture import Confiture
+    with pytest.raises(ValidationError):
+        Confiture('backend {\n    sub {}\n}\n', schema=MainSection()).parse()
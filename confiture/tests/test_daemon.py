@@ -0,0 +1,168 @@
+""" Confiture's configuration daemon tests.
+"""
+
+import os
+import time
+import errno
+import socket
+import threading
+
+import pytest
+
+from confiture import Confiture
+from confiture.daemon import ConfigServer, ConfigClient, QueryError, resolve
+from confiture.schema.containers import Section, Value, many
+from confiture.schema.types import Integer, String
+
+
+class BackendSection(Section):
+    port = Value(Integer())
+    _meta = {'args': Value(String()), 'repeat': many}
+
+
+class MainSection(Section):
+    name = Value(String())
+    backend = BackendSection()
+
+
+CONFIG = '''name = "%s"
+backend "foo" {
+    port = 8080
+}
+backend "bar" {
+    port = 80
+}
+'''
+
+
+@pytest.fixture
+def server(tmpdir):
+    filename = tmpdir.join('app.conf')
+    filename.write(CONFIG % 'first')
+    loader = lambda: Confiture.from_filename(str(filename), schema=MainSection()).parse()
+    server = ConfigServer(str(tmpdir.join('app.sock')), loader,
+                          watch=[str(filename)], interval=0.01)
+    server.filename = filename
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_resolve():
+    config = Confiture(CONFIG % 'x', schema=MainSection()).parse()
+    output, name = resolve(config, 'backend[bar].port')
+    assert (name, output.get('port')) == ('port', 80)
+    output, name = resolve(config, 'backend')
+    assert len(list(output.subsections('backend'))) == 2
+    with pytest.raises(QueryError):
+        resolve(config, 'backend.port')
+
+
+def test_get(server):
+    client = ConfigClient(server.socket_path)
+    assert client.get('name') == 'first'
+    assert client.get('backend[foo].port') == 8080
+    assert client.get('backend[foo]').get('port') == 8080
+    assert [b.get('port') for b in client.get('backend')] == [8080, 80]
+    assert client.get('unknown', 42) == 42
+    with pytest.raises(QueryError):
+        client.get('backend.port')
+    assert client.version() == 1
+    client.close()
+
+
+def test_cache_and_reload(server):
+    client = ConfigClient(server.socket_path, max_age=0)
+    assert client.get('name') == 'first'
+    assert client.get('name') == 'first'  # Revalidated, not modified
+    server.filename.write(CONFIG % 'second')
+    os.utime(str(server.filename), (time.time() + 10, time.time() + 10))
+    for _ in range(500):
+        if client.version() == 2:
+            break
+        time.sleep(0.01)
+    assert client.get('name') == 'second'
+    cached = ConfigClient(server.socket_path, max_age=3600)
+    assert cached.get('name') == 'second'
+    server.filename.write('invalid')
+    server.reload()  # Errors keep the current configuration
+    assert client.get('name') == 'second'
+    assert cached.get('name') == 'second'
+
+
+def test_bad_requests(server):
+    from confiture.daemon import _HEADER, _send_frame, _recv_frame, GET, ERROR
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect(server.socket_path)
+    try:
+        _send_frame(sock, _HEADER.pack(GET, 0) + b'\xff\xfe')
+        assert _recv_frame(sock)[:1] == ERROR
+        _send_frame(sock, b'G')
+        assert _recv_frame(sock)[:1] == ERROR
+        _send_frame(sock, _HEADER.pack(GET, 0) + b'name')  # Still connected
+        assert _recv_frame(sock)[:1] != ERROR
+    finally:
+        sock.close()
+
+
+def test_socket_path(tmpdir):
+    loader = lambda: Confiture(CONFIG % 'x', schema=MainSection()).parse()
+    path = str(tmpdir.join('app.sock'))
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)  # Left by a previous server
+    stale.close()
+    server = ConfigServer(path, loader)
+    server.start()
+    try:
+        client = ConfigClient(path)
+        assert client.get('name') == 'x'
+        client.close()
+    finally:
+        server.stop()
+    path = tmpdir.join('app.conf')
+    path.write('data')
+    with pytest.raises(OSError) as excinfo:
+        ConfigServer(str(path), loader).start()
+    assert excinfo.value.errno == errno.EEXIST
+    assert path.read() == 'data'
+
+
+def test_truncated_response(tmpdir):
+    from confiture.daemon import _send_frame, _recv_frame
+    path = str(tmpdir.join('app.sock'))
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+
+    def serve():
+        connection, _ = listener.accept()
+        _recv_frame(connection)
+        _send_frame(connection, b'V')
+        connection.close()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        with pytest.raises(QueryError):
+            ConfigClient(path).get('name')
+    finally:
+        thread.join(5)
+        listener.close()
+
+
+def test_non_native_values(tmpdir):
+    from confiture.schema.types import RegexPattern
+
+    class Schema(Section):
+        pattern = Value(RegexPattern())
+
+    loader = lambda: Confiture('pattern = "[a-z]+"\n', schema=Schema()).parse()
+    server = ConfigServer(str(tmpdir.join('app.sock')), loader)
+    server.start()
+    try:
+        client = ConfigClient(server.socket_path)
+        assert client.get('pattern') == str(loader().get('pattern'))
+        client.close()
+    finally:
+        server.stop()
@@ -0,0 +1,85 @@
+""" Confiture's event parsing tests.
+"""
+
+import pytest
+
+from confiture.parser import ConfitureParser, ExternalOpener, ParsingError
+from confiture.events import iterparse, parse_events, EventHandler
+
+
+CONFIG = '''
+listen = 80
+tags = "a", "b",
+vhost "example.com", 443 {
+    listen = 1 k
+    location {}
+}
+include "other.conf"
+'''
+
+
+class DictOpener(ExternalOpener):
+
+    def __init__(self, files):
+        self.files = files
+
+    def open(self, locator):
+        yield locator, self.files[locator]
+
+
+def test_events():
+    opener = DictOpener({'other.conf': 'listen_other = 8080\n'})
+    events = [(e.kind, e.name, e.value) for e in iterparse(CONFIG, external_opener=opener)]
+    assert events == [('value', 'listen', 80),
+                      ('value', 'tags', ['a', 'b']),
+                      ('section_start', 'vhost', ['example.com', 443]),
+                      ('value', 'listen', 1000),
+                      ('section_start', 'location', None),
+                      ('section_end', 'location', None),
+                      ('section_end', 'vhost', None),
+                      ('include', 'other.conf', None),
+                      ('value', 'listen_other', 8080)]
+
+
+def test_events_positions():
+    opener = DictOpener({'other.conf': 'listen_other = 8080\n'})
+    tree = ConfitureParser(CONFIG, external_opener=opener).parse()
+    events = iterparse(CONFIG, input_name='<unknown>', external_opener=opener)
+    positions = dict((e.name, e.position) for e in events if e.kind == 'section_start')
+    assert str(positions['vhost']) == str(tree.subsection('vhost').position)
+    events = iterparse(CONFIG, external_opener=opener)
+    values = [e for e in events if e.kind == 'value' and e.name == 'listen_other']
+    assert str(values[0].position) == str(tree.get('listen_other', raw=False).position)
+
+
+@pytest.mark.parametrize('config', ['a = 1 b = 2\nc = 3', 'a {\n', 'a = = 1\n', '}\n'])
+def test_events_errors(config):
+    with pytest.raises(ParsingError) as parser_error:
+        ConfitureParser(config).parse()
+    with pytest.raises(ParsingError) as events_error:
+        list(iterparse(config))
+    assert str(events_error.value) == str(parser_error.value)
+    assert str(events_error.value.position) == str(parser_error.value.position)
+
+
+def test_events_tree_opener():
+    included = ConfitureParser('section {\n    key = 1\n}\n', input_name='tree.conf').parse()
+    events = list(iterparse('include "tree.conf"\n', external_opener=lambda locator: [included]))
+    assert [e.kind for e in events] == ['include', 'section_start', 'value', 'section_end']
+    assert str(events[1].position) == str(included.subsection('section').position)
+    assert events[3].position is None
+
+
+def test_parse_events():
+
+    class Collector(EventHandler):
+        def __init__(self):
+            self.listen = []
+
+        def value(self, name, value, position):
+            if name == 'listen':
+                self.listen.append(value)
+
+    collector = Collector()
+    parse_events(CONFIG, collector, external_opener=lambda locator: [])
+    assert collector.listen == [80, 1000]
@@ -0,0 +1,112 @@
+""" Confiture's configuration handle tests.
+"""
+
+import threading
+
+import pytest
+
+from confiture.handle import ConfigHandle
+
+
+def test_swap():
+    handle = ConfigHandle({'key': 1})
+    assert handle.version == 0
+    assert handle.current == {'key': 1}
+    assert handle.swap({'key': 2}) == 1
+    assert handle.current == {'key': 2}
+    with handle.read() as config:
+        assert config == {'key': 2}
+
+
+def test_reload():
+    values = iter([1, 2])
+    handle = ConfigHandle(loader=lambda: next(values))
+    assert handle.current == 1
+    handle.reload()
+    assert handle.current == 2
+    with pytest.raises(StopIteration):
+        handle.reload()
+    assert handle.current == 2
+    with pytest.raises(ValueError):
+        ConfigHandle(1).reload()
+
+
+def test_read_is_stable():
+    handle = ConfigHandle(1)
+    with handle.read() as config:
+        handle.swap(2)
+        assert config == 1
+        with handle.read() as nested:
+            assert nested == 1
+        assert handle.current == 2
+    with handle.read() as config:
+        assert config == 2
+
+
+def test_hook_without_readers():
+    released = []
+    handle = ConfigHandle(1)
+    handle.swap(2, hook=released.append)
+    assert released == [1]
+
+
+def test_hook_waits_readers():
+    released = []
+    handle = ConfigHandle(1)
+    entered = threading.Event()
+    leave = threading.Event()
+
+    def reader():
+        with handle.read():
+            entered.set()
+            leave.wait(5)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    entered.wait(5)
+    handle.swap(2, hook=released.append)
+    handle.swap(3, hook=released.append)
+    with handle.read():  # Readers of the new version do not delay hooks
+        pass
+    assert released == []
+    leave.set()
+    thread.join(5)
+    assert released == [1, 2]
+
+
+def test_failing_hook(caplog):
+    released = []
+    handle = ConfigHandle(1)
+
+    def fail(old):
+        raise RuntimeError('hook error')
+
+    with handle.read():
+        handle.swap(2, hook=fail)
+        handle.swap(3, hook=released.append)
+    assert released == [2]
+    assert 'swap to version 1 failed' in caplog.text
+    assert 'hook error' in caplog.text
+
+
+def test_concurrent_readers():
+    handle = ConfigHandle((0, 0))
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            with handle.read() as config:
+                if config[0] != config[1]:
+                    errors.append(config)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(1, 200):
+        handle.swap((i, i))
+    stop.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == []
+    assert handle.version == 199
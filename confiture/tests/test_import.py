@@ -0,0 +1,55 @@
+""" Confiture's import time tests.
+"""
+
+import sys
+import subprocess
+
+
+HEAVY_MODULES = ('ply.lex', 'ply.yacc', 'argparse', 'socket', 'urllib.parse',
+                 'ipaddr', 'ipaddress')
+
+
+def _import_times(statement):
+    """ Run statement in a new interpreter using -X importtime and return
+        the cumulative import time (in microseconds) of each imported module.
+    """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', statement],
+                               stderr=subprocess.PIPE, universal_newlines=True)
+    _, output = process.communicate()
+    assert process.returncode == 0, output
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time():
+    times = _import_times('import confiture, confiture.schema.containers, '
+                          'confiture.schema.types')
+    assert 'confiture' in times
+    for module in HEAVY_MODULES:
+        assert module not in times, '%s is imported with confiture' % module
+
+
+def test_parser_import():
+    times = _import_times('import confiture; confiture.Confiture("a = 1").parse()')
+    assert 'ply.yacc' in times
+
+
+def test_lazy_names():
+    times = _import_times('import confiture, confiture.schema.types as types; '
+                          'assert "ConfitureParser" in dir(confiture); '
+                          'assert "IPADDR_ENABLED" in dir(types)')
+    assert 'ply.yacc' not in times
+    times = _import_times('from confiture import *; ConfitureParser, yacc')
+    assert 'ply.yacc' in times
+
+
+def test_importable_cache():
+    from confiture.schema import types
+    assert types._importable('confiture_missing_module') is False
+    assert types._IMPORTABLE['confiture_missing_module'] is False
+    assert types.IPADDRESS_ENABLED == types._importable('ipaddress')
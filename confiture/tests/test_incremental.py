@@ -0,0 +1,90 @@
+""" Confiture's incremental parser tests.
+"""
+
+import pytest
+
+from confiture.parser import ConfitureParser, ParsingError
+from confiture.incremental import IncrementalParser
+from confiture.tree import ConfigSection
+
+
+CONFIG = '''name = "app"
+vhost "a" {
+    listen = 80
+    location "/" {
+        root = "/srv"
+    }
+}
+vhost "b" {
+    listen = 81
+}
+empty {  }
+after {}
+port = 8080
+'''
+
+
+def _dump(section):
+    output = []
+    for name, child in section.iteritems(expand_sections=True):
+        if isinstance(child, ConfigSection):
+            args = child.args_raw
+            output.append((name, str(child.position), _dump(child),
+                           None if args is None else (args.value, str(args.position))))
+        else:
+            output.append((name, child.value, str(child.position)))
+    return output
+
+
+def _check(parser):
+    assert _dump(parser.tree) == _dump(ConfitureParser(parser.text).parse())
+
+
+def _edit(parser, after, removed, inserted):
+    return parser.edit(parser.text.index(after) + len(after), removed, inserted)
+
+
+def test_incremental():
+    parser = IncrementalParser(CONFIG)
+    _check(parser)
+    vhost_b = parser.tree.subsection_by_args('vhost', 'b')
+    _edit(parser, 'listen = 8', 1, '443')
+    _check(parser)
+    assert parser.tree.subsection_by_args('vhost', 'a').get('listen') == 8443
+    assert parser.tree.subsection_by_args('vhost', 'b') is vhost_b  # Not parsed again
+
+
+def test_incremental_positions():
+    parser = IncrementalParser(CONFIG)
+    _edit(parser, 'root = "/srv"\n', 0, '        index = "index.html"\n\n')
+    _check(parser)
+    _edit(parser, 'listen = 80\n', 0, '\n')
+    _check(parser)
+    _edit(parser, 'listen = 81\n', 0, '    debug = yes\n')
+    _check(parser)
+    _edit(parser, 'empty { ', 0, '  ')
+    _check(parser)
+    assert parser.tree.get('port', raw=False).position.lineno == 17
+
+
+def test_incremental_structure():
+    parser = IncrementalParser(CONFIG)
+    _edit(parser, 'listen = 80\n', 0, '}\nvhost "c" {\n')
+    _check(parser)
+    _edit(parser, 'name = "app"', 0, '\nlevel = 1')
+    _check(parser)
+
+
+def test_incremental_errors():
+    parser = IncrementalParser(CONFIG)
+    with pytest.raises(ParsingError) as incremental_error:
+        _edit(parser, 'root = ', 0, '= ')
+    with pytest.raises(ParsingError) as full_error:
+        ConfitureParser(parser.text).parse()
+    assert str(incremental_error.value) == str(full_error.value)
+    assert str(incremental_error.value.position) == str(full_error.value.position)
+    assert parser.tree is None
+    _edit(parser, 'root = ', 2, '')  # Fix the error
+    _check(parser)
+    with pytest.raises(ValueError):
+        parser.edit(len(parser.text), 1, '')
@@ -0,0 +1,114 @@
+""" Confiture's interpolation tests.
+"""
+
+import pytest
+
+from confiture import Confiture
+from confiture.parser import ConfitureParser, ParsingError
+from confiture.interpolation import interpolate
+from confiture.schema.containers import Section, Value, List
+from confiture.schema.types import Integer, String
+
+
+CONFIG = '''
+base = "/srv/${name}"
+name = "app"
+port = 8080
+ports = 80, 443
+debug = no
+escaped = "$${base} costs $$5"
+paths {
+    data = "${paths.root}/data"
+    root = "${base}"
+    port = "${port}"
+    url = "http://localhost:${port}/?debug=${debug}"
+    all = "${ports}", 22
+}
+backend "a" {
+    host = "10.0.0.1"
+}
+backend "b" {
+    host = "${backend[a].host}"
+}
+'''
+
+
+def _interpolate(text):
+    return interpolate(ConfitureParser(text).parse())
+
+
+def test_interpolate():
+    tree = _interpolate(CONFIG)
+    paths = tree.subsection('paths')
+    assert tree.get('base') == '/srv/app'
+    assert paths.get('data') == '/srv/app/data'
+    assert paths.get('port') == 8080
+    assert paths.get('url') == 'http://localhost:8080/?debug=no'
+    assert paths.get('all') == [80, 443, 22]
+    assert tree.get('escaped') == '${base} costs $$5'
+    assert [b.get('host') for b in tree.subsections('backend')] == ['10.0.0.1'] * 2
+
+
+def test_positions():
+    tree = _interpolate(CONFIG)
+    assert tree.subsection('paths').get('data', raw=False).position.lineno == 9
+
+
+def test_args():
+    tree = _interpolate('name = "app"\nsection "${name}" {}\n')
+    assert tree.subsection('section').args == ['app']
+
+
+def test_reference_through_args():
+    tree = _interpolate('url = "${backend[app].host}"\nname = "app"\n'
+                        'backend "${name}" {\n    host = "h"\n}\n')
+    assert tree.get('url') == 'h'
+
+
+@pytest.mark.parametrize('config', [
+    's "${s[x].key}" {\n    key = 1\n}\n',
+    'a = "${b}"\nb = "${a}"\n',
+    'a = "x${a}"\n',
+    'a = "${b}"\nb = "${c}"\nc = "${a}"\n',
+])
+def test_cycles(config):
+    with pytest.raises(ParsingError) as excinfo:
+        _interpolate(config)
+    assert 'cycle' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('config', [
+    'a = "${unknown}"\n',
+    'a = "${s.b}"\ns {}\ns {}\n',
+    'a = "${s}"\ns {}\n',
+    'a = "x${l}"\nl = 1, 2\n',
+    'a = "${s[x].b}"\ns "x" {\n    b = 1\n}\ns "x" {\n    b = 2\n}\n',
+])
+def test_errors(config):
+    with pytest.raises(ParsingError):
+        _interpolate(config)
+
+
+def test_long_chain():
+    lines = ['key_0 = "x"']
+    lines += ['key_%d = "${key_%d}"' % (i, i - 1) for i in range(1, 5000)]
+    tree = _interpolate('\n'.join(lines) + '\n')
+    assert tree.get('key_4999') == 'x'
+
+
+def test_many_args_references():
+    lines = ['host "h%d" {\n    port = %d\n}' % (i, i) for i in range(3000)]
+    lines += ['port_%d = "${host[h%d].port}"' % (i, i) for i in range(3000)]
+    tree = _interpolate('\n'.join(lines) + '\n')
+    assert [tree.get('port_%d' % i) for i in (0, 1234, 2999)] == [0, 1234, 2999]
+
+
+def test_confiture_option():
+    class Schema(Section):
+        port = Value(Integer())
+        url = Value(String())
+    config = 'port = 80\nurl = "http://localhost:${port}/"\n'
+    parsed = Confiture(config, schema=Schema(), interpolate=True).parse()
+    assert parsed.get('url') == 'http://localhost:80/'
+    parsed = Confiture(config, schema=Schema()).parse()
+    assert parsed.get('url') == 'http://localhost:${port}/'
@@ -0,0 +1,71 @@
+""" Confiture's parsing limits tests.
+"""
+
+import pytest
+
+from confiture import Confiture
+from confiture.parser import ConfitureParser, ExternalOpener, Limits, ParsingError
+
+
+class DictOpener(ExternalOpener):
+
+    def __init__(self, files):
+        self.files = files
+
+    def open(self, locator):
+        yield locator, self.files[locator]
+
+
+def _parse(config, **kwargs):
+    opener = DictOpener(kwargs.pop('files', {}))
+    return ConfitureParser(config, limits=Limits(**kwargs), external_opener=opener).parse()
+
+
+def _error(config, **kwargs):
+    with pytest.raises(ParsingError) as error:
+        _parse(config, **kwargs)
+    return str(error.value), str(error.value.position)
+
+
+def test_max_size():
+    assert _parse('a = 1\n', max_size=6).get('a') == 1
+    assert _error('a = 1\nb = 2\n', max_size=8) == (
+        'Configuration too large (more than 8 characters)', 'in <unknown>, line 2, position 3')
+    assert _error('include "b"\n', max_size=20, files={'b': 'a = 1\n' * 2 + 'b = 2\n'})[0] == \
+        'Configuration too large (more than 20 characters)'
+
+
+def test_max_depth():
+    assert _parse('a {\n b {}\n}\n', max_depth=2).subsection('a').subsection('b') is not None
+    assert _error('a {\n b {\n  c {}\n }\n}\n', max_depth=2) == (
+        'Sections nested too deeply (more than 2 levels)', 'in <unknown>, line 3, position 5')
+    # Sections of included files are nested in the including section:
+    assert _error('a {\n include "b"\n}\n', max_depth=2, files={'b': 'b {\nc {}\n}\n'}) == (
+        'Sections nested too deeply (more than 2 levels)', 'in b, line 2, position 3')
+
+
+def test_max_list_length():
+    assert _parse('a = 1, 2, 3\n', max_list_length=3).get('a') == [1, 2, 3]
+    assert _error('a = 1, 2, 3\nb = 4\n', max_list_length=2) == (
+        'List too long (more than 2 values)', 'in <unknown>, line 1, position 10')
+    assert _error('a 1, 2 k, 3 {}\n', max_list_length=2)[0] == 'List too long (more than 2 values)'
+
+
+def test_max_includes():
+    files = {'a': 'include "b"\n', 'b': 'x = 1\n'}
+    assert _parse('include "a"\n', max_includes=2, files=files).get('x') == 1
+    assert _error('include "a"\ninclude "b"\n', max_includes=2, files=files) == (
+        'Too many included files (more than 2)', 'in <unknown>, line 2, position 1')
+
+
+def test_max_include_depth():
+    files = {'a': 'include "a"\n'}  # Include cycle
+    assert _error('include "a"\n', max_include_depth=3, files=files) == (
+        'Includes nested too deeply (more than 3 levels)', 'in a, line 1, position 0')
+
+
+def test_confiture_limits():
+    config = 'a {\n' * 50 + '}\n' * 50
+    with pytest.raises(ParsingError):
+        Confiture(config, limits=Limits(max_depth=32)).parse()
+    assert Confiture(config).parse() is not None
@@ -0,0 +1,55 @@
+""" Confiture's validation profiler tests.
+"""
+
+from confiture import Confiture
+from confiture.schema.containers import Section, Value, List, many
+from confiture.schema.profiler import ValidationProfiler
+from confiture.schema.types import Integer, String
+
+
+class BackendSection(Section):
+    port = Value(Integer())
+    tags = List(String(), default=[])
+    _meta = {'args': Value(String()), 'repeat': many}
+
+
+class Schema(Section):
+    name = Value(String())
+    backend = BackendSection()
+
+
+CONFIG = '''name = "app"
+backend "a" {
+    port = 1
+    tags = "x", "y"
+}
+backend "b" {
+    port = 2
+}
+'''
+
+
+def test_profiler_paths():
+    profiler = ValidationProfiler()
+    Confiture(CONFIG, schema=Schema(), profiler=profiler).parse()
+    calls = dict((path, calls) for path, calls, _ in profiler.sorted_paths())
+    assert calls == {'name': 1, 'backend': 2, 'backend.<args>': 2,
+                     'backend.port': 2, 'backend.tags': 2}
+    types = dict((name, calls) for name, calls, _ in profiler.sorted_types())
+    assert types == {'String': 5, 'Integer': 2}
+
+
+def test_profiler_sorted():
+    profiler = ValidationProfiler()
+    profiler.record_path('fast', 0.001)
+    profiler.record_path('slow', 0.5)
+    profiler.record_path('fast', 0.001)
+    assert profiler.sorted_paths() == [('slow', 1, 0.5), ('fast', 2, 0.002)]
+    report = profiler.report(limit=1)
+    assert 'slow' in report
+    assert 'fast' not in report
+
+
+def test_no_profiler():
+    config = Confiture(CONFIG, schema=Schema()).parse()
+    assert [s.get('port') for s in config.subsections('backend')] == [1, 2]
@@ -0,0 +1,66 @@
+""" Confiture's records tests.
+"""
+
+import pytest
+
+from confiture import Confiture
+from confiture.schema.containers import Section, Value, List, many
+from confiture.schema.types import Integer, String
+from confiture.schema.records import Record, record_class, to_record
+
+
+class BackendSection(Section):
+    port = Value(Integer(), default=80)
+    _meta = {'args': Value(String()), 'repeat': many}
+
+
+class DatabaseSection(Section):
+    host = Value(String())
+    _meta = {'repeat': (0, 1)}
+
+
+class MainSection(Section):
+    name = Value(String())
+    tags = List(String(), default=[])
+    max_connections = Value(Integer(), default=10)
+    database = DatabaseSection()
+    backend = BackendSection()
+
+
+CONFIG = '''
+name = "test"
+database {
+    host = "localhost"
+}
+backend "foo" {
+    port = 8080
+}
+backend "bar" {}
+'''
+
+
+def test_to_record():
+    schema = MainSection()
+    record = to_record(schema, Confiture(CONFIG, schema=schema).parse())
+    assert isinstance(record, Record)
+    assert record.name == 'test'
+    assert record.tags == []
+    assert record.database.host == 'localhost'
+    assert [(b._args, b.port) for b in record.backend] == [('foo', 8080), ('bar', 80)]
+    with pytest.raises(AttributeError):
+        record.unknown = 42
+
+
+def test_to_record_missing_section():
+    schema = MainSection()
+    record = to_record(schema, Confiture('name = "test"\nbackend "foo" {}\n', schema=schema).parse())
+    assert record.database is None
+
+
+def test_record_class_cache():
+    assert record_class(MainSection()) is record_class(MainSection())
+    other = MainSection()
+    other.add('key-name', Value(Integer()))
+    cls = record_class(other)
+    assert cls is not record_class(MainSection())
+    assert 'key_name' in cls._fields
@@ -0,0 +1,197 @@
+""" Confiture's snapshot tests.
+"""
+
+import io
+import os
+import sys
+import subprocess
+
+import pytest
+
+from confiture import Confiture
+from confiture.tree import ConfigSection, ConfigValue, MultipleSectionsWithThisNameError
+from confiture.snapshot import Snapshot, SnapshotError, dump, dumps, to_shared_memory
+from confiture.schema.containers import Section, Value, List, many
+from confiture.schema.types import Integer, String, RegexPattern, Float
+
+
+class BackendSection(Section):
+    port = Value(Integer())
+    weight = Value(Float(), default=1.0)
+    _meta = {'args': Value(String()), 'repeat': many}
+
+
+class MainSection(Section):
+    name = Value(String())
+    tags = List(String(), default=[])
+    big = Value(Integer(), default=2 ** 70)
+    debug = Value(String(), default=None)
+    backend = BackendSection()
+
+
+CONFIG = '''name = "\xe9t\xe9"
+tags = "a", "b"
+backend "foo" {
+    port = 8080
+}
+backend "bar" {
+    port = 80
+    weight = 0.5
+}
+'''
+
+
+@pytest.fixture
+def config():
+    return Confiture(CONFIG, schema=MainSection(), input_name='app.conf').parse()
+
+
+def test_round_trip(config):
+    root = Snapshot(dumps(config)).root
+    assert root.to_dict() == config.to_dict()
+    assert root.get('name') == u'\xe9t\xe9'
+    assert root.get('big') == 2 ** 70
+    assert root.get('debug', 'default') is None
+    assert root.get('unknown', 'default') == 'default'
+    assert 'tags' in root and 'backend' in root and 'unknown' not in root
+    backends = list(root.subsections('backend'))
+    assert [b.args for b in backends] == ['foo', 'bar']
+    assert backends[1].get('weight') == 0.5
+    assert backends[1].parent is root
+    assert list(root.subsections('unknown')) == []
+
+
+def test_positions(config):
+    root = Snapshot(dumps(config)).root
+    value = root.get('tags', raw=False)
+    assert isinstance(value, ConfigValue)
+    assert (value.position.file, value.position.lineno) == ('app.conf', 2)
+    backend = root.subsections('backend')
+    assert next(backend).position.lineno == 3
+
+
+def test_subsection(config):
+    root = Snapshot(dumps(config)).root
+    with pytest.raises(MultipleSectionsWithThisNameError):
+        root.subsection('backend')
+    assert root.subsection('unknown', 42) == 42
+
+
+def test_read_only(config):
+    root = Snapshot(dumps(config)).root
+    with pytest.raises(TypeError):
+        root.register(ConfigValue('key', 1))
+    section = root.to_section()
+    section.register(ConfigValue('key', 1))
+    assert section.get('key') == 1
+
+
+def test_pickled_values():
+    class Schema(Section):
+        pattern = Value(RegexPattern())
+    config = Confiture('pattern = "[a-z]+"\n', schema=Schema()).parse()
+    root = Snapshot(dumps(config)).root
+    assert root.get('pattern').match('abc')
+
+
+def test_safe():
+    class Schema(Section):
+        pattern = Value(RegexPattern())
+        big = Value(Integer())
+    config = Confiture('pattern = "[a-z]+"\nbig = 100000000000000000000\n',
+                       schema=Schema()).parse()
+    with pytest.raises(SnapshotError):
+        Snapshot(dumps(config), safe=True).root.get('pattern')
+    root = Snapshot(dumps(config, safe=True), safe=True).root
+    assert root.get('pattern') == str(config.get('pattern'))
+    assert root.get('big') == '100000000000000000000'
+    output = io.BytesIO()
+    dump(config, output, safe=True)
+    assert output.getvalue() == dumps(config, safe=True)
+
+
+def test_missing_positions():
+    section = ConfigSection('__top__', position=None)
+    section.register(ConfigValue('key', 1, position=None))
+    section.register(ConfigSection('sub', args=ConfigValue('<args>', ['a'], position=None),
+                                   position=None), name='sub')
+    root = Snapshot(dumps(section)).root
+    assert root.position is None
+    assert root.get('key', raw=False).position is None
+    assert root.subsection('sub').position is None
+    assert root.subsection('sub').args_raw.position is None
+    assert root.to_dict() == section.to_dict()
+
+
+def test_deep():
+    tree = section = ConfigSection('__top__')
+    for _ in range(3000):
+        child = ConfigSection('level')
+        section.register(child, name='level')
+        section = child
+    section.register(ConfigValue('key', 1))
+    section = Snapshot(dumps(tree)).root
+    for _ in range(3000):
+        section = section.subsection('level')
+    assert section.get('key') == 1
+
+
+def test_bad_buffer():
+    with pytest.raises(SnapshotError):
+        Snapshot(b'NOPE' + b'\0' * 20)
+
+
+def test_file(config, tmpdir):
+    filename = str(tmpdir.join('config.snapshot'))
+    with open(filename, 'wb') as fsnapshot:
+        dump(config, fsnapshot)
+    with Snapshot.from_file(filename) as snapshot:
+        assert snapshot.root.to_dict() == config.to_dict()
+
+
+def test_shared_memory(config):
+    pytest.importorskip('multiprocessing.shared_memory')
+    segment = to_shared_memory(config)
+    try:
+        with Snapshot.from_shared_memory(segment.name) as snapshot:
+            assert snapshot.root.to_dict() == config.to_dict()
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def _read_in_worker(name):
+    snapshot = Snapshot.from_shared_memory(name)
+    try:
+        assert snapshot.root.get('name') == u'\xe9t\xe9'
+    finally:
+        snapshot.close()
+
+
+def test_shared_memory_workers(config):
+    pytest.importorskip('multiprocessing.shared_memory')
+    import multiprocessing
+    segment = to_shared_memory(config)
+    try:
+        # Forked worker, sharing the resource tracker of the creator:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            worker = multiprocessing.get_context('fork').Process(
+                target=_read_in_worker, args=(segment.name, ))
+            worker.start()
+            worker.join()
+            assert worker.exitcode == 0
+        # Independent process, with its own resource tracker:
+        code = ('from confiture.tests.test_snapshot import _read_in_worker\n'
+                '_read_in_worker(%r)\n' % segment.name)
+        environ = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen([sys.executable, '-c', code], env=environ,
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+        _, errors = process.communicate()
+        assert process.returncode == 0, errors
+        assert 'resource_tracker' not in errors
+        # The segment is still there, until the creator unlinks it:
+        with Snapshot.from_shared_memory(segment.name) as snapshot:
+            assert snapshot.root.to_dict() == config.to_dict()
+    finally:
+        segment.close()
+        segment.unlink()
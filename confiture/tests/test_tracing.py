@@ -0,0 +1,68 @@
+""" Confiture's tracing tests.
+"""
+
+import os
+import threading
+
+from confiture import Confiture
+from confiture.tracing import Tracer, LoadStats
+from confiture.schema import ValidationContext
+from confiture.schema.containers import Section, Value
+from confiture.schema.types import Integer, RegexPattern
+
+
+class Schema(Section):
+
+    key = Value(Integer())
+    pattern = Value(RegexPattern())
+    other = Value(Integer())
+
+
+def test_load_stats(tmpdir):
+    tmpdir.join('included.conf').write('other = 42\n')
+    config = 'key = 1\npattern = "[a-z]+"\ninclude "%s"\n' % os.path.join(str(tmpdir), '*.conf')
+    stats = LoadStats()
+    parsed = Confiture(config, schema=Schema(), tracer=stats).parse()
+    assert parsed.get('other') == 42
+    output = stats.as_dict()
+    assert set(stats.phases) == set(['read', 'lex', 'parse', 'validate'])
+    assert output['files'] == 1
+    assert stats.files[0][0].endswith('included.conf')
+    assert output['count.tokens'] == 11
+    assert output['count.nodes'] == 4
+    assert output['count.cache_misses'] == 1
+
+
+def test_tracer_callbacks(tmpdir):
+    events = []
+
+    class MyTracer(Tracer):
+        def phase(self, name, elapsed):
+            events.append(name)
+
+    filename = tmpdir.join('test.conf')
+    filename.write('key = 1\n')
+    Confiture.from_filename(str(filename), tracer=MyTracer()).parse()
+    assert events == ['read', 'lex', 'parse']
+
+
+def test_cache_counts_per_validation():
+    schema = Schema()
+    stats = LoadStats()
+    Confiture('key = 1\npattern = "[a-c]+"\nother = 2\n', schema=schema, tracer=stats).parse()
+    assert stats.as_dict()['count.cache_misses'] == 1
+    assert '_cache' not in Integer().__dict__  # No cache for types not memoised
+    assert all('_cache' not in t.__dict__ for t in schema.iter_types()
+               if not isinstance(t, RegexPattern))
+    # Validations of other threads (or without tracer) are not counted:
+    thread = threading.Thread(target=lambda: Confiture('key = 1\npattern = "[0-8]+"\n'
+                                                       'other = 2\n', schema=schema).parse())
+    context = ValidationContext()
+    with context:
+        thread.start()
+        thread.join()
+    assert (context.cache_hits, context.cache_misses) == (0, 0)
+    stats = LoadStats()
+    Confiture('key = 1\npattern = "[a-c]+"\nother = 2\n', schema=schema, tracer=stats).parse()
+    assert stats.as_dict()['count.cache_hits'] == 1
+    assert stats.as_dict()['count.cache_misses'] == 0
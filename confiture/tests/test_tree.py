@@ -0,0 +1,315 @@
+""" Confiture's configuration tree tests.
+"""
+
+import os
+import sys
+import array
+import pickle
+import subprocess
+
+import pytest
+
+from confiture.parser import ConfitureParser
+from confiture.tree import (ConfigSection, ConfigValue, OverlaySection,
+                            MultipleSectionsWithThisNameError)
+from confiture.schema.containers import Section, Value, many
+from confiture.schema.types import Integer, String
+
+
+DEFAULTS = '''
+port = 80
+debug = no
+host "a" {
+    weight = 1
+}
+host "b" {
+    weight = 1
+}
+'''
+
+SITE = '''
+port = 8080
+host "b" {
+    weight = 2
+}
+host "c" {}
+'''
+
+
+def _parse(config):
+    return ConfitureParser(config).parse()
+
+
+def test_overlay():
+    overlay = OverlaySection([_parse(DEFAULTS), _parse(SITE)])
+    assert overlay.get('port') == 8080
+    assert overlay.get('debug') is False
+    assert overlay.get('unknown', 42) == 42
+    assert [h.args for h in overlay.subsections('host')] == [['a'], ['b'], ['c']]
+    assert [h.get('weight') for h in overlay.subsections('host')] == [1, 2, None]
+    assert overlay.to_dict() == {'port': 8080, 'debug': False,
+                                 'host': [{'weight': 1}, {'weight': 2}, {}]}
+    assert overlay.to_section().to_dict() == overlay.to_dict()
+
+
+def test_overlay_copy_on_write():
+    defaults = _parse(DEFAULTS)
+    overlay = OverlaySection([defaults])
+    assert overlay.get('port') == 80
+    overlay.register(ConfigValue('port', 443))
+    overlay.register(ConfigSection('host', args=ConfigValue('<args>', ['d'])))
+    assert overlay.get('port') == 443
+    assert len(list(overlay.subsections('host'))) == 3
+    assert defaults.get('port') == 80
+    assert len(list(defaults.subsections('host'))) == 2
+
+
+def test_overlay_invalidate():
+    defaults, site = _parse(DEFAULTS), _parse(SITE)
+    overlay = OverlaySection([defaults, site])
+    assert overlay.get('debug') is False
+    assert [h.get('weight') for h in overlay.subsections('host')] == [1, 2, None]
+    site.register(ConfigValue('debug', True))
+    next(defaults.subsections('host')).register(ConfigValue('extra', 1))
+    assert overlay.get('debug') is False  # Cached
+    overlay.invalidate('debug')
+    assert overlay.get('debug') is True
+    overlay.invalidate()
+    assert next(overlay.subsections('host')).get('extra') == 1
+    with pytest.raises(ValueError):
+        OverlaySection([])
+
+
+def test_overlay_validation():
+
+    class HostSection(Section):
+        weight = Value(Integer(), default=0)
+        _meta = {'args': Value(String()), 'repeat': many}
+
+    class Schema(Section):
+        port = Value(Integer())
+        debug = Value(Integer(), default=0)
+        host = HostSection()
+
+    overlay = OverlaySection([_parse(DEFAULTS), _parse('port = 8080\ndebug = 1\n')])
+    validated = Schema().validate(overlay)
+    assert validated.get('port') == 8080
+    assert validated.get('debug') == 1
+    assert [h.get('weight') for h in validated.subsections('host')] == [1, 1]
+
+
+def test_memory_report():
+    tree = _parse(DEFAULTS)
+    report = tree.memory_report()
+    assert report['total'] == sum(report['kinds'].values())
+    assert set(report['children']) == set(['port', 'debug', 'host'])
+    assert report['children']['host'] > report['children']['port']
+    assert all(report['kinds'][k] > 0 for k in ('sections', 'values', 'positions', 'strings'))
+    tree.register(ConfigValue('items', ['x' * 1000, 'y']))
+    bigger = tree.memory_report()
+    assert bigger['kinds']['lists'] > report['kinds']['lists']
+    assert bigger['kinds']['strings'] > report['kinds']['strings'] + 1000
+    assert bigger['total'] > report['total']
+
+
+def test_memory_report_deep():
+    tree = _parse('level {\n' * 3000 + '    key = 1\n' + '}\n' * 3000)
+    for section in (tree, tree.freeze()):
+        report = section.memory_report()
+        assert report['children']['level'] > 3000 * sys.getsizeof(object())
+        assert report['total'] == sum(report['kinds'].values())
+
+
+def test_freeze():
+    tree = _parse(DEFAULTS)
+    tree.register(ConfigValue('items', ['a', ['b', 'c']]))
+    frozen = tree.freeze()
+    assert frozen.freeze() is frozen
+    assert frozen.get('port') == 80
+    assert frozen.get('items') == ('a', ('b', 'c'))
+    assert frozen.get('port', raw=False).position.lineno == 2
+    assert [s.args for s in frozen.subsections('host')] == [('a',), ('b',)]
+    assert next(frozen.subsections('host')).parent is frozen
+    assert frozen.subsection('unknown') is None
+    assert 'host' in frozen and 'unknown' not in frozen
+    with pytest.raises(TypeError):
+        frozen.register(ConfigValue('key', 1))
+    expected = tree.to_dict()
+    expected['items'] = ('a', ('b', 'c'))
+    assert frozen.to_dict() == expected
+    assert sorted(name for name, _ in frozen.iteritems()) == ['debug', 'host', 'items', 'port']
+    assert frozen.memory_report()['total'] > 0
+
+
+def test_freeze_without_positions():
+    section = ConfigSection('__top__', position=None)
+    section.register(ConfigValue('key', 1, position=None))
+    section.register(ConfigSection('sub', args=ConfigValue('<args>', ['a'], position=None),
+                                   position=None), name='sub')
+    frozen = section.freeze()
+    assert frozen.position is None
+    assert frozen.get('key', raw=False).position is None
+    sub = frozen.subsection('sub')
+    assert sub.args == ('a',) and sub.args_raw.position is None
+
+
+def test_freeze_untracked():
+    gc = pytest.importorskip('gc')
+    frozen = _parse(DEFAULTS).freeze()
+    gc.collect()
+    assert not gc.is_tracked(frozen._values)
+    assert not any(gc.is_tracked(entry) for entry in frozen._values.values())
+
+
+def test_subsection_by_args():
+    config = _parse(DEFAULTS + 'host "a" {}\nhost "d", "e" {}\n')
+    assert config.subsection_by_args('host', 'b').get('weight') == 1
+    assert config.subsection_by_args('host', 'd', 'e') is not None
+    assert config.subsection_by_args('host', ['d', 'e']) is not None
+    assert config.subsection_by_args('host', 'z') is None
+    assert config.subsection_by_args('unknown', 'a') is None
+    with pytest.raises(MultipleSectionsWithThisNameError):
+        config.subsection_by_args('host', 'a')
+    config.register(ConfigSection('host', args=ConfigValue('<args>', ['z'])))
+    assert config.subsection_by_args('host', 'z') is not None
+
+
+def test_subsection_by_args_unique():
+    class HostSection(Section):
+        _meta = {'args': Value(String()), 'unique': True, 'repeat': many}
+        weight = Value(Integer(), default=1)
+
+    class Schema(Section):
+        port = Value(Integer())
+        debug = Value(Integer(), default=0)
+        host = HostSection()
+
+    config = Schema().validate(_parse(DEFAULTS))
+    assert 'host' in config._args_indexes  # Index kept from validation
+    assert config.subsection_by_args('host', 'b').args == 'b'
+    assert config.freeze().subsection_by_args('host', 'a').get('weight') == 1
+    overlay = OverlaySection([_parse(DEFAULTS), _parse(SITE)])
+    assert overlay.subsection_by_args('host', 'b').get('weight') == 2
+
+
+def test_fingerprint():
+    tree = _parse(DEFAULTS)
+    reordered = _parse('host "a" {\n    weight = 1\n}\ndebug = no\n\n'
+                       'host "b" {\n    weight = 1\n}\nport = 80\n')
+    assert tree.fingerprint == reordered.fingerprint
+    assert tree.freeze().fingerprint == tree.fingerprint
+    assert tree.get('port', raw=False).fingerprint == reordered.get('port', raw=False).fingerprint
+    hosts = list(tree.subsections('host'))
+    assert hosts[0].fingerprint != hosts[1].fingerprint
+    # The order of repeated sections is significant:
+    swapped = _parse('port = 80\ndebug = no\nhost "b" {\n    weight = 1\n}\n'
+                     'host "a" {\n    weight = 1\n}\n')
+    assert swapped.fingerprint != tree.fingerprint
+    # Values are typed:
+    assert _parse('port = "80"\n').fingerprint != _parse('port = 80\n').fingerprint
+    assert _parse('port = 1\n').fingerprint != _parse('port = yes\n').fingerprint
+
+
+def test_fingerprint_invalidation():
+    tree = _parse(DEFAULTS)
+    fingerprint = tree.fingerprint
+    host = next(tree.subsections('host'))
+    host_fingerprint = host.fingerprint
+    host.register(ConfigValue('extra', 1))
+    assert host.fingerprint != host_fingerprint
+    assert tree.fingerprint != fingerprint
+    value = tree.get('port', raw=False)
+    value_fingerprint = value.fingerprint
+    fingerprint = tree.fingerprint
+    value.value = 81
+    assert value.fingerprint != value_fingerprint
+    assert tree.fingerprint != fingerprint
+    host_fingerprint = host.fingerprint
+    fingerprint = tree.fingerprint
+    host.get('weight', raw=False).value = 3
+    assert host.fingerprint != host_fingerprint
+    assert tree.fingerprint != fingerprint
+    fingerprint = tree.fingerprint
+    host.args_raw.value = ['z']
+    assert tree.fingerprint != fingerprint
+
+
+def test_fingerprint_values():
+    from confiture.schema.types import Url
+    url = Url().validate('http://example.com/path')
+    assert ConfigValue('url', url).fingerprint == ConfigValue('url', list(url)).fingerprint
+    # Sets give the same fingerprint whatever the hash seed:
+    code = ('from confiture.tree import ConfigValue\n'
+            'print(ConfigValue("s", set(["a", "b", "c", "d"])).fingerprint)\n')
+    fingerprints = set()
+    for seed in ('1', '2', '3'):
+        environ = dict(os.environ, PYTHONHASHSEED=seed,
+                       PYTHONPATH=os.pathsep.join(sys.path))
+        fingerprints.add(subprocess.check_output([sys.executable, '-c', code], env=environ))
+    assert len(fingerprints) == 1
+    assert (ConfigValue('d', {'a': 1, 'b': 2}).fingerprint ==
+            ConfigValue('d', {'b': 2, 'a': 1}).fingerprint)
+    with pytest.raises(TypeError):
+        ConfigValue('o', object()).fingerprint
+
+
+def test_fingerprint_deep():
+    tree = _parse('level {\n' * 3000 + '    key = 1\n' + '}\n' * 3000)
+    other = _parse('level {\n' * 3000 + '    key = 2\n' + '}\n' * 3000)
+    assert tree.fingerprint != other.fingerprint
+    assert tree.fingerprint == tree.freeze().fingerprint
+
+
+def test_fingerprint_arrays():
+    first = array.array('q', range(5000))
+    second = array.array('q', range(5000))
+    second[2500] = -1
+    assert ConfigValue('a', first).fingerprint != ConfigValue('a', second).fingerprint
+    assert (ConfigValue('a', first).fingerprint ==
+            ConfigValue('a', array.array('q', range(5000))).fingerprint)
+    numpy = pytest.importorskip('numpy')
+    first, second = numpy.arange(5000), numpy.arange(5000)
+    second[2500] = -1
+    assert ConfigValue('a', first).fingerprint != ConfigValue('a', second).fingerprint
+
+
+def test_pickle():
+    tree = _parse(DEFAULTS)
+    loaded = pickle.loads(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+    assert loaded.to_dict() == tree.to_dict()
+    assert loaded.fingerprint == tree.fingerprint
+    assert loaded.get('port', raw=False).position.lineno == 2
+    hosts = list(loaded.subsections('host'))
+    assert [h.args for h in hosts] == [['a'], ['b']]
+    assert hosts[1].args_raw.position.lineno == 7
+    assert all(h.parent is loaded for h in hosts)
+    hosts[0].register(ConfigValue('extra', 1))  # Loaded sections are mutable
+    frozen = pickle.loads(pickle.dumps(tree.freeze()))
+    assert frozen.to_dict() == tree.to_dict()
+    with pytest.raises(TypeError):
+        frozen.register(ConfigValue('extra', 1))
+    position = tree.get('port', raw=False).position
+    loaded_position = pickle.loads(pickle.dumps(position))
+    assert str(loaded_position) == str(position)
+
+
+def test_freeze_deep():
+    tree = _parse('level {\n' * 3000 + '    key = 1\n' + '}\n' * 3000)
+    section = tree.freeze()
+    for _ in range(3000):
+        child = next(section.subsections('level'))
+        assert child.parent is section
+        section = child
+    assert section.get('key') == 1
+    assert section.position.lineno == 3000
+
+
+def test_pickle_deep():
+    tree = _parse('level {\n' * 2000 + '    key = 1\n' + '}\n' * 2000)
+    loaded = pickle.loads(pickle.dumps(tree))
+    section = loaded
+    for _ in range(2000):
+        child = next(section.subsections('level'))
+        assert child.parent is section
+        section = child
+    assert section.get('key') == 1
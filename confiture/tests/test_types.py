@@ -0,0 +1,148 @@
+""" Confiture's schema types tests.
+"""
+
+import pytest
+
+from confiture.schema import Type, ValidationError, memoize
+from confiture import Confiture
+from confiture.schema.containers import Section, Value
+from confiture.schema.types import RegexPattern, Eval, IPNetworkSet, Url
+
+
+class CountingType(Type):
+
+    def __init__(self):
+        self.calls = 0
+
+    @memoize
+    def validate(self, value):
+        self.calls += 1
+        return [value]
+
+
+class CopyingType(CountingType):
+
+    @memoize(copy_result=True)
+    def validate(self, value):
+        self.calls += 1
+        return [value]
+
+
+def test_memoize():
+    type_ = CountingType()
+    assert type_.validate('foo') is type_.validate('foo')
+    assert type_.calls == 1
+    assert type_.cache.hits == 1
+    assert type_.cache.misses == 1
+
+
+def test_memoize_distinct_types():
+    type_ = CountingType()
+    assert type(type_.validate(1)[0]) is int
+    assert type(type_.validate(True)[0]) is bool
+
+
+def test_memoize_unhashable():
+    type_ = CountingType()
+    type_.validate(['foo'])
+    type_.validate(['foo'])
+    assert type_.calls == 2
+
+
+def test_memoize_copy_result():
+    type_ = CopyingType()
+    first = type_.validate('foo')
+    first.append('bar')
+    assert type_.validate('foo') == ['foo']
+    assert type_.calls == 1
+
+
+def test_memoize_disabled():
+    type_ = CountingType()
+    type_.cache_size = 0
+    type_.validate('foo')
+    type_.validate('foo')
+    assert type_.calls == 2
+
+
+def test_memoize_lru_bound():
+    type_ = CountingType()
+    type_.cache_size = 2
+    for value in ('a', 'b', 'a', 'c', 'a', 'b'):
+        type_.validate(value)
+    assert len(type_.cache) == 2
+    assert type_.calls == 4
+
+
+def test_memoize_resize():
+    type_ = CountingType()
+    for value in ('a', 'b', 'c'):
+        type_.validate(value)
+    type_.cache_size = 1  # Changed after the first use of the cache
+    assert len(type_.cache) == 1
+    type_.validate('c')
+    assert type_.calls == 3
+    type_.cache_size = 0
+    type_.validate('c')
+    assert type_.calls == 4
+
+
+def test_regex_pattern():
+    pattern = RegexPattern()
+    assert pattern.validate('[a-z]+') is pattern.validate('[a-z]+')
+    with pytest.raises(ValidationError):
+        pattern.validate('[a-z')
+    with pytest.raises(ValidationError):
+        pattern.validate('[a-z')
+
+
+def test_eval():
+    expression = Eval(locals={'x': 2})
+    assert expression.validate('x * 21') == 42
+    assert expression.validate('x * 21') == 42
+    assert expression.cache.hits == 1
+    with pytest.raises(ValidationError):
+        expression.validate('x *')
+
+
+def test_url():
+    url = Url().validate('http://proxy:3128/path')
+    assert (url.scheme, url.hostname, url.port) == ('http', 'proxy', 3128)
+    with pytest.raises(ValidationError):
+        Url().validate('http://[proxy')
+
+
+def test_ip_network_set():
+    acl = IPNetworkSet().validate(['10.0.0.0/24', '10.0.1.0/24', '10.0.0.128/25',
+                                   '192.168.1.1', '2001:db8::/32'])
+    assert len(acl) == 3
+    assert '10.0.1.255' in acl
+    assert '10.0.2.0' not in acl
+    assert '192.168.1.1' in acl
+    assert '192.168.1.2' not in acl
+    assert '2001:db8::1' in acl
+    assert '10.0.0.0/23' in acl
+    assert '10.0.0.0/22' not in acl
+    assert 'foo' not in acl
+
+
+def test_ip_network_set_adjacent():
+    acl = IPNetworkSet().validate(['10.0.1.0/24', '10.0.2.0/24'])
+    assert '10.0.1.0/24' in acl
+    assert '10.0.1.128/24' in acl
+    assert '10.0.1.0/22' not in acl
+
+
+def test_ip_network_set_errors():
+    with pytest.raises(ValidationError):
+        IPNetworkSet().validate(['10.0.0.0/33'])
+    with pytest.raises(ValidationError):
+        IPNetworkSet(version=4).validate(['::1'])
+
+
+def test_ip_network_set_value():
+    class Schema(Section):
+        allow = Value(IPNetworkSet())
+    config = Confiture('allow = "10.0.0.0/8", "::1"', schema=Schema()).parse()
+    assert '10.1.2.3' in config.get('allow')
+    assert '::1' in config.get('allow')
@@ -0,0 +1,105 @@
+""" Confiture's writer tests.
+"""
+
+import io
+
+import pytest
+
+from confiture.parser import ConfitureParser
+from confiture.tree import ConfigSection, ConfigValue
+from confiture.writer import dump, dumps
+
+
+CONFIG = '''
+name = "say \\"hello\\""
+path = 'C:\\dir\\file'
+enabled = yes
+debug = no
+port = 8080
+ratio = 0.5
+tags = "a", "b", 3
+single = "x",
+multiline = "a
+b"
+backend "foo", 42 {
+    weight = 1
+    nested {
+        empty = ""
+    }
+}
+backend "bar" {}
+top {}
+'''
+
+
+def _parse(text):
+    return ConfitureParser(text).parse()
+
+
+def test_round_trip():
+    tree = _parse(CONFIG)
+    text = dumps(tree)
+    assert _parse(text).to_dict() == tree.to_dict()
+    assert [s.args for s in _parse(text).subsections('backend')] == [['foo', 42], ['bar']]
+
+
+def test_values():
+    section = ConfigSection('__top__')
+    section.register(ConfigValue('small', 1e-07))
+    section.register(ConfigValue('big', 1e20))
+    section.register(ConfigValue('quoted', 'a\\"b'))
+    section.register(ConfigValue('unicode', u'\xe9t\xe9'))
+    parsed = _parse(dumps(section))
+    assert parsed.get('small') == 1e-07
+    assert parsed.get('big') == 1e20
+    assert parsed.get('quoted') == 'a\\"b'
+    assert parsed.get('unicode') == u'\xe9t\xe9'
+
+
+@pytest.mark.parametrize('value', [None, [], [[1]], float('inf'), 'trailing\\'])
+def test_unwritable_values(value):
+    section = ConfigSection('__top__')
+    section.register(ConfigValue('key', value))
+    with pytest.raises(ValueError):
+        dumps(section)
+
+
+@pytest.mark.parametrize('name', ['yes', 'include', 'k', '1abc', 'with space'])
+def test_bad_names(name):
+    section = ConfigSection('__top__')
+    section.register(ConfigValue(name, 1))
+    with pytest.raises(ValueError):
+        dumps(section)
+
+
+def test_canonical():
+    first = _parse('b = 1\na = 2\nz "2" {}\nz "1" {}\ny {}\n')
+    second = _parse('y {}\na = 2\nz "2" {}\nz "1" {}\nb = 1\n')
+    text = dumps(first, canonical=True)
+    assert text == dumps(second, canonical=True)
+    assert text == 'a = 2\nb = 1\ny {\n}\nz "2" {\n}\nz "1" {\n}\n'
+
+
+def test_dump():
+    tree = _parse(CONFIG)
+    output = io.StringIO()
+    dump(tree, output)
+    assert output.getvalue() == dumps(tree)
+
+
+def test_frozen():
+    tree = _parse(CONFIG)
+    assert dumps(tree.freeze()) == dumps(tree)
+
+
+def test_deep():
+    tree = section = ConfigSection('__top__')
+    for _ in range(3000):
+        child = ConfigSection('level')
+        section.register(child, name='level')
+        section = child
+    section.register(ConfigValue('key', 1))
+    lines = dumps(tree).splitlines()
+    assert len(lines) == 6001
+    assert lines[3000] == '    ' * 3000 + 'key = 1'
+    assert lines[-1] == '}'
@@ -0,0 +1,88 @@
+""" Tracing of the configuration load pipeline.
+"""
+
+from confiture.tree import ConfigSection
+
+
+class Tracer(object):
+
+    """ Base class for tracers, receiving events of a configuration load.
+
+    All methods do nothing, subclass this class and override the methods
+    you need to forward events to your metrics system. When no tracer is
+    given to :class:`confiture.Confiture`, the load pipeline is not
+    instrumented at all.
+    """
+
+    def phase(self, name, elapsed):
+        """ Called with the time (in seconds) spent in a phase of the load.
+
+        Phases are ``read`` (file reading), ``lex`` (lexing), ``parse``
+        (parsing, excluding lexing and included files reading) and
+        ``validate`` (schema validation). A phase can be reported several
+        times in a single load (for example, once by included file).
+        """
+
+    def file(self, name, read_time, parse_time):
+        """ Called for each included file, with the time spent to read and
+            parse it (including the files it includes itself).
+        """
+
+    def count(self, name, value):
+        """ Called with the value of a counter: ``tokens``, ``nodes``,
+            ``cache_hits`` and ``cache_misses``.
+        """
+
+
+class LoadStats(Tracer):
+
+    """ A tracer collecting statistics about a configuration load.
+
+    Usage example::
+
+        >>> stats = LoadStats()
+        >>> config = Confiture.from_filename('app.conf', tracer=stats).parse()
+        >>> stats.as_dict()
+        {'phase.read': 0.0012, 'phase.lex': 0.0321, 'phase.parse': 0.0514,
+         'count.tokens': 10312, 'count.nodes': 1633, 'files': 3, ...}
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.files = []
+
+    def __repr__(self):
+        return '<LoadStats %r>' % self.as_dict()
+
+    def phase(self, name, elapsed):
+        self.phases[name] = self.phases.get(name, 0) + elapsed
+
+    def file(self, name, read_time, parse_time):
+        self.files.append((name, read_time, parse_time))
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        """ Get the statistics as a flat dict, handy to forward to a metrics
+            system.
+        """
+        output = {'files': len(self.files)}
+        for name, elapsed in self.phases.items():
+            output['phase.' + name] = elapsed
+        for name, value in self.counters.items():
+            output['count.' + name] = value
+        return output
+
+
+def count_nodes(section):
+    """ Count the sections and values of a tree.
+    """
+    count = 1
+    for child in section.iterflatchildren():
+        if isinstance(child, ConfigSection):
+            count += count_nodes(child)
+        else:
+            count += 1
+    return count
@@ -1,7 +1,11 @@
 """ Classes used to represent the configuration tree.
 """
 
-
+import gc
+import re
+import sys
+import array
+import hashlib
 from itertools import chain
 from collections import defaultdict
 
@@ -16,6 +20,8 @@ class Position(object):
     """ Position of a statement in a file.
     """
 
+    __slots__ = ('file', 'lineno', 'pos')
+
     def __init__(self, file_, lineno, pos):
         self.file = file_
         self.lineno = lineno
@@ -27,12 +33,105 @@ class Position(object):
     def __str__(self):
         return 'in %s, line %d, position %d' % (self.file, self.lineno, self.pos)
 
+    def __reduce__(self):
+        return (Position, (self.file, self.lineno, self.pos))
+
+
+try:
+    _TEXT_TYPE = unicode
+    _INTEGER_TYPES = (int, long)
+except NameError:
+    _TEXT_TYPE = str
+    _INTEGER_TYPES = (int,)
+
+
+def _encode(data, parts):
+    """ Append the encoding of data to parts, tagged by type so different
+        values never give the same encoding.
+    """
+    # Bytes formatting (b'%d' % number) is not available before Python 3.5,
+    # numbers are formatted in text then encoded:
+    kind = type(data)
+    if kind is _TEXT_TYPE:
+        data = data.encode('utf-8')
+        parts.append(('s%d:' % len(data)).encode('ascii'))
+        parts.append(data)
+    elif kind is bool:
+        parts.append(b'T' if data else b'F')
+    elif kind is int:
+        parts.append(('i%d;' % data).encode('ascii'))
+    elif kind is list or kind is tuple:
+        parts.append(('l%d:' % len(data)).encode('ascii'))
+        for item in data:
+            _encode(item, parts)
+    elif kind is float:
+        parts.append(b'd' + repr(data).encode('ascii') + b';')
+    elif data is None:
+        parts.append(b'N')
+    elif isinstance(data, bytes):
+        parts.append(('b%d:' % len(data)).encode('ascii'))
+        parts.append(data)
+    elif isinstance(data, array.array):
+        # Representations of large arrays are shortened, use their content:
+        _encode_buffer(data.typecode, data.itemsize, (len(data),), data.tobytes(), parts)
+    elif getattr(data, 'dtype', None) is not None and hasattr(data, 'tobytes'):
+        # NumPy arrays (and scalars):
+        _encode_buffer(data.dtype.str, data.dtype.itemsize, getattr(data, 'shape', ()),
+                       data.tobytes(), parts)
+    elif isinstance(data, _INTEGER_TYPES):
+        _encode(int(data), parts)
+    elif isinstance(data, _TEXT_TYPE):
+        _encode(_TEXT_TYPE(data), parts)
+    elif isinstance(data, float):
+        _encode(float(data), parts)
+    elif isinstance(data, (list, tuple)):  # Like the namedtuples of Url
+        _encode(list(data), parts)
+    elif isinstance(data, (set, frozenset)):
+        # Items are sorted by encoding, the iteration order of sets depends
+        # on the hash seed:
+        _encode_items(b'e', [_encoded(item) for item in data], parts)
+    elif isinstance(data, dict):
+        _encode_items(b'm', [_encoded(key) + _encoded(value)
+                             for key, value in data.items()], parts)
+    elif kind.__repr__ is object.__repr__:
+        # The default representation contains the address of the object:
+        raise TypeError('values of type %s can not be fingerprinted' % kind.__name__)
+    else:
+        # Values built by the schema types (encoded by representation):
+        _encode('%s.%s' % (kind.__module__, kind.__name__), parts)
+        _encode(repr(data), parts)
+
+
+def _encoded(data):
+    parts = []
+    _encode(data, parts)
+    return b''.join(parts)
+
+
+def _encode_items(tag, encoded, parts):
+    encoded.sort()
+    parts.append(tag + ('%d:' % len(encoded)).encode('ascii'))
+    parts.extend(encoded)
+
+
+def _encode_buffer(typecode, itemsize, shape, data, parts):
+    parts.append(b'a')
+    _encode(str(typecode), parts)
+    parts.append(('%d;' % itemsize).encode('ascii'))
+    _encode(list(shape), parts)
+    parts.append(('b%d:' % len(data)).encode('ascii'))
+    parts.append(data)
+
 
 class ConfigValue(object):
 
     """ Represent a value in the configuration.
     """
 
+    _fingerprint = None  # Cached fingerprint (set on first access)
+    _fingerprinted_in = None  # Sections whose cached fingerprint depends on
+                              # this value (set when they are computed)
+
     def __init__(self, name, value, position=Position('?', 0, 0)):
         self._name = name
         self._value = value
@@ -41,6 +140,9 @@ class ConfigValue(object):
     def __repr__(self):
         return '<ConfigValue %r (%s)>' % (self._value, self._position)
 
+    def __reduce__(self):
+        return (ConfigValue, (self._name, self._value, self._position))
+
     @property
     def name(self):
         return self._name
@@ -52,11 +154,37 @@ class ConfigValue(object):
     @value.setter
     def value(self, value):
         self._value = value
+        if self._fingerprint is not None:
+            self._fingerprint = None
+        sections = self._fingerprinted_in
+        if sections is not None:
+            self._fingerprinted_in = None
+            for section in sections:
+                section._invalidate_fingerprint()
 
     @property
     def position(self):
         return self._position
 
+    @property
+    def fingerprint(self):
+        """ Hash of the name and value (as an hexadecimal string), which
+            does not depend on the position.
+        """
+        if self._fingerprint is None:
+            parts = [b'V']
+            _encode(self.name, parts)
+            _encode(self.value, parts)
+            self._fingerprint = hashlib.sha256(b''.join(parts)).hexdigest()
+        return self._fingerprint
+
+    def _add_fingerprinted_in(self, section):
+        sections = self._fingerprinted_in
+        if sections is None:
+            self._fingerprinted_in = [section]
+        elif not any(other is section for other in sections):
+            sections.append(section)
+
 
 class ConfigSection(object):
 
@@ -67,17 +195,26 @@ class ConfigSection(object):
     :param position: the position of the section in configuration
     """
 
+    _fingerprint = None  # Cached fingerprint (set on first access)
+
     def __init__(self, name, parent=None, args=None, position=Position('?', 0, 0)):
         self._name = name
         self._parent = parent
         self._args = args
         self._position = position
-        self._subsections = defaultdict(lambda: [])
+        self._subsections = defaultdict(list)
         self._values = {}
+        self._args_indexes = None  # Sub-sections by arguments, by name
 
     def __repr__(self):
         return "<Section '%s'>" % self.name
 
+    def __reduce__(self):
+        # The tree is pickled as a flat list instead of recursively (which
+        # would pickle the parent links, and exceed the recursion limit for
+        # deep trees), see _flatten_section:
+        return (_load_section, (_flatten_section(self), isinstance(self, FrozenSection)))
+
     def __contains__(self, name):
         return name in self._values or name in self._subsections
 
@@ -94,6 +231,9 @@ class ConfigSection(object):
         """
         if name is None:
             name = child.name
+        if self._args_indexes:
+            self._args_indexes.pop(name, None)
+        self._invalidate_fingerprint()
         if isinstance(child, ConfigValue):
             if name in self:
                 raise KeyError('A child with this name already exists')
@@ -102,9 +242,51 @@ class ConfigSection(object):
             if name in self._values:
                 raise KeyError('A child with this name already exists')
             self._subsections[name].append(child)
+        elif isinstance(child, Columns):
+            if name in self:
+                raise KeyError('A child with this name already exists')
+            child.parent = self
+            self._subsections[name] = child
         else:
             raise TypeError('Child must be a ConfigValue or ConfigSection object')
 
+    def replace(self, child, new_child):
+        """ Replace a registered sub-section by another one with the same
+            name, keeping its place among the sub-sections.
+        """
+        siblings = self._subsections[child.name]
+        siblings[siblings.index(child)] = new_child
+        new_child.parent = self
+        if self._args_indexes:
+            self._args_indexes.pop(child.name, None)
+        self._invalidate_fingerprint()
+
+    def _invalidate_fingerprint(self):
+        """ Drop the cached fingerprint of the section and of its parents.
+        """
+        section = self
+        while section is not None and section._fingerprint is not None:
+            section._fingerprint = None
+            section = section.parent
+
+    def index_args(self, name, index=None):
+        """ Set the index of the sub-sections with the specified name by
+            arguments, or build it if index is not provided.
+
+        The index is a dict mapping the arguments key of each sub-section
+        (see :meth:`subsection_by_args`) to the sub-section. It is dropped
+        when a child with the same name is registered.
+        """
+        if index is None:
+            index = {}
+            for subsection in self.subsections(name):
+                key = _args_key(subsection.args)
+                index[key] = _DUPLICATE if key in index else subsection
+        if self._args_indexes is None:
+            self._args_indexes = {}
+        self._args_indexes[name] = index
+        return index
+
     def iterchildren(self):
         """ Iterate over all children of this section.
         """
@@ -162,6 +344,7 @@ class ConfigSection(object):
     @args.setter
     def args(self, value):
         self._args = value
+        self._invalidate_fingerprint()
 
     @property
     def args_raw(self):
@@ -171,10 +354,75 @@ class ConfigSection(object):
     def position(self):
         return self._position
 
+    @property
+    def fingerprint(self):
+        """ Hash of the content of the section (as an hexadecimal string).
+
+        The hash is computed from the name, the arguments and the children of
+        the section (but not from the positions), values are sorted by name
+        and sections are grouped by name (keeping the order of the repeated
+        sections), so the fingerprint does not depend on the order of the
+        configuration. Fingerprints are computed bottom-up once and cached on
+        each node, comparing the fingerprints of two trees then only compares
+        two strings. Registering a child, or setting the value of a child
+        (or of the arguments), drops the cached fingerprints of the section
+        and of its parents.
+        """
+        if self._fingerprint is None:
+            # Sub-sections are hashed first, walking the tree with a stack
+            # of iterators instead of recursively (which would exceed the
+            # recursion limit for deep trees). The sub-sections are kept
+            # until their parent is hashed, as snapshot sections build new
+            # objects on each access:
+            stack = [(self, iter(self.iteritems(expand_sections=True)), [], {})]
+            while stack:
+                section, children, values, sections = stack[-1]
+                for name, child in children:
+                    if isinstance(child, ConfigSection):
+                        sections.setdefault(name, []).append(child)
+                        if child._fingerprint is None:
+                            stack.append((child, iter(child.iteritems(expand_sections=True)), [], {}))
+                            break
+                    else:
+                        child._add_fingerprinted_in(section)
+                        values.append((name, child.value))
+                else:
+                    stack.pop()
+                    section._fingerprint = section._hash(values, sections)
+        return self._fingerprint
+
+    def _hash(self, values, sections):
+        """ Compute the fingerprint of the section from its values (a list of
+            couples (name, value)) and its sub-sections (grouped by name),
+            whose fingerprints are computed.
+        """
+        args = self.args_raw
+        if args is not None:
+            args._add_fingerprinted_in(self)
+        parts = [b'S']
+        _encode(self.name, parts)
+        _encode(self.args, parts)
+        parts.append(('v%d:' % len(values)).encode('ascii'))
+        for name, value in sorted(values, key=lambda x: x[0]):
+            _encode(name, parts)
+            _encode(value, parts)
+        parts.append(('g%d:' % len(sections)).encode('ascii'))
+        for name, children in sorted(sections.items()):
+            _encode(name, parts)
+            _encode([child._fingerprint for child in children], parts)
+        return hashlib.sha256(b''.join(parts)).hexdigest()
+
     def subsections(self, name):
         """ Iterate over sub-sections with the specified name.
         """
-        return iter(self._subsections[name])
+        return iter(self._subsections.get(name, ()))
+
+    def columns(self, name):
+        """ Get the :class:`Columns` storing the sub-sections with the
+            specified name, or None if they are not stored by column.
+        """
+        family = self._subsections.get(name)
+        return family if isinstance(family, Columns) else None
 
     def subsection(self, name, default=None):
         """ Get sub-section with the specified name.
@@ -192,6 +440,27 @@ class ConfigSection(object):
         else:
             return self._subsections[name][0]
 
+    def subsection_by_args(self, name, *args):
+        """ Get the sub-section with the specified name and arguments, or
+            None if there is no such sub-section.
+
+        Arguments can be given one by one or as a single list. Sub-sections
+        are indexed by arguments on the first lookup (and during validation
+        for sections with the ``unique`` meta), so lookups cost a single dict
+        access. If several sub-sections have the same arguments, a
+        MultipleSectionsWithThisNameError exception is raised.
+        """
+        if len(args) == 1 and isinstance(args[0], (list, tuple)):
+            args = args[0]
+        index = self._args_indexes.get(name) if self._args_indexes else None
+        if index is None:
+            index = self.index_args(name)
+        subsection = index.get(_args_key(args) if args else None)
+        if subsection is _DUPLICATE:
+            msg = '%s.subsection_by_args can\'t return multiple sections' % self.__class__.__name__
+            raise MultipleSectionsWithThisNameError(msg)
+        return subsection
+
     def get(self, name, default=None, raw=True):
         """ Get the value with the specified name or return default.
 
@@ -218,3 +487,860 @@ class ConfigSection(object):
         for name, value in self._values.items():
             output[name] = value.value
         return output
+
+    def freeze(self):
+        """ Get an immutable copy of the section, see :class:`FrozenSection`.
+        """
+        return FrozenSection(self)
+
+    def memory_report(self):
+        """ Compute the memory used by the section (and subsections).
+
+        Return a dict with the ``total`` size in bytes, the size by kind of
+        object in ``kinds`` (``sections``, ``values``, ``positions``,
+        ``strings``, ``lists`` and ``other`` for numbers and other values),
+        and the size of each child of this section in ``children``.
+
+        Sizes are deep sizes as returned by :func:`sys.getsizeof`, objects
+        shared by several nodes (for example interned strings or the
+        default position) are only counted once, for the first node using
+        them.
+        """
+        counter = _MemoryCounter()
+        counter.section(self, children=False)
+        children = {}
+        for name, child in self.iteritems(expand_sections=True):
+            before = counter.total
+            if isinstance(child, ConfigSection):
+                counter.section(child)
+            elif isinstance(self, FrozenSection):
+                counter.frozen(self._values[name])
+            else:
+                counter.value(child)
+            children[name] = children.get(name, 0) + counter.total - before
+        return {'total': counter.total, 'kinds': counter.kinds,
+                'children': children}
+
+
+class _MemoryCounter(object):
+
+    """ Walk a tree and count the size of its objects by kind.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.total = 0
+        self.kinds = dict.fromkeys(('sections', 'values', 'positions',
+                                    'strings', 'lists', 'other'), 0)
+
+    def add(self, obj, kind):
+        """ Count obj (and its attributes dict) if not already seen.
+        """
+        if id(obj) in self.seen:
+            return False
+        self.seen.add(id(obj))
+        size = sys.getsizeof(obj)
+        attrs = getattr(obj, '__dict__', None)
+        if attrs is not None and id(attrs) not in self.seen:
+            self.seen.add(id(attrs))
+            size += sys.getsizeof(attrs)
+        self.kinds[kind] += size
+        self.total += size
+        return True
+
+    def section(self, section, children=True):
+        # Sections are walked using a stack (in the same order as a recursive
+        # walk), deep trees would exceed the recursion limit:
+        sections = [section]
+        while sections:
+            section = sections.pop()
+            if isinstance(section, ColumnarRow):
+                self.columns(section._family)
+                continue
+            if not self.add(section, 'sections'):
+                continue
+            for container in (section._values, section._subsections):
+                if self.add(container, 'sections'):
+                    for name in container:
+                        self.add(name, 'strings')
+            for subsections in section._subsections.values():
+                if isinstance(subsections, list):
+                    self.add(subsections, 'sections')
+            self.add(section.name, 'strings')
+            if isinstance(section, FrozenSection):
+                if section._args is not None:
+                    self.frozen(section._args)
+                if self.add(section._position, 'positions'):
+                    self.add(section._position[0], 'strings')
+                if children:
+                    for entry in section._values.values():
+                        self.frozen(entry)
+                    subsections = [subsection for group in section._subsections.values()
+                                   for subsection in group]
+                    sections.extend(reversed(subsections))
+                continue
+            if section.args_raw is not None:
+                self.value(section.args_raw)
+            self.position(section.position)
+            if children:
+                subsections = []
+                for child in section.iterflatchildren():
+                    if isinstance(child, ConfigSection):
+                        subsections.append(child)
+                    else:
+                        self.value(child)
+                sections.extend(reversed(subsections))
+
+    def columns(self, family):
+        if not self.add(family, 'sections'):
+            return
+        self.add(family.name, 'strings')
+        for key, column in family._columns.items():
+            self.add(key, 'strings')
+            if isinstance(column, list):
+                self.data(column)
+            else:
+                self.add(column, 'other')
+        self.data(family._args)
+        self.add(family._files, 'positions')
+        for file_ in family._files:
+            self.add(file_, 'strings')
+        self.add(family._linenos, 'positions')
+        self.add(family._pos, 'positions')
+
+    def frozen(self, entry):
+        """ Count an entry of a frozen section: (value, file, lineno, pos).
+        """
+        if self.add(entry, 'values'):
+            self.data(entry[0])
+            self.add(entry[1], 'strings')
+            self.add(entry[2], 'positions')
+            self.add(entry[3], 'positions')
+
+    def value(self, value):
+        if not self.add(value, 'values'):
+            return
+        self.add(value.name, 'strings')
+        self.position(value.position)
+        self.data(value.value)
+
+    def position(self, position):
+        if self.add(position, 'positions'):
+            self.add(position.file, 'strings')
+            self.add(position.lineno, 'positions')
+            self.add(position.pos, 'positions')
+
+    def data(self, data):
+        if isinstance(data, (str, bytes, type(u''))):
+            self.add(data, 'strings')
+        elif isinstance(data, (list, tuple)):
+            if self.add(data, 'lists'):
+                for item in data:
+                    self.data(item)
+        elif isinstance(data, dict):
+            if self.add(data, 'other'):
+                for key, item in data.items():
+                    self.data(key)
+                    self.data(item)
+        else:
+            self.add(data, 'other')
+
+
+_NO_LINE = -1  # Line or column stored in the arrays of Columns when missing
+
+
+class Columns(object):
+
+    """ A family of repeated sections with the same keys, stored by column.
+
+    Each key is stored in a column (an :class:`array.array` for integers and
+    floats, a list for other types), as well as the arguments and the
+    positions of the sections. The family behaves as a list of sections
+    (:class:`ColumnarRow` views, built on access) and is returned as is by the
+    :meth:`ConfigSection.subsections` method of its parent, so it can be
+    used as any other list of sections. Values of a row share the position
+    of the row.
+
+    Columns are built by the schema validation for sections having the
+    ``columnar`` meta, see :class:`confiture.schema.containers.Section`.
+
+    :param name: the name of the sections
+    :param keys: the keys of the sections
+    :param typecodes: the array typecode of each key (None to use a list)
+    """
+
+    def __init__(self, name, keys, typecodes=None):
+        self.name = name
+        self.parent = None
+        self._typecodes = dict(typecodes or {})
+        self._columns = dict((k, self._new_column(k)) for k in keys)
+        self._args = []
+        self._files = []
+        self._linenos = array.array('l')
+        self._pos = array.array('l')
+
+    def __repr__(self):
+        return "<Columns '%s' (%d rows)>" % (self.name, len(self))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['parent'] = None  # Set again when registered on load
+        return state
+
+    def _new_column(self, key, values=()):
+        typecode = self._typecodes.get(key)
+        if typecode is None:
+            return list(values)
+        else:
+            return array.array(typecode, values)
+
+    def __len__(self):
+        return len(self._args)
+
+    def __iter__(self):
+        return (ColumnarRow(self, index) for index in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ColumnarRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        return ColumnarRow(self, index)
+
+    def append(self, section):
+        """ Append a row from the values of a section.
+        """
+        for key, column in self._columns.items():
+            value = section.get(key)
+            try:
+                column.append(value)
+            except (TypeError, OverflowError):
+                # The value can't be stored in the array (None for a missing
+                # optional value for example), fall back to a list:
+                self._typecodes[key] = None
+                column = self._columns[key] = list(column)
+                column.append(value)
+        self._args.append(section.args)
+        file_, lineno, pos = _position_fields(section.position)
+        self._files.append(file_)
+        self._linenos.append(_NO_LINE if lineno is None else lineno)
+        self._pos.append(_NO_LINE if pos is None else pos)
+
+    @property
+    def keys(self):
+        return list(self._columns)
+
+    @property
+    def args(self):
+        """ The arguments of each section.
+        """
+        return self._args
+
+    def column(self, key):
+        """ Get the values of a key for each section.
+
+        Integer and float columns are arrays, which can be given to numpy
+        without copy (``numpy.asarray(columns.column('port'))``).
+        """
+        return self._columns[key]
+
+    def select(self, mask):
+        """ Get a new family with the selected sections.
+
+        :param mask: a callable taking a row and returning True for rows to
+            select, or a sequence of booleans (one by row) like a numpy
+            boolean array computed from columns
+        """
+        if callable(mask):
+            indexes = [i for i, row in enumerate(self) if mask(row)]
+        else:
+            mask = list(mask)
+            if len(mask) != len(self):
+                raise ValueError('mask length does not match the number of rows')
+            indexes = [i for i, selected in enumerate(mask) if selected]
+        selected = Columns(self.name, (), self._typecodes)
+        for key, column in self._columns.items():
+            selected._columns[key] = self._new_column(key, (column[i] for i in indexes))
+        selected._args = [self._args[i] for i in indexes]
+        selected._files = [self._files[i] for i in indexes]
+        selected._linenos = array.array('l', (self._linenos[i] for i in indexes))
+        selected._pos = array.array('l', (self._pos[i] for i in indexes))
+        selected.parent = self.parent
+        return selected
+
+
+class ColumnarRow(ConfigSection):
+
+    """ A view of a section stored in a :class:`Columns` family, exposing the
+        ConfigSection API. Rows are read-only.
+    """
+
+    def __init__(self, family, index):
+        fields = (family._files[index],
+                  None if family._linenos[index] == _NO_LINE else family._linenos[index],
+                  None if family._pos[index] == _NO_LINE else family._pos[index])
+        position = _thaw_position(fields) if fields[0] is None else Position(*fields)
+        super(ColumnarRow, self).__init__(family.name, parent=family.parent,
+                                          position=position)
+        self._family = family
+        self._index = index
+
+    def __repr__(self):
+        return "<ColumnarRow '%s' #%d>" % (self.name, self._index)
+
+    def __contains__(self, name):
+        return name in self._family._columns
+
+    def _make_value(self, name):
+        value = self._family._columns[name][self._index]
+        return ConfigValue(name, value, position=self.position)
+
+    #
+    # Public API -- Tree construction methods
+    #
+
+    def register(self, child, name=None):
+        raise TypeError('columnar sections are read-only')
+
+    def iterchildren(self):
+        return (self._make_value(name) for name in self._family._columns)
+
+    def iterflatchildren(self):
+        return self.iterchildren()
+
+    def iteritems(self, expand_sections=False):
+        return ((name, self._make_value(name)) for name in self._family._columns)
+
+    #
+    # Public API -- User methods
+    #
+
+    @property
+    def args(self):
+        return self._family._args[self._index]
+
+    @args.setter
+    def args(self, value):
+        raise TypeError('columnar sections are read-only')
+
+    @property
+    def args_raw(self):
+        args = self.args
+        return None if args is None else ConfigValue('<args>', args, position=self.position)
+
+    def subsections(self, name):
+        return iter(())
+
+    def subsection(self, name, default=None):
+        return default
+
+    def get(self, name, default=None, raw=True):
+        if name not in self._family._columns:
+            return default
+        elif raw:
+            return self._family._columns[name][self._index]
+        else:
+            return self._make_value(name)
+
+    def to_dict(self):
+        index = self._index
+        return dict((k, c[index]) for k, c in self._family._columns.items())
+
+
+_DUPLICATE = object()  # Marks the arguments shared by several sections in indexes
+
+
+def _args_key(args):
+    """ Get a hashable key from section arguments.
+    """
+    if args is None:
+        return None
+    elif isinstance(args, (list, tuple)):
+        return tuple(args)
+    else:
+        return (args,)
+
+
+# Path components selecting children (used by references and queries):
+# ``name``, or ``name[args]`` for the sections with these arguments (joined
+# by commas).
+_PATH_SEGMENT = re.compile(r'^(?P<name>[^\[\]]+)(\[(?P<args>[^\]]*)\])?$')
+
+
+def _parse_path_segment(segment):
+    """ Split a path component in the name and the arguments (or None) it
+        selects, return None if the component is invalid.
+    """
+    match = _PATH_SEGMENT.match(segment)
+    if match is None:
+        return None
+    return match.group('name', 'args')
+
+
+def _format_path_args(args):
+    """ Format section arguments as written in path components.
+    """
+    if isinstance(args, (list, tuple)):
+        return ','.join(str(arg) for arg in args)
+    else:
+        return str(args)
+
+
+class OverlaySection(ConfigSection):
+
+    """ A view stacking several sections, each layer overriding the previous.
+
+    Values are looked up from the last layer to the first one. Sections are
+    merged: sections having the same name and arguments in several layers
+    are presented as a single overlay section. Lookups are cached for each
+    name, and nothing is copied from the layers.
+
+    Layers are never modified: children registered on the overlay are stored
+    in an additional private layer on top of the others. Layers modified
+    after the overlay was built are not seen by the cached lookups, call
+    :meth:`invalidate` after modifying them.
+
+    :param layers: list of ConfigSection, from the lowest to the highest
+        priority (at least one)
+    :param parent: the parent section (or None for top section)
+
+    Usage example::
+
+        >>> defaults = Confiture.from_filename('/usr/share/app/app.conf').parse()
+        >>> site = Confiture.from_filename('/etc/app.conf').parse()
+        >>> config = schema.validate(OverlaySection([defaults, site]))
+    """
+
+    def __init__(self, layers, parent=None):
+        if not layers:
+            raise ValueError('an overlay needs at least one layer')
+        top = layers[-1]
+        super(OverlaySection, self).__init__(top.name, parent=parent,
+                                             args=top.args_raw,
+                                             position=top.position)
+        self._layers = list(layers)
+        self._write_layer = None
+        self._cache = {}  # Resolved children by name
+        self._names = None  # Names of children, in order of appearance
+
+    def __repr__(self):
+        return "<OverlaySection '%s' (%d layers)>" % (self.name, len(self._layers))
+
+    def __contains__(self, name):
+        return any(name in layer for layer in self._iterlayers())
+
+    def _iterlayers(self):
+        if self._write_layer is None:
+            return iter(self._layers)
+        else:
+            return chain(self._layers, (self._write_layer,))
+
+    def _resolve(self, name):
+        """ Resolve the child with the specified name.
+
+        Return a ConfigValue, or a list of sections (empty if there is no
+        child with this name).
+        """
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        layers = list(self._iterlayers())
+        # The highest layer defining the name as a value hides the lower
+        # layers:
+        for index in range(len(layers) - 1, -1, -1):
+            value = layers[index].get(name, raw=False)
+            if value is not None:
+                break
+        else:
+            index = -1
+        if value is not None and not any(True for l in layers[index + 1:]
+                                         for _ in l.subsections(name)):
+            resolved = value
+        else:
+            groups = {}
+            ordered = []
+            for layer in layers[index + 1:]:
+                seen = {}  # Occurrences of each args in this layer
+                for section in layer.subsections(name):
+                    args = _args_key(section.args)
+                    occurrence = seen.get(args, 0)
+                    seen[args] = occurrence + 1
+                    key = (args, occurrence)
+                    if key not in groups:
+                        groups[key] = []
+                        ordered.append(key)
+                    groups[key].append(section)
+            resolved = [OverlaySection(groups[key], parent=self) for key in ordered]
+        self._cache[name] = resolved
+        return resolved
+
+    def _iternames(self):
+        if self._names is None:
+            names = []
+            seen = set()
+            for layer in self._iterlayers():
+                for name, _ in layer.iteritems():
+                    if name not in seen:
+                        seen.add(name)
+                        names.append(name)
+            self._names = names
+        return iter(self._names)
+
+    #
+    # Public API -- Tree construction methods
+    #
+
+    def register(self, child, name=None):
+        """ Register a child in the private layer of the overlay.
+
+        A registered value override the values of the same name in layers.
+        """
+        if name is None:
+            name = child.name
+        if self._write_layer is None:
+            self._write_layer = ConfigSection(self.name, args=self.args_raw,
+                                              position=self.position)
+        self._write_layer.register(child, name=name)
+        if isinstance(child, ConfigSection):
+            child.parent = self
+        if self._args_indexes:
+            self._args_indexes.pop(name, None)
+        self._invalidate_fingerprint()
+        self._cache.pop(name, None)
+        self._names = None
+
+    def invalidate(self, name=None):
+        """ Drop the cached lookups of the children with the specified name
+            (or of all the children), after a layer has been modified.
+
+        The merged sub-sections are built again on next lookup, so calling
+        it without name is needed after changes deeper in the layers.
+        """
+        if name is None:
+            self._cache.clear()
+            self._args_indexes = None
+        else:
+            self._cache.pop(name, None)
+            if self._args_indexes:
+                self._args_indexes.pop(name, None)
+        self._names = None
+        self._invalidate_fingerprint()
+
+    def iterchildren(self):
+        return (self._resolve(name) for name in self._iternames())
+
+    def iterflatchildren(self):
+        for child in self.iterchildren():
+            if isinstance(child, list):
+                for section in child:
+                    yield section
+            else:
+                yield child
+
+    def iteritems(self, expand_sections=False):
+        for name in self._iternames():
+            child = self._resolve(name)
+            if expand_sections and isinstance(child, list):
+                for section in child:
+                    yield name, section
+            else:
+                yield name, child
+
+    #
+    # Public API -- User methods
+    #
+
+    def subsections(self, name):
+        resolved = self._resolve(name)
+        if isinstance(resolved, list):
+            return iter(resolved)
+        else:
+            return iter(())
+
+    def subsection(self, name, default=None):
+        resolved = self._resolve(name)
+        if not isinstance(resolved, list) or not resolved:
+            return default
+        elif len(resolved) > 1:
+            msg = '%s.subsection can\'t return multiple sections' % self.__class__.__name__
+            raise MultipleSectionsWithThisNameError(msg)
+        else:
+            return resolved[0]
+
+    def get(self, name, default=None, raw=True):
+        resolved = self._resolve(name)
+        if not isinstance(resolved, ConfigValue):
+            return default
+        elif raw:
+            return resolved.value
+        else:
+            return resolved
+
+    def to_dict(self):
+        output = {}
+        for name, child in self.iteritems():
+            if isinstance(child, list):
+                output[name] = [section.to_dict() for section in child]
+            else:
+                output[name] = child.value
+        return output
+
+    def to_section(self):
+        """ Materialise the overlay as a standalone ConfigSection.
+        """
+        section = ConfigSection(self.name, args=self.args_raw, position=self.position)
+        for name, child in self.iteritems(expand_sections=True):
+            if isinstance(child, ConfigSection):
+                child = child.to_section()
+                child.parent = section
+            section.register(child, name=name)
+        return section
+
+
+def _freeze_value(value):
+    if isinstance(value, list):
+        return tuple(_freeze_value(x) for x in value)
+    else:
+        return value
+
+
+def _freeze_entry(value):
+    return (_freeze_value(value.value),) + _position_fields(value.position)
+
+
+def _thaw_position(fields):
+    """ Build a position from the fields (file, line, column) returned by
+        :func:`_position_fields`, or None for a missing position.
+    """
+    return None if fields[1] is None else Position(*fields)
+
+
+def _position_fields(position):
+    if position is None:
+        return (None, None, None)
+    return (position.file, position.lineno, position.pos)
+
+
+def _flatten_section(section):
+    """ Flatten a section and its sub-sections in a list, in text order.
+
+    Each section is stored as its name, position (file, line and column),
+    number of values, number of groups of sub-sections and a flag telling if
+    it has arguments, followed by the arguments (name, value and position),
+    the values (name, value and position), then the groups (name and number
+    of sub-sections, or -1 and a :class:`Columns`). The sub-sections of the
+    groups then follow the section. Equal strings are stored as the same
+    object, so they are pickled once.
+    """
+    data = []
+    strings = {}
+
+    def shared(obj):
+        return strings.setdefault(obj, obj) if type(obj) is _TEXT_TYPE else obj
+
+    stack = [section]
+    while stack:
+        section = stack.pop()
+        values = []
+        groups = []
+        for name, child in section.iteritems():
+            if isinstance(child, ConfigValue):
+                values.append((name, child))
+            else:
+                groups.append((name, child))
+        file_, lineno, pos = _position_fields(section.position)
+        args = section.args_raw
+        data += (shared(section.name), shared(file_), lineno, pos,
+                 len(values), len(groups), args is not None)
+        if args is not None:
+            file_, lineno, pos = _position_fields(args.position)
+            data += (shared(args.name), args.value, shared(file_), lineno, pos)
+        for name, value in values:
+            file_, lineno, pos = _position_fields(value.position)
+            data += (shared(name), shared(value.value), shared(file_), lineno, pos)
+        children = []
+        for name, group in groups:
+            if isinstance(group, Columns):
+                data += (shared(name), -1, group)
+            else:
+                data += (shared(name), len(group))
+                children += group
+        children.reverse()
+        stack += children
+    return data
+
+
+def _load_section(data, frozen=False):
+    """ Build a section from the list made by :func:`_flatten_section`,
+        setting the parent links.
+    """
+    root = None
+    waiting = []  # Sections waiting for sub-sections: (section, names of the
+                  # sub-sections, in reverse order)
+    index = 0
+    size = len(data)
+    while index < size:
+        name, file_, lineno, pos, values_count, groups_count, has_args = data[index:index + 7]
+        index += 7
+        position = None if lineno is None else Position(file_, lineno, pos)
+        args = None
+        if has_args:
+            args_name, args_value, file_, lineno, pos = data[index:index + 5]
+            index += 5
+            args = ConfigValue(args_name, args_value,
+                               None if lineno is None else Position(file_, lineno, pos))
+        section = ConfigSection(name, args=args, position=position)
+        # The data is built from a valid tree, children are added without
+        # the checks of the register method:
+        values = section._values
+        for _ in range(values_count):
+            value_name, value, file_, lineno, pos = data[index:index + 5]
+            index += 5
+            values[value_name] = ConfigValue(value_name, value, None if lineno is None
+                                             else Position(file_, lineno, pos))
+        names = []
+        for _ in range(groups_count):
+            group_name, count = data[index:index + 2]
+            index += 2
+            if count < 0:
+                section.register(data[index], name=group_name)
+                index += 1
+            else:
+                names += [group_name] * count
+        if waiting:
+            parent, parent_names = waiting[-1]
+            parent._subsections[parent_names.pop()].append(section)
+            section._parent = parent
+            if not parent_names:
+                waiting.pop()
+        else:
+            root = section
+        if names:
+            names.reverse()
+            waiting.append((section, names))
+    if frozen:
+        root = root.freeze()
+    return root
+
+
+class FrozenSection(ConfigSection):
+
+    """ An immutable copy of a section (and subsections).
+
+    Values and positions are stored in tuples of atomic objects (strings,
+    numbers...) instead of ConfigValue and Position objects, lists are
+    converted to tuples. Once collected, these tuples (and the dicts storing
+    them) are no longer tracked by the garbage collector, which divides the
+    number of objects visited by each collection (and the pages written in
+    forked processes). ConfigValue and Position objects are built on access.
+
+    Use the :meth:`ConfigSection.freeze` method to get a frozen section, and
+    :func:`freeze_gc` once the configuration is loaded.
+    """
+
+    def __init__(self, section, parent=None):
+        # Sub-sections are frozen using a stack instead of recursively,
+        # which would exceed the recursion limit for deep trees:
+        stack = [(self, section, parent)]
+        while stack:
+            frozen, section, parent = stack.pop()
+            super(FrozenSection, frozen).__init__(section.name, parent=parent)
+            args = section.args_raw
+            frozen._args = None if args is None else _freeze_entry(args)
+            frozen._position = _position_fields(section.position)
+            values = {}
+            subsections = {}
+            for name, child in section.iteritems(expand_sections=True):
+                if isinstance(child, ConfigSection):
+                    frozen_child = type(self).__new__(type(self))
+                    subsections.setdefault(name, []).append(frozen_child)
+                    stack.append((frozen_child, child, frozen))
+                else:
+                    values[name] = _freeze_entry(child)
+            frozen._values = values
+            frozen._subsections = dict((k, tuple(v)) for k, v in subsections.items())
+
+    def __repr__(self):
+        return "<FrozenSection '%s'>" % self.name
+
+    def _make_value(self, name, entry):
+        return ConfigValue(name, entry[0], position=_thaw_position(entry[1:]))
+
+    #
+    # Public API -- Tree construction methods
+    #
+
+    def register(self, child, name=None):
+        raise TypeError('frozen sections are read-only')
+
+    def iterchildren(self):
+        return chain((self._make_value(k, v) for k, v in self._values.items()),
+                     iter(self._subsections.values()))
+
+    def iterflatchildren(self):
+        return chain((self._make_value(k, v) for k, v in self._values.items()),
+                     *iter(self._subsections.values()))
+
+    def iteritems(self, expand_sections=False):
+        values = ((k, self._make_value(k, v)) for k, v in self._values.items())
+        if expand_sections:
+            return chain(values, ((k, v) for k, l in self._subsections.items() for v in l))
+        else:
+            return chain(values, iter(self._subsections.items()))
+
+    #
+    # Public API -- User methods
+    #
+
+    @property
+    def args(self):
+        return None if self._args is None else self._args[0]
+
+    @args.setter
+    def args(self, value):
+        raise TypeError('frozen sections are read-only')
+
+    @property
+    def args_raw(self):
+        return None if self._args is None else self._make_value('<args>', self._args)
+
+    @property
+    def position(self):
+        return _thaw_position(self._position)
+
+    def get(self, name, default=None, raw=True):
+        entry = self._values.get(name)
+        if entry is None:
+            return default
+        elif raw:
+            return entry[0]
+        else:
+            return self._make_value(name, entry)
+
+    def to_dict(self):
+        output = {}
+        for name, subsections in self._subsections.items():
+            output[name] = [subsection.to_dict() for subsection in subsections]
+        for name, entry in self._values.items():
+            output[name] = entry[0]
+        return output
+
+    def freeze(self):
+        return self
+
+
+def freeze_gc():
+    """ Collect the garbage and move all the objects tracked by the garbage
+        collector to a permanent generation ignored by next collections.
+
+    Call this function once the configuration (and the application) is
+    loaded, before forking workers: collections will no longer visit the
+    objects of the configuration, and will not write in their pages.
+    Require Python 3.7 (only the collection is done on older versions).
+    """
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
@@ -0,0 +1,163 @@
+""" Serialisation of configuration trees to the Confiture syntax.
+"""
+
+import re
+import math
+import numbers
+from decimal import Decimal
+
+from confiture.parser import ConfitureLexer
+from confiture.tree import ConfigValue
+
+
+_NAME = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_-]*$')
+_RESERVED = frozenset(ConfitureLexer.reserved)
+_CHUNK_SIZE = 1024  # Number of lines written at once
+_INDENT = '    '
+
+try:
+    _STRING_TYPES = (str, unicode)
+except NameError:
+    _STRING_TYPES = (str,)
+
+
+def _format_name(name):
+    if not isinstance(name, _STRING_TYPES) or not _NAME.match(name) or name in _RESERVED:
+        raise ValueError('%r is not a valid name' % (name,))
+    return name
+
+
+def _format_value(value):
+    if value is True:
+        return 'yes'
+    elif value is False:
+        return 'no'
+    elif isinstance(value, _STRING_TYPES):
+        if value.endswith('\\'):
+            raise ValueError('strings ending with a backslash can not be written')
+        return '"%s"' % value.replace('"', '\\"')
+    elif isinstance(value, numbers.Integral):
+        return str(int(value))
+    elif isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isinf(value) or math.isnan(value):
+            raise ValueError('%r can not be written' % value)
+        text = '{0:f}'.format(Decimal(repr(value)))
+        if '.' not in text:
+            text += '.0'
+        return text
+    elif value is None:
+        raise ValueError('None can not be written')
+    else:
+        raise TypeError('values of type %s can not be written' % type(value).__name__)
+
+
+def _format_list(values):
+    if not values:
+        raise ValueError('empty lists can not be written')
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            raise ValueError('nested lists can not be written')
+    if len(values) == 1:
+        return _format_value(values[0]) + ','
+    else:
+        return ', '.join(_format_value(value) for value in values)
+
+
+def _format_args(args):
+    if isinstance(args, (list, tuple)):
+        if not args:
+            raise ValueError('empty section arguments can not be written')
+        return ', '.join(_format_value(arg) for arg in args)
+    else:
+        return _format_value(args)
+
+
+def _children(section, canonical):
+    """ Split the children of a section into values (couples name, value)
+        and sub-sections (couples formatted name, sub-section).
+    """
+    values = []
+    groups = []
+    for name, child in section.iteritems():
+        if isinstance(child, ConfigValue):
+            values.append((name, child.value))
+        else:
+            groups.append((name, child))
+    if canonical:
+        values.sort(key=lambda x: x[0])
+        groups.sort(key=lambda x: x[0])
+    sections = [(_format_name(name), subsection)
+                for name, subsections in groups for subsection in subsections]
+    return values, sections
+
+
+def _value_lines(values, indent):
+    for name, value in values:
+        try:
+            if isinstance(value, (list, tuple)):
+                value = _format_list(value)
+            else:
+                value = _format_value(value)
+        except (ValueError, TypeError) as err:
+            raise err.__class__('key %s, %s' % (name, err))
+        yield '%s%s = %s\n' % (indent, _format_name(name), value)
+
+
+def _iter_lines(section, canonical):
+    """ Yield the lines of a section, walking the tree with a stack of
+        iterators over the sub-sections (the recursion limit would be
+        exceeded by deep trees).
+    """
+    values, sections = _children(section, canonical)
+    for line in _value_lines(values, ''):
+        yield line
+    stack = [('', iter(sections))]
+    while stack:
+        indent, sections = stack[-1]
+        for name, subsection in sections:
+            if subsection.args is None:
+                header = name
+            else:
+                header = '%s %s' % (name, _format_args(subsection.args))
+            yield '%s%s {\n' % (indent, header)
+            values, children = _children(subsection, canonical)
+            for line in _value_lines(values, indent + _INDENT):
+                yield line
+            stack.append((indent + _INDENT, iter(children)))
+            break
+        else:
+            stack.pop()
+            if stack:
+                yield '%s}\n' % stack[-1][0]
+
+
+def dump(section, fileobj, canonical=False):
+    """ Write a configuration tree to a file object, in a single pass.
+
+    Values can be strings, booleans, integers, floats and lists of them.
+    Reading the written configuration give the same tree, with the exception
+    of positions (and of values which can't be written, for which a
+    ValueError or a TypeError is raised: None, empty or nested lists,
+    infinite numbers and strings ending with a backslash).
+
+    :param section: the ConfigSection to write
+    :param fileobj: the file object where to write the configuration
+    :param canonical: sort the values and sections by name (repeated
+        sections are kept in their order), so the same configuration always
+        give the same output
+    """
+    chunk = []
+    for line in _iter_lines(section, canonical):
+        chunk.append(line)
+        if len(chunk) >= _CHUNK_SIZE:
+            fileobj.write(''.join(chunk))
+            chunk = []
+    if chunk:
+        fileobj.write(''.join(chunk))
+
+
+def dumps(section, canonical=False):
+    """ Like :func:`dump`, but return the configuration as a string.
+    """
+    return ''.join(_iter_lines(section, canonical))
@@ -23,7 +23,7 @@ setup(name='confiture',
       author_email='antoine@inaps.org',
       url='https://idevelop.org/p/confiture/',
       license='MIT',
-      packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
+      packages=find_packages(exclude=['ez_setup', 'examples', 'tests', 'benchmarks']),
       include_package_data=True,
       zip_safe=True,
       install_requires=['ply'])